@@ -0,0 +1,1109 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+import contextlib
+import subprocess
+import shutil
+from pathlib import Path
+
+import post_processor
+
+def legacy_mmd_to_latex_fallback(mmd_content, title="Export", language="spanish"):
+    # Implementacion original de post_processor.mmd_to_latex_fallback, conservada como
+    # referencia: la version actual debe producir exactamente la misma salida.
+    preamble = [
+        "\\documentclass[11pt,a4paper]{article}",
+        "\\usepackage[utf8]{inputenc}",
+        "\\usepackage[T1]{fontenc}",
+        f"\\usepackage[{language}]{{babel}}",
+        "\\usepackage{amsmath,amssymb,amsfonts}",
+        "\\usepackage{graphicx}",
+        "\\usepackage{geometry}",
+        "\\geometry{margin=1in}",
+        "\\title{" + title + "}",
+        "\\author{Pipeline Nougat OCR}",
+        "\\date{\\today}",
+        "\\begin{document}",
+        "\\maketitle",
+        "\\tableofcontents",
+        "\\newpage"
+    ]
+
+    protected_math = []
+    def save_math(m):
+        protected_math.append(m.group(0))
+        return f"MATHPROTECT{len(protected_math)-1}Z"
+
+    body = mmd_content
+    body = re.sub(r'\[MISSING_PAGE_EMPTY:\d+\]', '', body)
+    body = re.sub(r'\[MISSING_PAGE_FAIL:\d+\]', r'\\begin{center}\\textbf{[ERROR: Pagina no procesada en el original]}\\end{center}', body)
+
+    body = re.sub(
+        r'\\\(.*?\\\)|\\\[.*?\\\]|\\cite\{.*?\}|\\ref\{.*?\}|\\label\{.*?\}|\\begin\{.*?\}|\\end\{.*?\}',
+        save_math,
+        body,
+        flags=re.DOTALL
+    )
+
+    raw_cmds_map = {
+        r'\\section\*?\{([^{}]*)\}': r'LSECS\1LEND',
+        r'\\subsection\*?\{([^{}]*)\}': r'LSUBS\1LEND',
+        r'\\subsubsection\*?\{([^{}]*)\}': r'LSUBSUBS\1LEND',
+        r'\\paragraph\*?\{([^{}]*)\}': r'LPARAGS\1LEND',
+        r'\\subparagraph\*?\{([^{}]*)\}': r'LSTARTPAGS\1LEND',
+        r'\\textbf\{([^{}]*)\}': r'LBOLDS\1LEND',
+        r'\\textit\{([^{}]*)\}': r'LITALS\1LEND',
+        r'\\underline\{([^{}]*)\}': r'LBOLDS\1LEND'
+    }
+    for _ in range(5):
+        any_change = False
+        for cmd_rec, marker_sub in raw_cmds_map.items():
+            new_body, count = re.subn(cmd_rec, marker_sub, body, flags=re.DOTALL)
+            if count > 0:
+                body = new_body
+                any_change = True
+        if not any_change: break
+
+    body = re.sub(r'^###### (.*)', r'LSTARTPAGS\1LEND', body, flags=re.MULTILINE)
+    body = re.sub(r'^##### (.*)', r'LSTARTPAGS\1LEND', body, flags=re.MULTILINE)
+    body = re.sub(r'^#### (.*)', r'LPARAGS\1LEND', body, flags=re.MULTILINE)
+    body = re.sub(r'^### (.*)', r'LSUBSUBS\1LEND', body, flags=re.MULTILINE)
+    body = re.sub(r'^## (.*)', r'LSUBS\1LEND', body, flags=re.MULTILINE)
+    body = re.sub(r'^# (.*)', r'LSECS\1LEND', body, flags=re.MULTILINE)
+
+    body = re.sub(r'\*\*(.*?)\*\*', r'LBOLDS\1LEND', body)
+    body = re.sub(r'\*(.*?)\*', r'LITALS\1LEND', body)
+    body = re.sub(r'_(.*?)_', r'LITALS\1LEND', body)
+
+    special_chars = {
+        '&': r'\&', '%': r'\%', '$': r'\$', '_': r'\_',
+        '{': r'\{', '}': r'\}', '#': r'\#', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}'
+    }
+
+    for char, replacement in special_chars.items():
+        body = body.replace(char, replacement)
+
+    body = body.replace("LSECS", r"\section{")
+    body = body.replace("LSUBSUBS", r"\subsubsection{")
+    body = body.replace("LSUBS", r"\subsection{")
+    body = body.replace("LPARAGS", r"\paragraph{")
+    body = body.replace("LSTARTPAGS", r"\subparagraph{")
+    body = body.replace("LBOLDS", r"\textbf{")
+    body = body.replace("LITALS", r"\textit{")
+    body = body.replace("LEND", "}")
+
+    lines = body.split('\n')
+    new_lines = []
+    in_list = False
+    for line in lines:
+        if line.strip().startswith('\\* '):
+            if not in_list:
+                new_lines.append('\\begin{itemize}')
+                in_list = True
+            new_lines.append('  \\item ' + line.strip()[3:])
+        else:
+            if in_list:
+                new_lines.append('\\end{itemize}')
+                in_list = False
+            new_lines.append(line)
+    if in_list: new_lines.append('\\end{itemize}')
+    body = '\n'.join(new_lines)
+
+    def restore_math(m):
+        idx = int(m.group(1))
+        return protected_math[idx] if idx < len(protected_math) else m.group(0)
+
+    body = re.sub(r'MATHPROTECT(\d+)Z', restore_math, body)
+
+    full_doc = '\n'.join(preamble) + '\n' + body + '\n\\end{document}'
+    return full_doc
+
+def legacy_extract_structured_data(content):
+    # Implementacion original de nougat_local.extract_structured_data (tres pasadas y un
+    # re.match por linea), sin la lectura del archivo ni "metadata": el escaner de una sola
+    # pasada y los escritores JSON deben producir exactamente estas estructuras.
+    equations = re.findall(r"\\\(.*?\\\)|\\\[.*?\\\]", content, re.DOTALL)
+    captions = re.findall(r"\[caption\].*?\n", content)
+
+    sections = []
+    current_hierarchy = ["Preliminares", "", "", ""]
+    current_level = 1
+    current_lines = []
+
+    def close_section():
+        section_text = "\n".join(current_lines).strip()
+        if section_text:
+            hierarchy_path = [h for h in current_hierarchy if h]
+            sections.append({
+                "title": current_hierarchy[current_level - 1],
+                "hierarchy": hierarchy_path,
+                "full_title": " > ".join(hierarchy_path),
+                "level": current_level,
+                "content": section_text,
+                "metrics": {
+                    "characters": len(section_text),
+                    "estimated_tokens": int(len(section_text.split()) * 1.3)
+                }
+            })
+
+    for line in content.replace("\r\n", "\n").split("\n"):
+        header_match = re.match(r'^(#{1,4})\s+(.*)$', line)
+        if header_match:
+            if current_lines:
+                close_section()
+            level = len(header_match.group(1))
+            current_level = level
+            current_hierarchy[level - 1] = header_match.group(2).strip()
+            for i in range(level, 4):
+                current_hierarchy[i] = ""
+            current_lines = []
+        else:
+            current_lines.append(line)
+    if current_lines:
+        close_section()
+    return {"equations": equations, "captions": captions, "sections": sections}
+
+_WORDS = ("el", "la", "de", "que", "función", "teorema", "sea", "entonces", "conjunto", "espacio",
+          "métrica", "límite", "serie", "convergencia", "demostración", "para", "todo", "existe")
+
+def make_synthetic_mmd(size_bytes, seed=0, equations=1, header_depth=4, missing_pages=None):
+    # Documento con la forma de una salida de Nougat: encabezados, prosa con enfasis y
+    # caracteres especiales, ecuaciones en linea y en bloque, listas, tablas y paginas perdidas.
+    # `equations`: ecuaciones en linea por parrafo; `header_depth`: nivel maximo de encabezado;
+    # `missing_pages`: cantidad exacta de marcadores [MISSING_PAGE_EMPTY:N] repartidos en el
+    # documento (None = al azar, alrededor del 5% de las paginas, mezclando EMPTY y FAIL).
+    rnd = random.Random(seed)
+    parts = []
+    total = 0
+    page = 0
+    while total < size_bytes:
+        page += 1
+        chunk = [f"{'#' * rnd.randint(1, header_depth)} {rnd.randint(1, 9)}.{page} {rnd.choice(_WORDS).capitalize()} {rnd.choice(_WORDS)}\n"]
+        for _ in range(rnd.randint(2, 5)):
+            words = [rnd.choice(_WORDS) for _ in range(rnd.randint(30, 90))]
+            for _ in range(equations):
+                words[rnd.randrange(len(words))] = f"\\(x_{{{page}}}^2 + \\alpha\\)"
+            words[rnd.randrange(len(words))] = f"**{rnd.choice(_WORDS)}**"
+            words[rnd.randrange(len(words))] = f"_{rnd.choice(_WORDS)}_"
+            if rnd.random() < 0.3:
+                words[rnd.randrange(len(words))] = f"50% & $100 ~{page} ^{page} #{page} \\cite{{ref{page}}}"
+            chunk.append(" ".join(words) + ".\n")
+        chunk.append(f"\\[\\int_0^{{{page}}} f(x)\\,dx = \\sum_{{n=1}}^\\infty \\frac{{1}}{{n^2}}\\]\n")
+        if rnd.random() < 0.2:
+            chunk.append("".join(f"\\* {rnd.choice(_WORDS)} {rnd.choice(_WORDS)}\n" for _ in range(rnd.randint(2, 5))))
+        if rnd.random() < 0.1:
+            chunk.append("\\begin{tabular}{|c|c|}\n\\hline a & b \\\\\n\\hline\n\\end{tabular}\n")
+        if rnd.random() < 0.05:
+            chunk.append(f"\\section*{{Anexo \\textbf{{{page}}}}}\n")
+        if rnd.random() < 0.05 and missing_pages is None:
+            chunk.append(f"[MISSING_PAGE_{rnd.choice(('EMPTY', 'FAIL'))}:{page}]\n")
+        text = "\n".join(chunk) + "\n"
+        parts.append(text)
+        total += len(text.encode("utf-8"))
+    if missing_pages:
+        # Paginas perdidas repartidas de forma uniforme, numeradas como las de Nougat (desde 1)
+        for k in range(missing_pages):
+            page = (k + 1) * len(parts) // (missing_pages + 1) + 1
+            parts[page - 1] = f"\n\n[MISSING_PAGE_EMPTY:{page}]\n\n"
+    return "".join(parts)
+
+def make_synthetic_pdf(path, n_pages, seed=0):
+    # PDF pequeño con una pagina de prosa por pagina del .mmd, para la auditoria y el OCR
+    from fpdf import FPDF
+    rnd = random.Random(seed)
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=11)
+    for page in range(1, n_pages + 1):
+        pdf.add_page()
+        pdf.cell(0, 10, f"Capitulo {page}", new_x="LMARGIN", new_y="NEXT")
+        for _ in range(4):
+            pdf.multi_cell(0, 6, " ".join(rnd.choice(_WORDS) for _ in range(80)).capitalize() + ".")
+            pdf.ln(3)
+    pdf.output(str(path))
+    return path
+
+def make_large_format_pdf(path, a4_pages=4, seed=0):
+    # PDFs de texto A4 seguidos de una lamina A1 escaneada (imagen a 150 ppp), como un plano
+    # o un poster dentro de un documento
+    from fpdf import FPDF
+    from PIL import Image, ImageDraw
+    rnd = random.Random(seed)
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=11)
+    for page in range(1, a4_pages + 1):
+        pdf.add_page()
+        pdf.cell(0, 10, f"Capitulo {page}", new_x="LMARGIN", new_y="NEXT")
+        for _ in range(4):
+            pdf.multi_cell(0, 6, " ".join(rnd.choice(_WORDS) for _ in range(80)).capitalize() + ".")
+            pdf.ln(3)
+    scan = Image.new("L", (3508, 4967), 235)
+    draw = ImageDraw.Draw(scan)
+    for y in range(200, 4800, 40):
+        draw.text((200, y), " ".join(rnd.choice(_WORDS) for _ in range(25)), fill=30)
+    encoded = io.BytesIO()
+    scan.save(encoded, format="JPEG", quality=85)
+    pdf.add_page(format=(594, 841))  # A1 en mm
+    pdf.image(encoded, x=0, y=0, w=pdf.w, h=pdf.h)
+    pdf.output(str(path))
+    return path
+
+def make_unclosed_mmd(size_bytes, openers=3000, seed=0):
+    # Salida truncada: delimitadores abiertos sin cierre al final del documento. La version
+    # original reescaneaba hasta el final por cada uno (tiempo cuadratico).
+    tail = "".join(f"texto truncado \\({i} y \\cite{{x " for i in range(openers))
+    return make_synthetic_mmd(size_bytes, seed=seed) + tail
+
+def _timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+def bench_latex(args):
+    print(f"{'entrada':<22} {'original':>10} {'actual':>10} {'aceleración':>12}  salida")
+    ok = True
+    cases = [(f"sintético {mb} MB", lambda mb=mb: make_synthetic_mmd(int(mb * 1024 * 1024), seed=args.seed)) for mb in args.sizes]
+    cases.append((f"sin cerrar {args.sizes[0]} MB", lambda: make_unclosed_mmd(int(args.sizes[0] * 1024 * 1024), seed=args.seed)))
+    if args.corpus:
+        cases += [(path.name, lambda path=path: path.read_text(encoding="utf-8")) for path in sorted(Path(args.corpus).glob("*.mmd"))]
+
+    for label, load in cases:
+        content = load()
+        new, new_s = _timed(post_processor.mmd_to_latex_fallback, content)
+        if args.no_legacy:
+            print(f"{label:<22} {'-':>10} {new_s:>9.2f}s {'-':>12}")
+            continue
+        old, old_s = _timed(legacy_mmd_to_latex_fallback, content)
+        same = old == new
+        ok = ok and same
+        speedup = old_s / new_s if new_s > 0 else float("inf")
+        print(f"{label:<22} {old_s:>9.2f}s {new_s:>9.2f}s {speedup:>11.1f}x  {'idéntica' if same else 'DIFERENTE'}")
+    return 0 if ok else 1
+
+# Piezas con las que se arman los documentos al azar: delimitadores sueltos o anidados,
+# encabezados validos y no validos, leyendas sin salto final y los tres tipos de salto de linea
+_STRUCTURE_PIECES = ("\\(", "\\)", "\\[", "\\]", "[caption]", "[caption", "\n", "\n", "\n", "\r\n", "\r",
+                     "# ", "## ", "### ", "#### ", "##### ", "#", "##", " ", "\t", "\x0c", "palabra", "x y",
+                     "é", "\\", "(", "[", "]", ")", "\n\n")
+
+def _structured_outputs(nougat_local, mmd_path):
+    # Lo que produce cada escritor para `mmd_path`, leido de vuelta sin "processed_at"
+    outputs = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for label, mode, compact in (("json", "json", False), ("json compacto", "json", True),
+                                     ("stream", "stream", False), ("stream compacto", "stream", True)):
+            json_path = nougat_local.save_structured_json(mmd_path, mode=mode, compact=compact)
+            data = json.loads(json_path.read_text(encoding="utf-8")) if json_path else None
+            if data is not None:
+                data["metadata"].pop("processed_at")
+            outputs[label] = data
+        jsonl_path = nougat_local.save_structured_json(mmd_path, mode="jsonl")
+        outputs["jsonl"] = ([json.loads(line) for line in jsonl_path.read_text(encoding="utf-8").splitlines()]
+                            if jsonl_path else None)
+    return outputs
+
+def _structure_mismatch(nougat_local, mmd_path):
+    # Primer escritor cuya salida difiere de la implementacion original (None = todas iguales)
+    with open(mmd_path, "r", encoding="utf-8") as f:
+        expected = legacy_extract_structured_data(f.read())
+    expected["metadata"] = {"source": mmd_path.name, "equation_count": len(expected["equations"]),
+                            "section_count": len(expected["sections"])}
+    records = [dict({"source": mmd_path.name, "section_index": i}, **section)
+               for i, section in enumerate(expected["sections"])]
+    for label, data in _structured_outputs(nougat_local, mmd_path).items():
+        if data != (records if label == "jsonl" else expected):
+            return label
+    return None
+
+def bench_structure(args):
+    # Importacion diferida: nougat_local arrastra el motor y el resto del pipeline
+    import nougat_local
+    rnd = random.Random(args.seed)
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        mmd_path = Path(tmp) / "doc.mmd"
+        for i in range(args.docs):
+            text = "".join(rnd.choice(_STRUCTURE_PIECES) for _ in range(rnd.randint(0, 60)))
+            mmd_path.write_text(text, encoding="utf-8", newline="")
+            mismatch = _structure_mismatch(nougat_local, mmd_path)
+            if mismatch:
+                print(f"Documento {i}: la salida '{mismatch}' difiere de la original: {text!r}")
+                ok = False
+                break
+        else:
+            print(f"{args.docs} documentos al azar: escáner y escritores idénticos a la implementación original.")
+
+        print(f"{'entrada':<22} {'original':>10} {'actual':>10} {'aceleración':>12}  salida")
+        for mb in args.sizes:
+            label = f"sintético {mb:g} MB"
+            content = make_synthetic_mmd(int(mb * 1024 * 1024), seed=args.seed)
+            content += "".join(f"[caption] Figura {n}\n" for n in range(200))
+            mmd_path.write_text(content, encoding="utf-8")
+            old, old_s = _best_of(args.repeat, legacy_extract_structured_data, content)
+            new, new_s = _best_of(args.repeat, nougat_local.extract_structured_data, mmd_path, content)
+            new = {key: new[key] for key in ("equations", "captions", "sections")}
+            same = old == new and not _structure_mismatch(nougat_local, mmd_path)
+            ok = ok and same
+            speedup = old_s / new_s if new_s > 0 else float("inf")
+            print(f"{label:<22} {old_s:>9.2f}s {new_s:>9.2f}s {speedup:>11.1f}x  {'idéntica' if same else 'DIFERENTE'}")
+    return 0 if ok else 1
+
+def _best_of(repeat, func, *args):
+    # Menor tiempo de `repeat` ejecuciones: es el menos afectado por el ruido de la maquina
+    best = None
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result, seconds = _timed(func, *args)
+        best = seconds if best is None else min(best, seconds)
+    return result, best
+
+def _missing_dependency(*modules):
+    for module in modules:
+        try:
+            __import__(module)
+        except ImportError:
+            return module
+    return None
+
+def postproc_cases(args, workdir):
+    # (nombre, funcion sin argumentos | motivo para omitir)
+    content = make_synthetic_mmd(int(args.size * 1024 * 1024), seed=args.seed, equations=args.equations,
+                                 header_depth=args.header_depth, missing_pages=args.missing_pages)
+    mmd_path = workdir / "sintetico.mmd"
+    mmd_path.write_text(content, encoding="utf-8")
+    cases = [("mmd_to_latex_fallback", lambda: post_processor.mmd_to_latex_fallback(content))]
+
+    missing = _missing_dependency("pypandoc")
+    converter = None
+    if missing is None:
+        import pypandoc
+        try:
+            # Sin red: no se descarga pandoc si no esta instalado
+            pypandoc.get_pandoc_path()
+            converter = post_processor.PandocConverter(log=lambda msg: None).start()
+        except OSError:
+            missing = "pandoc"
+    if converter is not None:
+        def pandoc():
+            before = converter.fallback_docs
+            latex = post_processor.mmd_to_latex(content, converter=converter)
+            if converter.fallback_docs > before:
+                raise RuntimeError("pandoc falló y se usó el conversor de respaldo")
+            return latex
+        cases.append(("mmd_to_latex", pandoc))
+    else:
+        cases.append(("mmd_to_latex", f"falta {missing}"))
+
+    def structured():
+        # Importacion diferida: nougat_local arrastra el motor y el resto del pipeline
+        import nougat_local
+        return nougat_local.extract_structured_data(mmd_path)
+    cases.append(("extract_structured_data", structured))
+
+    # Documento corto cuyas paginas perdidas existen en el PDF generado
+    small = make_synthetic_mmd(64 * 1024, seed=args.seed, missing_pages=args.missing_pages)
+    missing = _missing_dependency("pypdfium2", "fpdf")
+    if missing is None:
+        n_pages = max((int(n) for _, n in post_processor.MISSING_PAGE_PATTERN.findall(small)), default=1)
+        pdf_path = make_synthetic_pdf(workdir / "sintetico.pdf", n_pages, seed=args.seed)
+        cases.append(("generate_blank_page_report",
+                      lambda: post_processor.generate_blank_page_report(pdf_path, small, workdir / "auditoria.pdf")))
+        ocr_missing = _missing_dependency("pytesseract")
+        if ocr_missing is None:
+            import pytesseract
+            try:
+                pytesseract.get_tesseract_version()
+            except Exception:
+                ocr_missing = "tesseract"
+        if ocr_missing is None:
+            cases.append(("recover_missing_pages", lambda: post_processor.recover_missing_pages(pdf_path, small, workers=args.ocr_workers)))
+        else:
+            cases.append(("recover_missing_pages", f"falta {ocr_missing}"))
+    else:
+        cases.append(("generate_blank_page_report", f"falta {missing}"))
+        cases.append(("recover_missing_pages", f"falta {missing}"))
+    return cases, converter
+
+def bench_postproc(args):
+    baseline_path = Path(args.baseline)
+    try:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        baseline = {}
+    # La linea base solo es comparable con el mismo corpus
+    corpus = {"size_mb": args.size, "seed": args.seed, "equations": args.equations,
+              "header_depth": args.header_depth, "missing_pages": args.missing_pages}
+    if baseline and baseline.get("corpus") != corpus:
+        print(f"Aviso: la línea base de {baseline_path} se midió con otro corpus ({baseline.get('corpus')}); no se compara.")
+        baseline = {}
+    reference = baseline.get("results", {})
+
+    results = {}
+    regressions = []
+    print(f"{'caso':<28} {'tiempo':>10} {'línea base':>11} {'variación':>10}  estado")
+    with tempfile.TemporaryDirectory() as tmp:
+        cases, converter = postproc_cases(args, Path(tmp))
+        try:
+            for name, func in cases:
+                if isinstance(func, str):
+                    print(f"{name:<28} {'-':>10} {'-':>11} {'-':>10}  omitido ({func})")
+                    continue
+                try:
+                    _, seconds = _best_of(args.repeat, func)
+                except Exception as e:
+                    print(f"{name:<28} {'-':>10} {'-':>11} {'-':>10}  ERROR ({e})")
+                    regressions.append(name)
+                    continue
+                results[name] = seconds
+                base = reference.get(name)
+                if base is None:
+                    print(f"{name:<28} {seconds:>9.3f}s {'-':>11} {'-':>10}  nuevo")
+                    continue
+                change = seconds / base - 1 if base > 0 else 0.0
+                status = "ok"
+                if change > args.tolerance:
+                    status = "REGRESIÓN"
+                    regressions.append(name)
+                elif change < -args.tolerance:
+                    status = "mejora"
+                print(f"{name:<28} {seconds:>9.3f}s {base:>10.3f}s {change:>+9.0%}  {status}")
+        finally:
+            if converter is not None:
+                converter.close()
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps({"corpus": corpus, "results": results}, indent=2), encoding="utf-8")
+        print(f"Línea base guardada en {baseline_path}.")
+    if regressions:
+        print(f"Regresiones (más de {args.tolerance:.0%} sobre la línea base) o errores: {', '.join(regressions)}")
+        return 1
+    return 0
+
+def _registry_ops(n, seed):
+    # Marcas al azar sobre un conjunto de hashes que se repiten: exitos, fallos y reintentos
+    rnd = random.Random(seed)
+    hashes = [f"{rnd.getrandbits(256):064x}" for _ in range(max(1, n // 3))]
+    return [(rnd.choice(("processed", "failed")), rnd.choice(hashes), f"doc{i}.pdf") for i in range(n)]
+
+def _mark(state, status, file_hash, filename):
+    if status == "processed":
+        state.mark_success(file_hash, filename, f"output/{filename[:-4]}.mmd")
+    else:
+        state.mark_failed(file_hash, filename, "error simulado")
+
+def _without_timestamps(state):
+    return {status: {h: {k: v for k, v in entry.items() if k != "timestamp"} for h, entry in entries.items()}
+            for status, entries in state.items()}
+
+def _legacy_registry(ops):
+    # Lo que guardaba el registry.json original despues de las mismas marcas (sin fechas)
+    state = {"processed": {}, "failed": {}}
+    for status, file_hash, filename in ops:
+        entry = {"filename": filename}
+        if status == "processed":
+            entry["output"] = f"output/{filename[:-4]}.mmd"
+        else:
+            entry["error"] = "error simulado"
+        state[status][file_hash] = entry
+    return state
+
+def _registry_checks(nl, tmp, ops):
+    # (comprobacion, correcta) al reproducir el log en cada situacion que el registro debe soportar
+    path = tmp / "registry.jsonl"
+    live = nl.PipelineState(path)
+    for op in ops:
+        _mark(live, *op)
+    expected = _legacy_registry(ops)
+    checks = [("marcas = registry.json original", _without_timestamps(live.state) == expected)]
+
+    replayed = nl.PipelineState(path, compact_min_lines=len(ops) + 1)
+    checks.append(("reproducción del log", replayed.state == live.state))
+    checks.append(("is_processed", all(replayed.is_processed(h) == (h in expected["processed"]) for _, h, _ in ops)))
+
+    # Corte a mitad de la ultima linea: se pierde solo esa marca y la siguiente empieza en su propia linea
+    data = path.read_bytes()
+    last = data.rstrip(b"\n").rfind(b"\n") + 1
+    path.write_bytes(data[:last + (len(data) - last) // 2])
+    with contextlib.redirect_stdout(io.StringIO()):
+        truncated = nl.PipelineState(path, compact_min_lines=len(ops) + 1)
+        checks.append(("línea truncada ignorada", _without_timestamps(truncated.state) == _legacy_registry(ops[:-1])))
+        _mark(truncated, *ops[-1])
+        resumed = nl.PipelineState(path, compact_min_lines=len(ops) + 1)
+    checks.append(("marca tras un corte", resumed.state == truncated.state))
+
+    resumed.compact()
+    lines = len(path.read_text(encoding="utf-8").splitlines())
+    checks.append(("compactación", nl.PipelineState(path).state == truncated.state and lines == resumed._entries()))
+
+    legacy_path = tmp / "registry.json"
+    legacy_path.write_text(json.dumps(live.state, indent=2), encoding="utf-8")
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrated = nl.PipelineState(tmp / "migrado.jsonl", legacy_path)
+    checks.append(("migración de registry.json", migrated.state == live.state
+                   and (tmp / "registry.json.migrated").exists() and not legacy_path.exists()
+                   and nl.PipelineState(tmp / "migrado.jsonl").state == live.state))
+    return checks
+
+def _legacy_save(path, state):
+    # Guardado original: el registro completo con indent=2 en cada documento
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+def bench_registry(args):
+    # Importacion diferida: nougat_local arrastra el motor y el resto del pipeline
+    import nougat_local
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # Las advertencias del registro van al log temporal, no al checkpoint/ del directorio actual
+        nougat_local.LOG_PATH = tmp / "pipeline.log"
+        for label, passed in _registry_checks(nougat_local, tmp, _registry_ops(args.ops, args.seed)):
+            ok = ok and passed
+            print(f"{label:<32} {'ok' if passed else 'FALLA'}")
+
+        print(f"{'entradas':>9} {'original':>12} {'actual':>12}  (por documento)")
+        for n in args.entries:
+            state = {"processed": {f"{i:064x}": {"filename": f"doc{i}.pdf", "output": f"output/doc{i}.mmd",
+                                                 "timestamp": "2024-01-01 00:00:00"} for i in range(n)},
+                     "failed": {}}
+            ops = [("processed", f"{n + i:064x}", f"nuevo{i}.pdf") for i in range(args.saves)]
+            old_s = min(_timed(_legacy_save, tmp / "registry.json", state)[1] for _ in range(args.saves))
+            path = tmp / f"registro-{n}.jsonl"
+            registry = nougat_local.PipelineState(path)
+            registry.state = state
+            registry.compact()
+            new_s = min(_timed(_mark, registry, *op)[1] for op in ops)
+            print(f"{n:>9} {old_s * 1000:>10.2f}ms {new_s * 1000:>10.2f}ms")
+    return 0 if ok else 1
+
+def legacy_read_mmd(mmd_path):
+    # Lectura original del .mmd: el archivo completo de una vez
+    with open(mmd_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def legacy_save_structured_json(mmd_path):
+    # Etapa JSON original: relee el archivo, extrae con tres pasadas y vuelca el documento entero
+    structured_data = legacy_extract_structured_data(legacy_read_mmd(mmd_path))
+    structured_data["metadata"] = {"source": mmd_path.name, "equation_count": len(structured_data["equations"]),
+                                   "section_count": len(structured_data["sections"])}
+    with open(mmd_path.with_suffix(".json"), "w", encoding="utf-8") as f:
+        json.dump(structured_data, f, indent=2, ensure_ascii=False)
+
+def legacy_pandoc_input(mmd_content):
+    # Preparacion original del texto para pandoc: cuatro pasadas, cada una con su copia
+    body = re.sub(r'\[MISSING_PAGE_EMPTY:\d+\]', '', mmd_content)
+    body = re.sub(r'\[MISSING_PAGE_FAIL:\d+\]', '\n\n**[ERROR: Página no procesada en el original]**\n\n', body)
+    body = body.replace(r'\(', '$').replace(r'\)', '$')
+    return body.replace(r'\[', '$$').replace(r'\]', '$$')
+
+def _peak_bytes(func, *args):
+    # Pico de memoria asignada por Python durante la llamada (no incluye lo que ya existia)
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def bench_memory(args):
+    # Memoria de las etapas de post-procesamiento de un documento, en el orden del pipeline:
+    # el .mmd se carga una vez y las etapas siguientes reciben ese mismo texto. La columna
+    # "original" repite cada etapa con el codigo anterior (lectura completa, JSON que relee el archivo).
+    import nougat_local
+    content = make_synthetic_mmd(int(args.size * 1024 * 1024), seed=args.seed, equations=args.equations,
+                                 missing_pages=args.missing_pages)
+    if args.no_headers:
+        # Sin encabezados todo el documento es una sola seccion
+        content = re.sub(r"(?m)^#+ ", "", content)
+    with tempfile.TemporaryDirectory() as tmp:
+        mmd_path = Path(tmp) / "sintetico.mmd"
+        mmd_path.write_text(content, encoding="utf-8")
+        size = mmd_path.stat().st_size
+        del content
+        print(f"Documento de {size / 1024 ** 2:.1f} MB{' sin encabezados' if args.no_headers else ''}.")
+        # (etapa, pico original o None, pico actual)
+        legacy_content, legacy_peak = _peak_bytes(legacy_read_mmd, mmd_path)
+        content, peak = _peak_bytes(nougat_local._read_mmd, mmd_path)
+        steps = [("lectura del .mmd", legacy_peak, peak)]
+        _, legacy_peak = _peak_bytes(legacy_save_structured_json, mmd_path)
+        for mode in ("json", "stream", "jsonl"):
+            _, peak = _peak_bytes(lambda: nougat_local.save_structured_json(mmd_path, mode, content=content))
+            steps.append((f"json ({mode})", legacy_peak if mode == "json" else None, peak))
+        legacy_peak = _peak_bytes(legacy_pandoc_input, legacy_content)[1]
+        steps.append(("entrada de pandoc", legacy_peak, _peak_bytes(post_processor._pandoc_input, content)[1]))
+        legacy_peak = _peak_bytes(legacy_mmd_to_latex_fallback, legacy_content)[1]
+        steps.append(("latex de respaldo", legacy_peak, _peak_bytes(post_processor.mmd_to_latex_fallback, content)[1]))
+        del legacy_content
+
+        def cell(peak):
+            return f"{peak / 1024 ** 2:>7.1f} MB {peak / size:>5.1f}x" if peak is not None else f"{'-':>16}"
+
+        print(f"{'etapa':<24} {'original':>16} {'actual':>16}")
+        for name, legacy_peak, peak in steps:
+            print(f"{name:<24} {cell(legacy_peak)} {cell(peak)}")
+        # El texto compartido sigue en memoria durante todas las etapas
+        for label, column in (("original", 1), ("actual", 2)):
+            worst = max(step[column] for step in steps[1:] if step[column] is not None)
+            total = len(content) + worst
+            print(f"Pico por documento ({label}): texto + etapa más costosa = {total / 1024 ** 2:.1f} MB "
+                  f"({total / size:.1f}x el archivo).")
+    return 0
+
+REPO_DIR = Path(__file__).resolve().parent
+
+# Registra como ya procesados los PDFs de input/ (y guarda sus hashes), como tras una ejecucion anterior
+_SEED_STARTUP = """
+import nougat_local as nl
+nl.ensure_structure()
+state = nl.PipelineState(nl.REGISTRY_PATH)
+paths = sorted(nl.STRUCTURE["input"].glob("*.pdf"))
+hashes = nl.HashCache(nl.HASH_CACHE_PATH, racy_seconds=0).hash_files(paths)
+for path, file_hash in hashes.items():
+    state.mark_success(file_hash, path.name, nl.STRUCTURE["output"] / (path.stem + ".mmd"))
+"""
+
+def _run_python(args, cwd, env):
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, *args], cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True, encoding="utf-8", errors="replace")
+    seconds = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"código {proc.returncode}")
+    return proc, seconds
+
+def _import_times(cwd, env, top):
+    # `-X importtime` escribe por modulo el tiempo acumulado (incluye sus dependencias) en microsegundos
+    proc, _ = _run_python(["-X", "importtime", "-c", "import nougat_local"], cwd, env)
+    times = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match and len(match.group(2)) <= 2:
+            times.append((int(match.group(1)) / 1e6, match.group(3).strip()))
+    return sorted(times, reverse=True)[:top]
+
+def bench_startup(args):
+    # Cada caso es un interprete nuevo: mide lo que paga quien lanza el pipeline, incluido el
+    # arranque de Python. El ultimo caso es una ejecucion completa sin nada nuevo en input/.
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_DIR), os.environ.get("PYTHONPATH")])))
+    script = str(REPO_DIR / "nougat_local.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = Path(tmp) / "input"
+        input_dir.mkdir()
+        rnd = random.Random(args.seed)
+        old = time.time() - 3600
+        for i in range(args.files):
+            path = input_dir / f"doc{i:05d}.pdf"
+            path.write_bytes(b"%PDF-1.4\n" + rnd.randbytes(args.file_kb * 1024))
+            os.utime(path, (old, old))
+        _run_python(["-c", _SEED_STARTUP], tmp, env)
+
+        cases = [("intérprete (python -c pass)", ["-c", "pass"]),
+                 ("import nougat_local", ["-c", "import nougat_local"]),
+                 (f"sin trabajo ({args.files} PDFs)", [script])]
+        print(f"{'caso':<30} {'mediana':>9} {'mínimo':>9}")
+        results = {}
+        for name, cmd in cases:
+            times = []
+            for _ in range(args.repeat):
+                proc, seconds = _run_python(cmd, tmp, env)
+                times.append(seconds)
+            results[name] = statistics.median(times)
+            print(f"{name:<30} {statistics.median(times):>8.3f}s {min(times):>8.3f}s")
+        if "Nada nuevo que procesar." not in proc.stdout:
+            print("ERROR: la ejecución sin trabajo no terminó con 'Nada nuevo que procesar.'")
+            return 1
+
+        if args.top:
+            print("Importaciones más costosas de nougat_local (acumulado, una ejecución):")
+            for seconds, module in _import_times(tmp, env, args.top):
+                print(f"  {module:<28} {seconds * 1000:>7.1f} ms")
+
+    idle = results[cases[-1][0]]
+    if args.budget and idle > args.budget:
+        print(f"La ejecución sin trabajo tardó {idle:.3f}s, más que el límite de {args.budget:.3f}s.")
+        return 1
+    return 0
+
+# Un nodo del modo coordinado con un motor simulado (espera fija por pagina, sin modelo):
+# mide el reparto de trabajo, no la inferencia. Argumentos: id, s/pagina, lease, renovacion.
+_NODE_WORKER = """
+import sys, time
+import nougat_local as nl
+import nougat_engine
+
+worker, page_seconds = sys.argv[1], float(sys.argv[2])
+nl.LEASE_SECONDS, nl.LEASE_HEARTBEAT = float(sys.argv[3]), float(sys.argv[4])
+nl.LEASE_POLL_INTERVAL = min(nl.LEASE_POLL_INTERVAL, nl.LEASE_HEARTBEAT)
+
+class SimulatedEngine:
+    name = "simulado"
+    max_inflight = 1
+
+    def process(self, pdf_path, key=None):
+        pages = nougat_engine.count_pages(pdf_path)
+        time.sleep(pages * page_seconds)
+        mmd_path = nl.STRUCTURE["output"] / (pdf_path.stem + ".mmd")
+        mmd_path.write_text("".join(f"# Pagina {i + 1}\\n\\nTexto simulado.\\n\\n" for i in range(pages)), encoding="utf-8")
+        return mmd_path
+
+    def report(self):
+        pass
+
+    def close(self):
+        pass
+
+nl.check_hardware = lambda: False
+nl.engine_settings = lambda has_gpu, recalibrate: {}
+nl.create_engine = lambda settings, page_results=None, tools=None: SimulatedEngine()
+nl.create_latex_converter = lambda tools=None: None
+nl.main(worker=worker)
+"""
+
+def _spawn_nodes(n, workdir, env, args, lease_seconds, heartbeat):
+    return [subprocess.Popen([sys.executable, "-c", _NODE_WORKER, f"nodo{i}", str(args.page_seconds),
+                              str(lease_seconds), str(heartbeat)],
+                             cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             text=True, encoding="utf-8", errors="replace")
+            for i in range(n)]
+
+def _wait_nodes(procs):
+    for proc in procs:
+        _, err = proc.communicate()
+        if proc.returncode:
+            raise RuntimeError(err.strip().splitlines()[-1] if err.strip() else f"código {proc.returncode}")
+
+def _node_successes(workdir):
+    # PDF -> nodos que lo terminaron, segun los logs de cada nodo
+    done = {}
+    for log_path in (Path(workdir) / "checkpoint").glob("pipeline-*.log"):
+        worker = log_path.stem[len("pipeline-"):]
+        for match in re.finditer(r"\] Exito: (\S+\.pdf)", log_path.read_text(encoding="utf-8")):
+            done.setdefault(match.group(1), []).append(worker)
+    return done
+
+def bench_nodes(args):
+    # Varios procesos locales sobre las mismas carpetas hacen de nodos: cada PDF debe
+    # terminarse exactamente una vez y el rendimiento debe crecer con los nodos
+    missing = _missing_dependency("fpdf")
+    if missing:
+        print(f"Falta {missing}: no se pueden generar los PDFs de prueba.")
+        return 1
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_DIR), os.environ.get("PYTHONPATH")])))
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = Path(tmp) / "corpus"
+        corpus.mkdir()
+        for i in range(args.pdfs):
+            make_synthetic_pdf(corpus / f"doc{i:03d}.pdf", args.pages, seed=args.seed + i)
+        total_pages = args.pdfs * args.pages
+        print(f"{args.pdfs} PDFs de {args.pages} páginas, {args.page_seconds:g}s por página en el motor simulado.")
+        print(f"{'nodos':>5} {'pared':>9} {'págs/s':>8} {'escala':>7} {'PDFs por nodo':<20}")
+        base_rate = None
+        for n in args.nodes:
+            workdir = Path(tmp) / f"nodos{n}"
+            shutil.copytree(corpus, workdir / "input")
+            t0 = time.perf_counter()
+            _wait_nodes(_spawn_nodes(n, workdir, env, args, args.lease_seconds, args.heartbeat))
+            seconds = time.perf_counter() - t0
+            done = _node_successes(workdir)
+            rate = total_pages / seconds
+            base_rate = base_rate or rate / n
+            per_node = {}
+            for workers in done.values():
+                for worker in workers:
+                    per_node[worker] = per_node.get(worker, 0) + 1
+            print(f"{n:>5} {seconds:>8.2f}s {rate:>8.1f} {rate / base_rate:>6.2f}x "
+                  f"{'/'.join(str(per_node.get(f'nodo{i}', 0)) for i in range(n)):<20}")
+            duplicated = sorted(name for name, workers in done.items() if len(workers) > 1)
+            missing = args.pdfs - len(done)
+            if duplicated or missing:
+                print(f"  ERROR: {missing} PDFs sin terminar, {len(duplicated)} terminados más de una vez {duplicated[:5]}")
+                ok = False
+
+        if args.kill:
+            # Un nodo muere a mitad de un documento: el otro lo retoma cuando vence el lease
+            workdir = Path(tmp) / "caida"
+            shutil.copytree(corpus, workdir / "input")
+            lease_seconds, heartbeat = 3.0, 0.5
+            procs = _spawn_nodes(2, workdir, env, args, lease_seconds, heartbeat)
+            lease_dir = workdir / "checkpoint" / "leases"
+            victim = None
+            deadline = time.time() + 60
+            while victim is None and time.time() < deadline:
+                for lease in lease_dir.glob("*.lease") if lease_dir.exists() else []:
+                    try:
+                        owner = json.loads(lease.read_text(encoding="utf-8"))
+                    except (OSError, ValueError):
+                        continue
+                    if owner.get("worker") == "nodo0":
+                        victim = owner["name"]
+                        break
+                time.sleep(0.05)
+            procs[0].kill()
+            procs[0].communicate()
+            t0 = time.perf_counter()
+            _wait_nodes(procs[1:])
+            done = _node_successes(workdir)
+            recovered = done.get(victim, [])
+            print(f"Caída de nodo0 durante {victim} (lease de {lease_seconds:g}s): "
+                  f"{'retomado por ' + ', '.join(recovered) if recovered else 'NO retomado'}, "
+                  f"{len(done)}/{args.pdfs} PDFs terminados, el resto del lote tardó {time.perf_counter() - t0:.1f}s.")
+            if not recovered or len(done) != args.pdfs:
+                ok = False
+    return 0 if ok else 1
+
+def bench_schedule(args):
+    # Tiempo hasta el resultado de cada documento segun la politica, con el mismo modelo con el
+    # que el planificador estima (`--slots` documentos a la vez, `--rate` pag/s cada uno). Los
+    # libros grandes llegaron primero: el peor caso del orden de os.listdir anterior.
+    import job_scheduler
+    import nougat_engine
+    rnd = random.Random(args.seed)
+    jobs = [{"pdf_path": Path(f"libro{i}.pdf"), "hash": f"l{i}", "pages": args.large_pages,
+             "priority": job_scheduler.DEFAULT_PRIORITY, "mtime": float(i)} for i in range(args.large)]
+    jobs += [{"pdf_path": Path(f"articulo{i:03d}.pdf"), "hash": f"a{i}",
+              "pages": rnd.randint(max(1, args.small_pages // 2), args.small_pages * 3 // 2),
+              "priority": job_scheduler.DEFAULT_PRIORITY, "mtime": float(args.large + i)} for i in range(args.small)]
+    print(f"{args.large} PDFs de {args.large_pages} páginas y {args.small} de ~{args.small_pages}, "
+          f"{args.rate:g} pág/s por documento, {args.slots} a la vez.")
+    print(f"{'política':<10} {'mediana chicos':>15} {'p90 chicos':>11} {'grandes':>9} {'total':>9}")
+    for policy in job_scheduler.POLICIES:
+        ordered = job_scheduler.order_jobs(jobs, policy, args.size_cap, args.large_every)
+        finish = dict(zip((job["hash"] for job in ordered), job_scheduler.estimate_finish(ordered, args.rate, args.slots)))
+        small = sorted(finish[job["hash"]] for job in jobs if job["pages"] <= args.size_cap)
+        large = [finish[job["hash"]] for job in jobs if job["pages"] > args.size_cap]
+        fmt = job_scheduler.format_duration
+        print(f"{policy:<10} {fmt(statistics.median(small)) if small else '-':>15} "
+              f"{fmt(small[int(0.9 * (len(small) - 1))]) if small else '-':>11} "
+              f"{fmt(max(large)) if large else '-':>9} {fmt(max(finish.values())):>9}")
+
+    if args.count_pdfs:
+        # Lo que cuesta ordenar: contar las paginas de cada PDF pendiente con pypdfium2
+        missing = _missing_dependency("fpdf", "pypdfium2")
+        if missing:
+            print(f"Conteo de páginas omitido: falta {missing}.")
+            return 0
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [make_synthetic_pdf(Path(tmp) / f"doc{i:03d}.pdf", 1 + i % 20, seed=args.seed + i)
+                     for i in range(args.count_pdfs)]
+            t0 = time.perf_counter()
+            job_scheduler.make_jobs([(path, str(i)) for i, path in enumerate(paths)], nougat_engine.count_pages)
+            seconds = time.perf_counter() - t0
+        print(f"Conteo de páginas y prioridades: {args.count_pdfs} PDFs en {seconds * 1000:.0f} ms "
+              f"({seconds * 1000 / args.count_pdfs:.2f} ms por PDF).")
+    return 0
+
+def bench_raster(args):
+    # Renderizado de las paginas perdidas para la auditoria y el OCR, en el orden del pipeline
+    # (la auditoria renderiza con la resolucion del OCR y reduce; el OCR reutiliza esas paginas)
+    missing = _missing_dependency("fpdf", "pypdfium2", "PIL")
+    if missing:
+        print(f"Falta {missing}: no se puede medir el renderizado.")
+        return 1
+    import nougat_local
+    configs = [
+        ("antes (x2, color, PNG)", {"dpi": 144, "max_pixels": None, "grayscale": False},
+         {"dpi": 144, "max_pixels": None, "grayscale": False, "image_format": None}),
+        ("ahora (configuración)", {"dpi": nougat_local.OCR_DPI, "max_pixels": nougat_local.OCR_MAX_PIXELS,
+                                   "grayscale": nougat_local.OCR_GRAYSCALE},
+         {"dpi": nougat_local.AUDIT_DPI, "max_pixels": nougat_local.AUDIT_MAX_PIXELS, "grayscale": nougat_local.AUDIT_GRAYSCALE,
+          "image_format": nougat_local.AUDIT_IMAGE_FORMAT, "quality": nougat_local.AUDIT_JPEG_QUALITY}),
+    ]
+    tesseract = None
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        tesseract = pytesseract
+    except Exception:
+        print("Tesseract no disponible: se omite el tiempo de OCR.")
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_large_format_pdf(Path(tmp) / "gran_formato.pdf", args.a4_pages, seed=args.seed)
+        n_pages = args.a4_pages + 1
+        mmd = "\n\n".join(f"[MISSING_PAGE_EMPTY:{pg}]" for pg in range(1, n_pages + 1))
+        print(f"{args.a4_pages} páginas A4 de texto y una lámina A1 escaneada, todas marcadas como vacías.")
+        print(f"{'configuración':<24} {'auditoría':>10} {'PDF auditoría':>14} {'mayor página':>13} {'páginas':>10} {'OCR':>8}")
+        for name, ocr, audit in configs:
+            page_cache = post_processor.PageImageCache(pdf_path, 1024 ** 3, **ocr)
+            try:
+                report = Path(tmp) / f"auditoria_{len(name)}.pdf"
+                t0 = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    post_processor.generate_blank_page_report(pdf_path, mmd, report, page_cache=page_cache, **audit)
+                audit_seconds = time.perf_counter() - t0
+                images = [page_cache.get(pg) for pg in range(n_pages)]
+                sizes = [img.width * img.height * len(img.getbands()) for img in images]
+                ocr_seconds = None
+                if tesseract is not None:
+                    t0 = time.perf_counter()
+                    for img in images:
+                        tesseract.image_to_string(img, lang="eng")
+                    ocr_seconds = time.perf_counter() - t0
+            finally:
+                page_cache.close()
+            big = images[-1]
+            print(f"{name:<24} {audit_seconds:>9.2f}s {report.stat().st_size / 1024:>11.0f} KB "
+                  f"{max(sizes) / 1024 ** 2:>10.1f} MB {sum(sizes) / 1024 ** 2:>7.1f} MB "
+                  f"{f'{ocr_seconds:.1f}s' if ocr_seconds is not None else '-':>8}")
+            print(f"  lámina A1: {big.width}x{big.height} {big.mode}; página A4: {images[0].width}x{images[0].height}")
+    return 0
+
+_OCR_LOCK_CHILD = """
+import sys, time, threading
+from pathlib import Path
+import benchmark, post_processor, result_cache
+
+tmp, pages = Path(sys.argv[1]), int(sys.argv[2])
+pdf_path = benchmark.make_synthetic_pdf(tmp / "ocr.pdf", pages)
+# Textos ya en la cache de resultados: el hijo renderiza la pagina y no necesita Tesseract
+cache = result_cache.PageResultCache(tmp / "cache")
+page_cache = post_processor.PageImageCache(pdf_path)
+for pg in range(pages):
+    cache.put(cache.image_key(page_cache.get(pg), "tesseract:eng"), f"texto recuperado {pg + 1}")
+
+stop = threading.Event()
+def busy_renderer():
+    # Como el motor o la auditoria: el candado de pdfium casi siempre esta tomado por otro hilo
+    while not stop.is_set():
+        with post_processor.PDFIUM_LOCK:
+            time.sleep(0.05)
+        time.sleep(0.001)
+threading.Thread(target=busy_renderer, daemon=True).start()
+time.sleep(0.01)
+
+mmd = "".join(f"[MISSING_PAGE_EMPTY:{pg}]\\n" for pg in range(1, pages + 1))
+out = post_processor.recover_missing_pages(pdf_path, mmd, language="english", workers=pages, use_processes=True,
+                                           page_cache=page_cache, result_cache=cache)
+stop.set()
+print(sum(f"texto recuperado {pg}" in out for pg in range(1, pages + 1)))
+"""
+
+def bench_ocr_processes(args):
+    # Recuperacion OCR en procesos mientras otro hilo del padre tiene tomado PDFIUM_LOCK:
+    # un hijo que heredara el candado tomado no terminaria nunca
+    missing = _missing_dependency("fpdf", "pypdfium2", "pytesseract")
+    if missing:
+        print(f"Falta {missing}: no se puede comprobar la recuperación en procesos.")
+        return 1
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_DIR), os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        try:
+            proc = subprocess.run([sys.executable, "-c", _OCR_LOCK_CHILD, tmp, str(args.pages)], cwd=tmp, env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8",
+                                  errors="replace", timeout=args.timeout)
+        except subprocess.TimeoutExpired:
+            print(f"FALLA: la recuperación en procesos no terminó en {args.timeout:g}s (procesos bloqueados en PDFIUM_LOCK).")
+            return 1
+    seconds = time.perf_counter() - t0
+    lines = proc.stdout.strip().splitlines()
+    recovered = int(lines[-1]) if proc.returncode == 0 and lines and lines[-1].isdigit() else None
+    if recovered != args.pages:
+        detail = proc.stderr.strip().splitlines()[-1:] or [f"código {proc.returncode}"]
+        print(f"FALLA: {recovered if recovered is not None else 0} de {args.pages} páginas recuperadas ({detail[0]}).")
+        return 1
+    print(f"{args.pages} páginas recuperadas en procesos con PDFIUM_LOCK ocupado por otro hilo ({seconds:.1f}s).")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline Nougat.")
+    sub = parser.add_subparsers(dest="suite", required=True)
+
+    latex = sub.add_parser("latex", help="Conversor LaTeX de respaldo: versión actual vs original")
+    latex.add_argument("--sizes", type=float, nargs="+", default=[1, 10, 50], help="Tamaños sintéticos en MB")
+    latex.add_argument("--corpus", help="Carpeta con archivos .mmd reales para comparar la salida (p. ej. output)")
+    latex.add_argument("--seed", type=int, default=0)
+    latex.add_argument("--no-legacy", action="store_true", help="Medir solo la versión actual")
+    latex.set_defaults(func=bench_latex)
+
+    structure = sub.add_parser("estructura", help="Escáner de estructuras y escritores JSON: versión actual vs original")
+    structure.add_argument("--docs", type=int, default=3000, help="Documentos al azar comparados con la implementación original")
+    structure.add_argument("--sizes", type=float, nargs="+", default=[1, 5], help="Tamaños sintéticos en MB para medir el tiempo")
+    structure.add_argument("--repeat", type=int, default=3, help="Ejecuciones por caso (se toma la más rápida)")
+    structure.add_argument("--seed", type=int, default=0)
+    structure.set_defaults(func=bench_structure)
+
+    postproc = sub.add_parser("postproc", help="Post-procesamiento completo con un corpus sintético, comparado con una línea base")
+    postproc.add_argument("--size", type=float, default=1, help="Tamaño del .mmd sintético en MB")
+    postproc.add_argument("--equations", type=int, default=1, help="Ecuaciones en línea por párrafo")
+    postproc.add_argument("--header-depth", type=int, default=4, help="Nivel máximo de encabezado (1-6)")
+    postproc.add_argument("--missing-pages", type=int, default=5, help="Páginas perdidas ([MISSING_PAGE_EMPTY]) en el corpus")
+    postproc.add_argument("--seed", type=int, default=0)
+    postproc.add_argument("--repeat", type=int, default=3, help="Ejecuciones por caso (se toma la más rápida)")
+    postproc.add_argument("--ocr-workers", type=int, default=None)
+    postproc.add_argument("--baseline", default="benchmark_baseline.json", help="Archivo de línea base")
+    postproc.add_argument("--save-baseline", action="store_true", help="Guardar los tiempos de esta ejecución como línea base")
+    postproc.add_argument("--tolerance", type=float, default=0.2, help="Aumento relativo tolerado antes de marcar regresión")
+    postproc.set_defaults(func=bench_postproc)
+
+    startup = sub.add_parser("arranque", help="Tiempo de arranque: importación y ejecución sin PDFs nuevos")
+    startup.add_argument("--files", type=int, default=200, help="PDFs ya procesados en input/")
+    startup.add_argument("--file-kb", type=int, default=64, help="Tamaño de cada PDF en KB")
+    startup.add_argument("--seed", type=int, default=0)
+    startup.add_argument("--repeat", type=int, default=5, help="Ejecuciones por caso (se informa la mediana)")
+    startup.add_argument("--top", type=int, default=8, help="Importaciones más costosas a mostrar (0 = ninguna)")
+    startup.add_argument("--budget", type=float, default=1.0, help="Segundos máximos de la ejecución sin trabajo (0 = sin límite)")
+    startup.set_defaults(func=bench_startup)
+
+    memory = sub.add_parser("memoria", help="Pico de memoria de cada etapa de post-procesamiento sobre un documento grande")
+    memory.add_argument("--size", type=float, default=20, help="Tamaño del .mmd sintético en MB")
+    memory.add_argument("--equations", type=int, default=1, help="Ecuaciones en línea por párrafo")
+    memory.add_argument("--missing-pages", type=int, default=5, help="Páginas perdidas ([MISSING_PAGE_EMPTY]) en el corpus")
+    memory.add_argument("--no-headers", action="store_true", help="Documento sin encabezados (una sola sección)")
+    memory.add_argument("--seed", type=int, default=0)
+    memory.set_defaults(func=bench_memory)
+
+    registry = sub.add_parser("registro", help="Registro append-only: reproducción, cortes, compactación y migración vs registry.json")
+    registry.add_argument("--ops", type=int, default=2000, help="Marcas al azar reproducidas y comparadas con el registro original")
+    registry.add_argument("--entries", type=int, nargs="+", default=[1000, 10000, 50000], help="Tamaños del registro para medir el guardado")
+    registry.add_argument("--saves", type=int, default=20, help="Guardados medidos por tamaño (se toma el más rápido)")
+    registry.add_argument("--seed", type=int, default=0)
+    registry.set_defaults(func=bench_registry)
+
+    nodes = sub.add_parser("nodos", help="Modo coordinado: varios procesos locales se reparten un lote con un motor simulado")
+    nodes.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4], help="Cantidades de nodos a comparar")
+    nodes.add_argument("--pdfs", type=int, default=48, help="PDFs del lote")
+    nodes.add_argument("--pages", type=int, default=4, help="Páginas por PDF")
+    nodes.add_argument("--page-seconds", type=float, default=0.1, help="Segundos por página del motor simulado")
+    nodes.add_argument("--lease-seconds", type=float, default=30)
+    nodes.add_argument("--heartbeat", type=float, default=0.5, help="Renovación de leases (y reintento sobre PDFs ajenos) en segundos")
+    nodes.add_argument("--kill", action="store_true", help="Matar un nodo a mitad de un documento y comprobar que otro lo retoma")
+    nodes.add_argument("--seed", type=int, default=0)
+    nodes.set_defaults(func=bench_nodes)
+
+    schedule = sub.add_parser("planificacion", help="Tiempo hasta el resultado por política de planificación de la cola")
+    schedule.add_argument("--small", type=int, default=50, help="PDFs chicos en la cola")
+    schedule.add_argument("--small-pages", type=int, default=5, help="Páginas medias de un PDF chico")
+    schedule.add_argument("--large", type=int, default=1, help="PDFs grandes, al frente de la cola")
+    schedule.add_argument("--large-pages", type=int, default=900)
+    schedule.add_argument("--rate", type=float, default=0.5, help="Páginas por segundo de un documento")
+    schedule.add_argument("--slots", type=int, default=1, help="Documentos en curso a la vez")
+    schedule.add_argument("--size-cap", type=int, default=100, help="Páginas a partir de las cuales un PDF es grande")
+    schedule.add_argument("--large-every", type=int, default=0, help="fifo-cap: un grande cada tantos chicos (0 = al final)")
+    schedule.add_argument("--count-pdfs", type=int, default=50, help="PDFs sintéticos para medir el conteo de páginas (0 = no medir)")
+    schedule.add_argument("--seed", type=int, default=0)
+    schedule.set_defaults(func=bench_schedule)
+
+    raster = sub.add_parser("raster", help="Renderizado para auditoría y OCR: memoria, tiempo de OCR y tamaño del reporte")
+    raster.add_argument("--a4-pages", type=int, default=4, help="Páginas A4 de texto antes de la lámina A1")
+    raster.add_argument("--seed", type=int, default=0)
+    raster.set_defaults(func=bench_raster)
+
+    ocr_processes = sub.add_parser("ocr-procesos", help="Recuperación OCR en procesos con el candado de pdfium tomado por otro hilo")
+    ocr_processes.add_argument("--pages", type=int, default=4, help="Páginas recuperadas (una por proceso)")
+    ocr_processes.add_argument("--timeout", type=float, default=120, help="Segundos antes de considerar bloqueados los procesos")
+    ocr_processes.set_defaults(func=bench_ocr_processes)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
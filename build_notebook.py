@@ -23,6 +23,7 @@ notebook = {
                 "!pip install nougat-ocr pypdf torch tqdm transformers==4.38.2 albumentations==1.4.3 pypdfium2 fpdf2 pypandoc pypandoc-binary pytesseract\n",
                 "!python -m nltk.downloader words\n",
                 "\n",
+                "import io\n",
                 "import os\n",
                 "import json\n",
                 "import time\n",
@@ -123,6 +124,12 @@ notebook = {
                 "MODEL_SIZE = \"0.1.0-small\" # @param [\"0.1.0-small\", \"0.1.0-base\"]\n",
                 "FORCE_REPROCESS = False # @param {type:\"boolean\"}\n",
                 "LATEX_LANGUAGE = \"spanish\" # @param [\"spanish\", \"english\"]\n",
+                "CHECKPOINT_PAGES = 20 # @param {type:\"integer\"}\n",
+                "OCR_DPI = 200 # @param {type:\"integer\"}\n",
+                "AUDIT_DPI = 96 # @param {type:\"integer\"}\n",
+                "GRAYSCALE = True # @param {type:\"boolean\"}\n",
+                "OCR_MAX_PIXELS = 6_000_000 # Tope por página: planos y láminas de gran formato se renderizan a menos ppp\n",
+                "AUDIT_MAX_PIXELS = 1_500_000\n",
                 "\n",
                 "# Verificación de Drive y fallback local (2.A)\n",
                 "actual_base_dir = Path(BASE_DIR)\n",
@@ -152,6 +159,7 @@ notebook = {
                 "for p in STRUCTURE.values(): p.mkdir(parents=True, exist_ok=True)\n",
                 "\n",
                 "REGISTRY_PATH = STRUCTURE[\"checkpoint\"] / \"registry.json\"\n",
+                "PAGE_CHECKPOINT_DIR = STRUCTURE[\"checkpoint\"] / \"pages\" # Rangos de páginas ya decodificados por Nougat\n",
                 "LOG_PATH = STRUCTURE[\"checkpoint\"] / \"pipeline.log\"\n",
                 "\n",
                 "def log_message(msg):\n",
@@ -365,6 +373,12 @@ notebook = {
                 "        print(f\"Fallo en conversión con Pandoc ({e}). Usando conversor de respaldo (Regex)...\")\n",
                 "        return mmd_to_latex_fallback(mmd_content, title, language)\n",
                 "\n",
+                "def render_page(page, dpi, max_pixels, grayscale):\n",
+                "    # ppp pedidos, reducidos si la página pasaría de max_pixels\n",
+                "    w, h = page.get_size()\n",
+                "    scale = min(dpi / 72, (max_pixels / (w * h)) ** 0.5)\n",
+                "    return page.render(scale=scale, grayscale=grayscale).to_pil()\n",
+                "\n",
                 "def recover_missing_pages(pdf_path, mmd_content, language=\"spanish\"):\n",
                 "    missing_pages = re.findall(r'\\[MISSING_PAGE_(EMPTY|FAIL):(\\d+)\\]', mmd_content)\n",
                 "    if not missing_pages: return mmd_content\n",
@@ -383,8 +397,7 @@ notebook = {
                 "            if pg_idx < 0 or pg_idx >= len(src_pdf): continue\n",
                 "            print(f\"Recuperando página {pg_num_str} vía Tesseract OCR...\")\n",
                 "            page = src_pdf[pg_idx]\n",
-                "            bitmap = page.render(scale=2)\n",
-                "            img = bitmap.to_pil()\n",
+                "            img = render_page(page, OCR_DPI, OCR_MAX_PIXELS, GRAYSCALE)\n",
                 "            try:\n",
                 "                ocr_text = pytesseract.image_to_string(img, lang=tess_lang).strip()\n",
                 "            except Exception as ocr_err:\n",
@@ -406,27 +419,19 @@ notebook = {
                 "        from fpdf import FPDF\n",
                 "        missing = re.findall(r'\\[MISSING_PAGE_EMPTY:(\\d+)\\]', mmd_content)\n",
                 "        if not missing: return False\n",
-                "        temp_dir = Path(\"temp_audit_colab\")\n",
-                "        temp_dir.mkdir(exist_ok=True)\n",
-                "        try:\n",
-                "            pdf = FPDF()\n",
-                "            src = pdfium.PdfDocument(str(pdf_path))\n",
-                "            for p in missing:\n",
-                "                pdf.add_page()\n",
-                "                pdf.set_font(\"Arial\", size=12)\n",
-                "                pdf.cell(200, 10, txt=f\"Pagina: {p}\", ln=1)\n",
-                "                img = src[int(p)-1].render(scale=2).to_pil()\n",
-                "                img_p = temp_dir / f\"page_{p}.png\"\n",
-                "                img.save(img_p)\n",
-                "                pdf.image(str(img_p), x=10, y=30, w=190)\n",
-                "            pdf.output(str(out_p))\n",
-                "            return True\n",
-                "        finally:\n",
-                "            for f in temp_dir.glob(\"*.png\"):\n",
-                "                try: os.remove(f)\n",
-                "                except: pass\n",
-                "            try: temp_dir.rmdir()\n",
-                "            except: pass\n",
+                "        pdf = FPDF()\n",
+                "        src = pdfium.PdfDocument(str(pdf_path))\n",
+                "        for p in missing:\n",
+                "            pdf.add_page()\n",
+                "            pdf.set_font(\"Arial\", size=12)\n",
+                "            pdf.cell(200, 10, txt=f\"Pagina: {p}\", ln=1)\n",
+                "            img = render_page(src[int(p)-1], AUDIT_DPI, AUDIT_MAX_PIXELS, GRAYSCALE)\n",
+                "            # JPEG en memoria: fpdf2 lo copia tal cual al PDF (DCTDecode)\n",
+                "            jpeg = io.BytesIO()\n",
+                "            img.convert(\"L\" if GRAYSCALE else \"RGB\").save(jpeg, format=\"JPEG\", quality=70, optimize=True)\n",
+                "            pdf.image(jpeg, x=10, y=30, w=190)\n",
+                "        pdf.output(str(out_p))\n",
+                "        return True\n",
                 "    except Exception as e: log_message(f\"Error Auditor: {e}\"); return False"
             ]
         },
@@ -437,6 +442,45 @@ notebook = {
             "outputs": [],
             "source": [
                 "# @title 5. Ejecutar Pipeline\n",
+                "def run_nougat(pdf_p, h):\n",
+                "    # Nougat por rangos de CHECKPOINT_PAGES páginas: cada rango terminado se guarda en checkpoint/pages/<hash>/\n",
+                "    # y, si la sesión se desconecta, la siguiente ejecución retoma desde el primer rango sin decodificar.\n",
+                "    import pypdfium2 as pdfium\n",
+                "    pdf = pdfium.PdfDocument(str(pdf_p))\n",
+                "    n_pages = len(pdf); pdf.close()\n",
+                "    ckpt_dir = PAGE_CHECKPOINT_DIR / h\n",
+                "    meta = {\"n_pages\": n_pages, \"model\": MODEL_SIZE}\n",
+                "    meta_p = ckpt_dir / \"meta.json\"\n",
+                "    if meta_p.exists() and json.loads(meta_p.read_text(encoding=\"utf-8\")) != meta: shutil.rmtree(ckpt_dir)\n",
+                "    ckpt_dir.mkdir(parents=True, exist_ok=True)\n",
+                "    meta_p.write_text(json.dumps(meta), encoding=\"utf-8\")\n",
+                "    \n",
+                "    parts = []\n",
+                "    for start in range(0, n_pages, CHECKPOINT_PAGES):\n",
+                "        end = min(start + CHECKPOINT_PAGES, n_pages)\n",
+                "        part_p = ckpt_dir / f\"{start:05d}-{end:05d}.mmd\"\n",
+                "        if part_p.exists():\n",
+                "            log_message(f\"Páginas {start+1}-{end} recuperadas del checkpoint.\")\n",
+                "        else:\n",
+                "            log_message(f\"Nougat: páginas {start+1}-{end} de {n_pages}\")\n",
+                "            tmp_dir = ckpt_dir / \"tmp\"\n",
+                "            shutil.rmtree(tmp_dir, ignore_errors=True)\n",
+                "            tmp_dir.mkdir(parents=True)\n",
+                "            !nougat \"{str(pdf_p)}\" -o \"{str(tmp_dir)}\" --model {MODEL_SIZE} --no-skipping --pages {start+1}-{end}\n",
+                "            tmp_mmd = tmp_dir / f\"{pdf_p.stem}.mmd\"\n",
+                "            if not tmp_mmd.exists(): raise Exception(f\"Error: Nougat no generó las páginas {start+1}-{end}.\")\n",
+                "            # Nougat numera las páginas de cada rango desde 1: se restaura la numeración absoluta\n",
+                "            text = re.sub(r\"\\[MISSING_PAGE_(\\w+):(\\d+)\\]\", lambda m: f\"[MISSING_PAGE_{m.group(1)}:{int(m.group(2)) + start}]\", tmp_mmd.read_text(encoding=\"utf-8\"))\n",
+                "            part_p.with_suffix(\".tmp\").write_text(text, encoding=\"utf-8\")\n",
+                "            os.replace(part_p.with_suffix(\".tmp\"), part_p)\n",
+                "            shutil.rmtree(tmp_dir, ignore_errors=True)\n",
+                "        parts.append(part_p.read_text(encoding=\"utf-8\"))\n",
+                "    \n",
+                "    out_mmd = STRUCTURE[\"output\"] / f\"{pdf_p.stem}.mmd\"\n",
+                "    mmd = re.sub(r\"\\n{3,}\", \"\\n\\n\", \"\".join(p + \"\\n\\n\" for p in parts).strip()).strip()\n",
+                "    with open(out_mmd, \"w\", encoding=\"utf-8\") as f: f.write(mmd)\n",
+                "    return out_mmd\n",
+                "\n",
                 "def main():\n",
                 "    state = PipelineState(REGISTRY_PATH)\n",
                 "    all_pdfs = list(STRUCTURE[\"input\"].glob(\"*.pdf\"))\n",
@@ -450,9 +494,7 @@ notebook = {
                 "        \n",
                 "        log_message(f\"--- Procesando: {pdf_p.name} ---\")\n",
                 "        try:\n",
-                "            !nougat \"{str(pdf_p)}\" -o \"{str(STRUCTURE['output'])}\" --model {MODEL_SIZE} --no-skipping\n",
-                "            \n",
-                "            out_mmd = STRUCTURE[\"output\"] / f\"{pdf_p.stem}.mmd\"\n",
+                "            out_mmd = run_nougat(pdf_p, h)\n",
                 "            if out_mmd.exists():\n",
                 "                with open(out_mmd, \"r\", encoding=\"utf-8\") as f: mmd = f.read()\n",
                 "                \n",
@@ -473,12 +515,16 @@ notebook = {
                 "                    f.write(mmd_to_latex(mmd, pdf_p.stem, language=LATEX_LANGUAGE))\n",
                 "                \n",
                 "                state.mark_success(h, pdf_p.name, out_mmd)\n",
+                "                shutil.rmtree(PAGE_CHECKPOINT_DIR / h, ignore_errors=True)\n",
                 "                log_message(\"Éxito.\")\n",
                 "            else:\n",
                 "                raise Exception(\"Error: El motor Nougat no generó el archivo de salida.\")\n",
                 "        except Exception as e:\n",
                 "            log_message(f\"Fallo: {e}\")\n",
                 "            state.mark_failed(h, pdf_p.name, str(e))\n",
+                "            # Falta de memoria o límite de tiempo: se conservan las páginas para reintentar desde failed/\n",
+                "            if not (isinstance(e, (MemoryError, TimeoutError)) or \"out of memory\" in str(e).lower()):\n",
+                "                shutil.rmtree(PAGE_CHECKPOINT_DIR / h, ignore_errors=True)\n",
                 "            shutil.move(str(pdf_p), str(STRUCTURE[\"failed\"] / pdf_p.name))\n",
                 "\n",
                 "if __name__ == \"__main__\":\n",
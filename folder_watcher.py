@@ -0,0 +1,154 @@
+import os
+import time
+import threading
+from pathlib import Path
+
+class FolderWatcher:
+    # Detecta archivos nuevos o modificados en una carpeta y los entrega cuando llevan `debounce`
+    # segundos sin cambiar de tamaño ni mtime y pueden abrirse (p. ej. un PDF que aun se copia).
+    # Usa notificaciones del sistema de archivos (watchdog) si esta instalado; si no, sondeo.
+    def __init__(self, folder, on_ready, suffix=".pdf", debounce=2.0, poll_interval=2.0, rescan_interval=60.0, log=print):
+        self.folder = Path(folder)
+        self.on_ready = on_ready
+        self.suffix = suffix.lower()
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        # Con notificaciones tambien se reescanea de vez en cuando: algunas unidades de red pierden eventos
+        self.rescan_interval = rescan_interval
+        self.log = log
+        self._known = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+
+    def start(self, known=()):
+        # `known`: archivos ya atendidos al arrancar; no se vuelven a entregar mientras no cambien
+        for path in known:
+            signature = self._signature(path)
+            if signature is not None:
+                self._known[Path(path)] = signature
+        self._observer = self._start_observer()
+        mode = "notificaciones del sistema" if self._observer else f"sondeo cada {self.poll_interval:g}s"
+        self.log(f"Vigilando {self.folder} ({mode}). Ctrl+C para terminar.")
+        return self
+
+    def _start_observer(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return None
+
+        watcher = self
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+                    if path:
+                        watcher.notify(path)
+
+        try:
+            observer = Observer()
+            observer.schedule(Handler(), str(self.folder), recursive=False)
+            observer.daemon = True
+            observer.start()
+        except Exception as e:
+            self.log(f"No se pudieron activar las notificaciones del sistema ({e}). Usando sondeo.")
+            return None
+        return observer
+
+    def notify(self, path):
+        # El observador no es recursivo: basta el nombre para ubicar el archivo en la carpeta
+        path = self.folder / Path(path).name
+        if path.suffix.lower() != self.suffix:
+            return
+        with self._lock:
+            self._pending.setdefault(path, None)
+        self._wake.set()
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns)
+
+    @staticmethod
+    def _readable(path):
+        # En Windows un archivo que todavia se esta copiando suele estar bloqueado para lectura
+        try:
+            with open(path, "rb") as f:
+                f.read(1)
+            return True
+        except OSError:
+            return False
+
+    def _scan(self):
+        present = set()
+        for name in os.listdir(self.folder):
+            if name.lower().endswith(self.suffix):
+                path = self.folder / name
+                present.add(path)
+                if path not in self._known or self._known[path] != self._signature(path):
+                    self._pending.setdefault(path, None)
+        # Un archivo que desaparece (movido a failed/, borrado) se olvida: si vuelve, se entrega de nuevo
+        for path in [p for p in self._known if p not in present]:
+            del self._known[path]
+
+    def _collect_ready(self):
+        # (ruta, firma) de los archivos estables; pasan a `_known` recien cuando se entregan
+        ready = []
+        now = time.monotonic()
+        for path, seen in list(self._pending.items()):
+            signature = self._signature(path)
+            if signature is None or self._known.get(path) == signature:
+                del self._pending[path]
+            elif seen is None or seen[0] != signature:
+                self._pending[path] = (signature, now)
+            elif now - seen[1] >= self.debounce and self._readable(path):
+                del self._pending[path]
+                ready.append((path, signature))
+        return sorted(ready)
+
+    def run(self):
+        # Bloquea hasta stop(); `on_ready` recibe cada tanda de archivos estables en este hilo
+        next_scan = 0.0
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    if time.monotonic() >= next_scan:
+                        self._scan()
+                        next_scan = time.monotonic() + (self.rescan_interval if self._observer else self.poll_interval)
+                    ready = self._collect_ready()
+                    waiting = bool(self._pending)
+                if ready:
+                    try:
+                        self.on_ready([path for path, _ in ready])
+                    except Exception as e:
+                        # Toda la tanda vuelve a pendientes: se reintenta tras otro `debounce`
+                        self.log(f"Error al entregar archivos nuevos ({e}). Se reintentarán.")
+                        delivered = False
+                    else:
+                        delivered = True
+                    with self._lock:
+                        for path, signature in ready:
+                            if delivered:
+                                self._known[path] = signature
+                            else:
+                                self._pending.setdefault(path, None)
+                        waiting = waiting or not delivered
+                timeout = min(0.5, self.debounce) if waiting else next_scan - time.monotonic()
+                self._wake.wait(max(0.05, timeout))
+                self._wake.clear()
+        finally:
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
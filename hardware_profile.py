@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import ctypes
+import datetime
+from pathlib import Path
+
+CPU_THREADS_PER_PROCESS = 4  # Hilos de torch por proceso Nougat en CPU: mas hilos por proceso rinden poco
+NOUGAT_PROCESS_MEMORY_GB = 3 # Memoria aproximada de un proceso Nougat en CPU (modelo + activaciones)
+BASE_MODEL_MIN_VRAM_GB = 12  # VRAM a partir de la cual se elige el modelo base en lugar del small
+CALIBRATION_PAGE_SIZE = (794, 1123) # A4 a 96 ppp, la resolucion con la que se rasterizan las paginas
+
+def _cores():
+    # Nucleos que este proceso puede usar (respeta la afinidad en Linux y los limites de contenedor)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _memory_gb():
+    try:
+        import psutil
+        return round(psutil.virtual_memory().total / 1024 ** 3, 1)
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return round(status.ullTotalPhys / 1024 ** 3, 1)
+        return None
+    try:
+        return round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3, 1)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def detect():
+    hardware = {"cores": _cores(), "memory_gb": _memory_gb(), "device": "cpu", "gpu": None, "vram_gb": None}
+    try:
+        import torch
+        if torch.cuda.is_available():
+            props = torch.cuda.get_device_properties(0)
+            hardware.update(device="cuda", gpu=props.name, vram_gb=round(props.total_memory / 1024 ** 3, 1))
+        elif getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+            hardware["device"] = "mps"
+    except Exception:
+        pass
+    return hardware
+
+def choose(hardware):
+    # Configuracion inicial a partir del hardware; la calibracion ajusta despues el tamaño de lote
+    cores = hardware["cores"]
+    memory = hardware["memory_gb"]
+    if hardware["device"] == "cuda":
+        vram = hardware["vram_gb"] or 0
+        return {
+            "model_size": "0.1.0-base" if vram >= BASE_MODEL_MIN_VRAM_GB else "0.1.0-small",
+            # La misma regla que nougat.utils.device.default_batch_size
+            "batch_size": max(1, int(vram * 1024 / 1000 * 0.3)),
+            # La GPU hace la inferencia: pocos hilos alcanzan para preparar las imagenes
+            "torch_threads": min(cores, 4),
+            # Varios procesos competirian por la VRAM
+            "shard_workers": 1,
+        }
+    workers = max(1, cores // CPU_THREADS_PER_PROCESS)
+    if memory:
+        workers = max(1, min(workers, int(memory // NOUGAT_PROCESS_MEMORY_GB)))
+    return {
+        "model_size": "0.1.0-small",
+        "batch_size": 4 if hardware["device"] == "mps" else 1,
+        "torch_threads": cores,
+        "shard_workers": workers,
+    }
+
+def sample_page():
+    # Pagina de calibracion incorporada: un titulo, parrafos y una formula dibujados con la
+    # fuente por defecto de PIL, sin depender de archivos externos
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", CALIBRATION_PAGE_SIZE, "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((80, 80), "1. Introduccion", fill="black")
+    y = 130
+    for line in range(24):
+        draw.text((80, y), "Sea f una funcion continua en el intervalo [a, b] y derivable en (a, b).", fill="black")
+        y += 18
+        if line == 11:
+            draw.text((240, y + 12), "f(b) - f(a) = f'(c) (b - a),   a < c < b", fill="black")
+            y += 48
+    return img
+
+class HardwareProfile:
+    # Perfil ajustado y calibrado, guardado por maquina: se reutiliza mientras el hardware
+    # detectado (nucleos, memoria, dispositivo, GPU) no cambie.
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self, hardware):
+        try:
+            saved = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return saved if saved.get("hardware") == hardware else None
+
+    def save(self, hardware, settings, pages_per_sec):
+        data = {
+            "hardware": hardware,
+            "settings": settings,
+            "pages_per_sec": {str(size): round(rate, 4) for size, rate in pages_per_sec.items()},
+            "calibrated_at": str(datetime.datetime.now()),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
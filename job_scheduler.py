@@ -0,0 +1,90 @@
+import re
+import heapq
+
+POLICY_FIFO = "fifo"         # Orden de llegada (fecha de modificacion del PDF)
+POLICY_SJF = "sjf"           # Menos paginas primero: minimiza la espera media de los documentos chicos
+POLICY_FIFO_CAP = "fifo-cap" # Orden de llegada para los chicos; los grandes se intercalan o van al final
+POLICIES = (POLICY_FIFO, POLICY_SJF, POLICY_FIFO_CAP)
+
+DEFAULT_PRIORITY = 5         # Prioridad de un PDF sin archivo .priority ni prefijo (menor = antes)
+PRIORITY_PREFIX = re.compile(r"^p(\d+)[_-]", re.IGNORECASE) # "p1_informe.pdf" -> prioridad 1
+HISTORY_DOCS = 50            # Documentos recientes del registro con los que se estima el ritmo
+
+def read_priority(pdf_path):
+    # `informe.priority` junto al PDF (un entero) manda sobre el prefijo del nombre
+    try:
+        return int(pdf_path.with_suffix(".priority").read_text(encoding="utf-8").strip())
+    except (OSError, ValueError):
+        pass
+    match = PRIORITY_PREFIX.match(pdf_path.name)
+    return int(match.group(1)) if match else DEFAULT_PRIORITY
+
+def make_jobs(to_process, count_pages):
+    # Un trabajo por PDF pendiente. Contar paginas solo lee la tabla de paginas del PDF, no su
+    # contenido; un PDF ilegible cuenta 0 paginas y queda primero en "sjf" (falla enseguida).
+    jobs = []
+    for pdf_path, f_hash in to_process:
+        try:
+            mtime = pdf_path.stat().st_mtime
+        except OSError:
+            mtime = 0.0
+        jobs.append({"pdf_path": pdf_path, "hash": f_hash, "pages": count_pages(pdf_path),
+                     "priority": read_priority(pdf_path), "mtime": mtime})
+    return jobs
+
+def _interleave(small, large, every):
+    # Un grande despues de cada `every` chicos: los grandes avanzan aunque la cola de chicos sea larga
+    if not every:
+        return small + large
+    ordered = []
+    large = list(large)
+    for i, job in enumerate(small, 1):
+        ordered.append(job)
+        if i % every == 0 and large:
+            ordered.append(large.pop(0))
+    return ordered + large
+
+def order_jobs(jobs, policy=POLICY_SJF, size_cap=100, large_every=0):
+    # La prioridad manda en todas las politicas; dentro de cada prioridad decide la politica
+    if policy not in POLICIES:
+        raise ValueError(f"Política de planificación desconocida: {policy!r} (opciones: {', '.join(POLICIES)})")
+
+    def arrival(job):
+        return job["mtime"], job["pdf_path"].name
+
+    ordered = []
+    for priority in sorted({job["priority"] for job in jobs}):
+        group = sorted((job for job in jobs if job["priority"] == priority), key=arrival)
+        if policy == POLICY_SJF:
+            group.sort(key=lambda job: job["pages"])
+        elif policy == POLICY_FIFO_CAP:
+            group = _interleave([job for job in group if job["pages"] <= size_cap],
+                                [job for job in group if job["pages"] > size_cap], large_every)
+        ordered.extend(group)
+    return ordered
+
+def historical_rate(entries, last=HISTORY_DOCS):
+    # Paginas por segundo de un documento en la etapa Nougat, segun los ultimos exitos del registro
+    recent = [entry for entry in entries if entry.get("pages") and entry.get("seconds")][-last:]
+    seconds = sum(entry["seconds"] for entry in recent)
+    return sum(entry["pages"] for entry in recent) / seconds if seconds > 0 else None
+
+def estimate_finish(jobs, rate, slots=1):
+    # Segundos hasta el fin de cada trabajo con `slots` documentos en curso a la vez, cada uno
+    # al ritmo historico. El post-procesamiento se solapa con el documento siguiente y no se suma.
+    free = [0.0] * max(1, slots)
+    finish = []
+    for job in jobs:
+        start = heapq.heappop(free)
+        end = start + job["pages"] / rate
+        heapq.heappush(free, end)
+        finish.append(end)
+    return finish
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
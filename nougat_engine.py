@@ -0,0 +1,591 @@
+import os
+import re
+import json
+import time
+import shutil
+import queue
+import threading
+import subprocess
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import page_classifier
+import post_processor
+
+RASTER_DPI = 96 # Misma resolucion que usa nougat.dataset.rasterize por defecto
+MISSING_PAGE_RE = re.compile(r"\[MISSING_PAGE_(\w+):(\d+)\]")
+TQDM_PROGRESS_RE = re.compile(r"(\d+)%\|.*?\|\s*(\d+)/(\d+)")
+OUTPUT_LINE_RE = re.compile(rb"[\r\n]")
+
+def page_markdown(prediction, page_num):
+    # Replica el post-procesado por pagina de `nougat/predict.py` con --no-skipping
+    if prediction is None or prediction.strip() == "[MISSING_PAGE_POST]":
+        return f"\n\n[MISSING_PAGE_EMPTY:{page_num}]\n\n"
+    from nougat.postprocessing import markdown_compatible
+    return markdown_compatible(prediction)
+
+def join_pages(pages):
+    out = "".join(pages).strip()
+    return re.sub(r"\n{3,}", "\n\n", out).strip()
+
+def renumber_missing_pages(text, offset):
+    # Nougat numera las paginas de cada fragmento desde 1; se restaura la numeracion absoluta
+    if not offset:
+        return text
+    return MISSING_PAGE_RE.sub(lambda m: f"[MISSING_PAGE_{m.group(1)}:{int(m.group(2)) + offset}]", text)
+
+def count_pages(pdf_path):
+    try:
+        import pypdfium2 as pdfium
+        with post_processor.PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(str(pdf_path))
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    except Exception:
+        return 0
+
+def format_throughput(name, pages, elapsed, extra=""):
+    rate = pages / elapsed if elapsed > 0 else 0.0
+    return f"Rendimiento Nougat ({name}): {pages} páginas en {elapsed:.1f}s -> {rate:.2f} pág/s{extra}"
+
+class PageCheckpoint:
+    # Markdown ya decodificado de un documento en curso, en `<root>/<clave>/` con un archivo por
+    # rango de paginas (`00012-00013.mmd` = pagina 13). Si el proceso muere, al reanudar solo
+    # se infieren los rangos que faltan.
+    def __init__(self, root, key):
+        self.dir = Path(root) / key
+        self._meta = None
+
+    def load(self, n_pages, model):
+        meta = {"n_pages": n_pages, "model": model}
+        meta_path = self.dir / "meta.json"
+        try:
+            saved_meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            saved_meta = None
+        if saved_meta != meta:
+            # Otro modelo u otro PDF con la misma clave: lo guardado no sirve
+            self.clear()
+        self._meta = meta
+        parts = {}
+        if saved_meta == meta:
+            for path in self.dir.glob("*.mmd"):
+                try:
+                    start, end = (int(n) for n in path.stem.split("-"))
+                    parts[(start, end)] = path.read_text(encoding="utf-8")
+                except (ValueError, OSError):
+                    continue
+        return parts
+
+    def save(self, start, end, text):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        meta_path = self.dir / "meta.json"
+        if self._meta is not None and not meta_path.exists():
+            meta_path.write_text(json.dumps(self._meta), encoding="utf-8")
+        path = self.dir / f"{start:05d}-{end:05d}.mmd"
+        # Escritura atomica: un corte a mitad de escritura no deja una pagina a medias
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+class _OutputMonitor:
+    # Lee la salida combinada del CLI de Nougat mientras corre. Las lineas normales van al log
+    # en cuanto llegan; las de progreso de tqdm (reescritas con \r) se resumen cada
+    # `interval` segundos como paginas completadas. Guarda las ultimas lineas para el error.
+    def __init__(self, stream, prefix, n_pages=None, interval=30, log=print, tail_lines=40):
+        self.stream = stream
+        self.prefix = prefix
+        self.n_pages = n_pages
+        self.interval = interval
+        self.log = log
+        self.tail = deque(maxlen=tail_lines)
+        self.done = 0
+        self.total = 0
+        self.last_activity = time.time()
+        self._last_report = 0.0
+        self._reported = None
+        self._thread = threading.Thread(target=self._read, name=f"salida-{prefix}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _read(self):
+        pending = b""
+        while True:
+            try:
+                chunk = self.stream.read1(65536)
+            except (OSError, ValueError):
+                break
+            if not chunk:
+                break
+            *lines, pending = OUTPUT_LINE_RE.split(pending + chunk)
+            for line in lines:
+                self._line(line)
+        self._line(pending)
+
+    def _line(self, raw):
+        line = raw.decode("utf-8", errors="replace").strip()
+        if not line:
+            return
+        self.last_activity = time.time()
+        m = TQDM_PROGRESS_RE.search(line)
+        if m is None:
+            self.tail.append(line)
+            self.log(f"{self.prefix}: {line}")
+            return
+        self.done, self.total = int(m.group(2)), int(m.group(3))
+        if self.last_activity - self._last_report >= self.interval:
+            self.report_progress()
+
+    def progress(self):
+        # tqdm cuenta lotes; las paginas se estiman en proporcion (exacto al terminar cada lote)
+        if not self.total:
+            return "sin progreso informado"
+        if self.n_pages:
+            pages = min(self.n_pages, round(self.done * self.n_pages / self.total))
+            return f"{pages}/{self.n_pages} páginas ({self.done}/{self.total} lotes)"
+        return f"{self.done}/{self.total} lotes"
+
+    def report_progress(self):
+        self._last_report = time.time()
+        text = self.progress()
+        if text != self._reported:
+            self._reported = text
+            self.log(f"{self.prefix}: {text}")
+
+class SubprocessEngine:
+    name = "subprocess"
+
+    def __init__(self, nougat_cmd, out_dir, model_size, shard_pages=None, shard_workers=None, checkpoint_dir=None,
+                 timeout=None, stall_timeout=None, progress_interval=30, torch_threads=None, log=print):
+        self.nougat_cmd = nougat_cmd
+        self.out_dir = Path(out_dir)
+        self.model_size = model_size
+        # PDFs con mas de `shard_pages` paginas se dividen en rangos que corren en paralelo
+        self.shard_pages = shard_pages
+        self.shard_workers = shard_workers or os.cpu_count() or 1
+        # Hilos de torch en total; en un PDF dividido se reparten entre sus procesos
+        self.torch_threads = torch_threads
+        # Con checkpoint, cada fragmento terminado se guarda y no se repite al reanudar
+        self.checkpoint_dir = checkpoint_dir
+        # Segundos maximos por ejecucion del CLI (documento o fragmento) y sin ninguna salida nueva
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.progress_interval = progress_interval
+        self.log = log
+        self._started = time.time()
+        self.pages_done = 0
+        # Documentos que conviene tener en curso a la vez (el CLI procesa uno por vez)
+        self.max_inflight = 1
+
+    def process(self, pdf_path, key=None):
+        pdf_path = Path(pdf_path)
+        n_pages = count_pages(pdf_path)
+        if self.shard_pages and n_pages > self.shard_pages:
+            mmd_path = self._process_sharded(pdf_path, n_pages, key)
+        else:
+            self._run(pdf_path, self.out_dir, env=self._thread_env(self.torch_threads), n_pages=n_pages)
+            mmd_path = self.out_dir / f"{pdf_path.stem}.mmd"
+        self.pages_done += n_pages
+        return mmd_path
+
+    def _run(self, pdf_path, out_dir, pages=None, env=None, n_pages=None):
+        cmd = [self.nougat_cmd, str(pdf_path), "-o", str(out_dir), "--model", self.model_size, "--no-skipping"]
+        label = "Nougat"
+        if pages:
+            cmd += ["--pages", pages]
+            label = f"Nougat [{pages}]"
+
+        # stdout y stderr en un solo flujo leido en vivo: nada se acumula hasta que el proceso termina
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        monitor = _OutputMonitor(proc.stdout, f"{label} {pdf_path.name}", n_pages, self.progress_interval, self.log).start()
+        started = time.time()
+        stopped = None
+        while stopped is None:
+            try:
+                proc.wait(timeout=1)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            now = time.time()
+            if self.timeout and now - started > self.timeout:
+                stopped = f"superó el límite de {self.timeout:g}s"
+            elif self.stall_timeout and now - monitor.last_activity > self.stall_timeout:
+                stopped = f"sin salida nueva durante {self.stall_timeout:g}s"
+        if stopped is not None:
+            proc.kill()
+            proc.wait()
+        # Un nieto que herede la tuberia podria mantenerla abierta tras matar al proceso
+        monitor.join(5 if stopped is not None else None)
+        proc.stdout.close()
+        if monitor.total:
+            monitor.report_progress()
+
+        if stopped is not None:
+            # TimeoutError: el pipeline conserva las paginas guardadas para el reintento
+            raise TimeoutError(f"{label} detenido: {stopped} ({monitor.progress()})")
+        if proc.returncode != 0:
+            err_msg = "\n".join(monitor.tail) or "Error desconocido de Nougat"
+            raise Exception(f"{label} falló (Código {proc.returncode}): {err_msg}")
+
+    @staticmethod
+    def _thread_env(threads):
+        if not threads:
+            return None
+        env = dict(os.environ)
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+            env.setdefault(var, str(threads))
+        return env
+
+    def _process_sharded(self, pdf_path, n_pages, key=None):
+        ranges = [(start, min(start + self.shard_pages, n_pages)) for start in range(0, n_pages, self.shard_pages)]
+        checkpoint = PageCheckpoint(self.checkpoint_dir, key) if self.checkpoint_dir and key else None
+        saved = checkpoint.load(n_pages, self.model_size) if checkpoint else {}
+        saved = {r: saved[r] for r in ranges if r in saved}
+        if saved:
+            self.log(f"Reanudando {pdf_path.name}: {len(saved)} de {len(ranges)} fragmentos recuperados del checkpoint.")
+        todo = [(i, start, end) for i, (start, end) in enumerate(ranges) if (start, end) not in saved]
+        workers = max(1, min(self.shard_workers, len(todo)))
+        self.log(f"Dividiendo {pdf_path.name} ({n_pages} páginas) en {len(ranges)} fragmentos con {workers} procesos en paralelo.")
+
+        # Repartir los hilos de torch entre los procesos para no saturar la CPU
+        env = self._thread_env(max(1, (self.torch_threads or os.cpu_count() or 1) // workers))
+
+        shard_root = self.out_dir / ".shards" / pdf_path.stem
+        shutil.rmtree(shard_root, ignore_errors=True)
+
+        def run_shard(index, start, end):
+            # Cada fragmento escribe en su propia carpeta: Nougat nombra la salida igual que el PDF
+            shard_dir = shard_root / f"{index:04d}"
+            shard_dir.mkdir(parents=True, exist_ok=True)
+            self._run(pdf_path, shard_dir, pages=f"{start + 1}-{end}", env=env, n_pages=end - start)
+            with open(shard_dir / f"{pdf_path.stem}.mmd", "r", encoding="utf-8") as f:
+                text = renumber_missing_pages(f.read(), start)
+            if checkpoint:
+                checkpoint.save(start, end, text)
+            return text
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            done = dict(zip((ranges[i] for i, _, _ in todo), pool.map(lambda args: run_shard(*args), todo)))
+        parts = [saved[r] if r in saved else done[r] for r in ranges]
+
+        mmd_path = self.out_dir / f"{pdf_path.stem}.mmd"
+        mmd_path.write_text(join_pages(part + "\n\n" for part in parts), encoding="utf-8")
+        shutil.rmtree(shard_root, ignore_errors=True)
+        try:
+            shard_root.parent.rmdir()
+        except OSError:
+            pass
+        return mmd_path
+
+    def report(self):
+        self.log(format_throughput(self.name, self.pages_done, time.time() - self._started))
+
+    def close(self):
+        # Cada ejecucion del CLI termina dentro de process(): no queda nada abierto
+        pass
+
+class _DocumentJob:
+    def __init__(self, pdf_path, future, pdf, checkpoint=None):
+        self.pdf_path = pdf_path
+        self.future = future
+        self.pdf = pdf
+        self.n_pages = len(pdf)
+        self.checkpoint = checkpoint
+        self.pages = {}
+        self.todo = deque()
+        self.failed = False
+
+class InProcessEngine:
+    name = "inprocess"
+
+    def __init__(self, out_dir, model_size, batch_size=None, batch_wait=0.5, checkpoint_dir=None, result_cache=None,
+                 route_pages=False, torch_threads=None, log=print):
+        self.out_dir = Path(out_dir)
+        self.model_size = model_size
+        self.batch_size = batch_size
+        # Segundos que se espera a que lleguen mas PDFs antes de lanzar un lote incompleto
+        self.batch_wait = batch_wait
+        # Con checkpoint, cada pagina decodificada se guarda en cuanto sale del lote
+        self.checkpoint_dir = checkpoint_dir
+        # Paginas con el mismo raster ya inferidas (en este u otro PDF) salen de la cache
+        self.result_cache = result_cache
+        # Con pre-clasificacion, las paginas de prosa con capa de texto limpia no pasan por el modelo
+        self.route_pages = route_pages
+        self.torch_threads = torch_threads
+        self.log = log
+        self._model = None
+        self._queue = queue.Queue()
+        self._pending = deque()
+        self._thread = None
+        self._started = None
+        self.pages_done = 0
+        self.cached_pages = 0
+        self.routed_pages = Counter()
+        self.route_seconds = 0.0
+        self.batches = 0
+        self.inference_seconds = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._load_model()
+            self._started = time.time()
+            self._thread = threading.Thread(target=self._worker, name="nougat-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def _load_model(self):
+        from nougat import NougatModel
+        from nougat.utils.checkpoint import get_checkpoint
+        from nougat.utils.device import move_to_device, default_batch_size
+
+        t0 = time.time()
+        if self.torch_threads:
+            import torch
+            torch.set_num_threads(self.torch_threads)
+        if not self.batch_size:
+            self.batch_size = default_batch_size()
+        checkpoint = get_checkpoint(None, model_tag=self.model_size)
+        model = NougatModel.from_pretrained(checkpoint)
+        model = move_to_device(model, bf16=True, cuda=self.batch_size > 0)
+        model.eval()
+        self.batch_size = max(self.batch_size, 1)
+        self._model = model
+        self.log(f"Modelo Nougat {self.model_size} cargado en {time.time() - t0:.1f}s (batch={self.batch_size}).")
+
+    def calibrate(self, image, batch_sizes):
+        # Mide paginas/s con una pagina de muestra para cada tamaño de lote candidato y deja el
+        # mas rapido. Debe llamarse antes de enviar documentos (el hilo del motor esta ocioso).
+        tensor = self._model.encoder.prepare_input(image, random_padding=False)
+        self._infer([tensor])  # Calentamiento: la primera inferencia incluye inicializaciones
+        rates = {}
+        for size in batch_sizes:
+            t0 = time.time()
+            self._infer([tensor] * size)
+            rates[size] = size / max(time.time() - t0, 1e-9)
+        self.batch_size = max(rates, key=rates.get)
+        return rates
+
+    def submit(self, pdf_path, key=None):
+        future = Future()
+        self._queue.put((Path(pdf_path), future, key))
+        return future
+
+    def process(self, pdf_path, key=None):
+        return self.submit(pdf_path, key).result()
+
+    @property
+    def max_inflight(self):
+        # Con mas documentos en curso que paginas por lote, los lotes siempre pueden llenarse
+        return (self.batch_size or 1) + 1
+
+    def report(self):
+        if self._started is None:
+            return
+        fill = self.pages_done / (self.batches * self.batch_size) if self.batches else 0.0
+        rate = self.pages_done / self.inference_seconds if self.inference_seconds > 0 else 0.0
+        extra = f" (inferencia {rate:.2f} pág/s, {self.batches} lotes de {self.batch_size}, llenado medio {fill:.0%})"
+        if self.cached_pages:
+            extra += f", {self.cached_pages} páginas desde la caché de resultados"
+        self.log(format_throughput(self.name, self.pages_done, time.time() - self._started, extra))
+        if self.route_pages:
+            self.log(self.routing_summary())
+
+    def routing_summary(self):
+        routed = sum(n for route, n in self.routed_pages.items() if route != page_classifier.ROUTE_NOUGAT)
+        total = sum(self.routed_pages.values())
+        detail = ", ".join(f"{route} {n}" for route, n in sorted(self.routed_pages.items()) if route != page_classifier.ROUTE_NOUGAT)
+        summary = f"Pre-clasificación: {routed} de {total} páginas fuera de Nougat ({detail or 'ninguna'}) en {self.route_seconds:.1f}s"
+        if not self.pages_done:
+            return summary + "; sin inferencias para estimar el ahorro."
+        # Ahorro estimado con el tiempo medio de inferencia por pagina de esta misma ejecucion
+        saved = routed * self.inference_seconds / self.pages_done - self.route_seconds
+        return summary + f"; ~{saved:.1f}s de inferencia ahorrados."
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _worker(self):
+        # Las paginas de todos los PDFs en cola comparten un mismo pool, de modo que
+        # los lotes se llenan aunque cada documento tenga pocas paginas.
+        closing = False
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                if not self._pending:
+                    if closing:
+                        break
+                    try:
+                        item = self._queue.get(timeout=self.batch_wait) if batch else self._queue.get()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        closing = True
+                    else:
+                        self._open_job(*item)
+                    continue
+
+                job = self._pending[0]
+                page_idx = job.todo.popleft()
+                if not job.todo:
+                    self._pending.popleft()
+                try:
+                    entry = self._prepare(job, page_idx)
+                except Exception as e:
+                    self._fail(job, e)
+                    continue
+                if entry is not None:
+                    batch.append(entry)
+
+            if batch:
+                self._run_batch(batch)
+            elif closing:
+                break
+
+    def _open_job(self, pdf_path, future, key=None):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            import pypdfium2 as pdfium
+            checkpoint = PageCheckpoint(self.checkpoint_dir, key) if self.checkpoint_dir and key else None
+            with post_processor.PDFIUM_LOCK:
+                job = _DocumentJob(pdf_path, future, pdfium.PdfDocument(str(pdf_path)), checkpoint)
+            if checkpoint:
+                for (start, end), text in checkpoint.load(job.n_pages, self.model_size).items():
+                    if end == start + 1 and start < job.n_pages:
+                        job.pages[start] = text
+        except BaseException as e:
+            future.set_exception(e)
+            return
+        job.todo.extend(i for i in range(job.n_pages) if i not in job.pages)
+        if job.pages:
+            self.log(f"Reanudando {pdf_path.name}: {len(job.pages)} de {job.n_pages} páginas recuperadas del checkpoint.")
+        self.log(f"Nougat (en proceso): {pdf_path.name} con {len(job.todo)} páginas en cola.")
+        if not job.todo:
+            self._finish(job)
+        else:
+            self._pending.append(job)
+
+    def _fail(self, job, error):
+        if job.failed:
+            return
+        job.failed = True
+        if job in self._pending:
+            self._pending.remove(job)
+        with post_processor.PDFIUM_LOCK:
+            job.pdf.close()
+        job.future.set_exception(error)
+
+    def _finish(self, job):
+        try:
+            with post_processor.PDFIUM_LOCK:
+                job.pdf.close()
+            mmd_path = self.out_dir / f"{job.pdf_path.stem}.mmd"
+            mmd_path.write_text(join_pages(job.pages[i] for i in range(job.n_pages)), encoding="utf-8")
+            job.future.set_result(mmd_path)
+        except BaseException as e:
+            job.future.set_exception(e)
+
+    def _route(self, job, page_idx, page):
+        t0 = time.time()
+        try:
+            route, _, markdown = page_classifier.classify_page(page)
+        except Exception:
+            route = page_classifier.ROUTE_NOUGAT
+        self.route_seconds += time.time() - t0
+        self.routed_pages[route] += 1
+        if route == page_classifier.ROUTE_NOUGAT:
+            return False
+        if route == page_classifier.ROUTE_TESSERACT:
+            # La etapa de OCR recupera con Tesseract las paginas marcadas como vacias
+            markdown = f"\n\n[MISSING_PAGE_EMPTY:{page_idx + 1}]\n\n"
+        self._store_page(job, page_idx, markdown)
+        return True
+
+    def _prepare(self, job, page_idx):
+        # Clasificacion y renderizado bajo el candado global de pdfium (lo comparten las etapas)
+        with post_processor.PDFIUM_LOCK:
+            page = job.pdf[page_idx]
+            try:
+                if self.route_pages and self._route(job, page_idx, page):
+                    return None
+                img = page.render(scale=RASTER_DPI / 72).to_pil()
+            finally:
+                page.close()
+        key = None
+        if self.result_cache is not None:
+            key = self.result_cache.image_key(img, f"nougat:{self.model_size}")
+            cached = self.result_cache.get(key, "nougat")
+            if cached is not None:
+                self.cached_pages += 1
+                self._complete_page(job, page_idx, cached)
+                return None
+        return job, page_idx, self._model.encoder.prepare_input(img, random_padding=False), key
+
+    def _infer(self, tensors):
+        import torch
+        outputs = [None] * len(tensors)
+        valid = [i for i, t in enumerate(tensors) if t is not None]
+        if valid:
+            with torch.no_grad():
+                result = self._model.inference(image_tensors=torch.stack([tensors[i] for i in valid]), early_stopping=False)
+            for i, prediction in zip(valid, result["predictions"]):
+                outputs[i] = prediction
+        return outputs
+
+    def _run_batch(self, batch):
+        batch = [entry for entry in batch if not entry[0].failed]
+        if not batch:
+            return
+        t0 = time.time()
+        try:
+            predictions = self._infer([tensor for _, _, tensor, _ in batch])
+        except Exception as e:
+            for job, *_ in batch:
+                self._fail(job, e)
+            return
+        self.inference_seconds += time.time() - t0
+        self.pages_done += len(batch)
+        self.batches += 1
+
+        # Cada pagina decodificada vuelve a su PDF de origen y a su indice de pagina. Un error al
+        # armar una pagina falla solo su documento: el hilo de trabajo sigue con los demas.
+        for (job, page_idx, _, key), prediction in zip(batch, predictions):
+            if job.failed:
+                continue
+            try:
+                if key is not None and prediction is not None:
+                    # Se guarda la prediccion cruda: el numero de pagina se aplica al usarla
+                    try:
+                        self.result_cache.put(key, prediction)
+                    except OSError as e:
+                        self.log(f"No se pudo guardar la página {page_idx + 1} de {job.pdf_path.name} en la caché de resultados: {e}")
+                self._complete_page(job, page_idx, prediction)
+            except Exception as e:
+                self._fail(job, e)
+
+    def _complete_page(self, job, page_idx, prediction):
+        self._store_page(job, page_idx, page_markdown(prediction, page_idx + 1))
+
+    def _store_page(self, job, page_idx, markdown):
+        job.pages[page_idx] = markdown
+        if job.checkpoint:
+            try:
+                job.checkpoint.save(page_idx, page_idx + 1, job.pages[page_idx])
+            except OSError as e:
+                self.log(f"No se pudo guardar el checkpoint de la página {page_idx + 1} de {job.pdf_path.name}: {e}")
+        if len(job.pages) == job.n_pages:
+            self._finish(job)
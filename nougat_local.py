@@ -6,14 +6,73 @@ import datetime
 import hashlib
 import re
 import sys
-import subprocess
+import threading
+import contextlib
+import uuid
+import socket
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import post_processor
+import nougat_engine
+import stage_pipeline
+import folder_watcher
+import result_cache
+import run_metrics
+import hardware_profile
+import job_scheduler
+import work_leases
 
 BASE_DIR = Path(os.getcwd())
-MODEL_SIZE = "0.1.0-small" # [Opciones: "0.1.0-small", "0.1.0-base"]
+MODEL_SIZE = "auto"        # [Opciones: "auto" (segun el hardware), "0.1.0-small", "0.1.0-base"]
 FORCE_REPROCESS = False    # Cambiar a True para forzar el procesamiento de archivos ya registrados
 LATEX_LANGUAGE = "spanish" # Idioma para el paquete babel de LaTeX (e.g. "spanish", "english")
+NOUGAT_ENGINE = "inprocess" # [Opciones: "inprocess" (modelo cargado una sola vez), "subprocess" (CLI por PDF)]
+AUTO_TUNE = True           # Elegir modelo, lote, hilos de torch y procesos segun nucleos, memoria y GPU, y calibrar el lote una vez por maquina
+TORCH_THREADS = None       # Hilos de torch para la inferencia (None = automatico)
+NOUGAT_BATCH_SIZE = None   # Paginas por lote (compartido entre PDFs) en el motor en proceso (None = automatico)
+NOUGAT_SHARD_PAGES = 50    # Motor subprocess: PDFs con mas paginas se dividen en rangos procesados en paralelo (None = desactivado)
+NOUGAT_SHARD_WORKERS = None # Procesos Nougat simultaneos por PDF dividido (None = automatico; 1 con GPU)
+NOUGAT_TIMEOUT = None      # Motor subprocess: segundos maximos por ejecucion del CLI (documento o fragmento; None = sin limite)
+NOUGAT_STALL_TIMEOUT = None # Motor subprocess: segundos sin salida del CLI antes de matarlo (None = esperar siempre; en CPU una pagina densa tarda minutos, fijarlo por encima de la mas lenta)
+NOUGAT_PROGRESS_INTERVAL = 30 # Segundos entre lineas de progreso (paginas completadas) del CLI en el log
+PAGE_CHECKPOINTS = True    # Guardar en checkpoint/pages/ el Markdown de cada pagina (o fragmento) decodificado para reanudar tras un corte
+PAGE_ROUTING = False       # Motor en proceso: pre-clasificar paginas; la prosa con capa de texto limpia se extrae sin Nougat (las vacias no llegan al reporte de auditoria)
+PAGE_RESULT_CACHE_MB = 1024 # Tope en disco de la cache de resultados por pagina (Nougat + Tesseract) entre PDFs (0 = desactivada)
+OCR_WORKERS = None         # Paginas recuperadas con Tesseract en paralelo (None = nucleos disponibles)
+OCR_USE_PROCESSES = False  # True = renderizado y OCR en procesos separados (tambien paraleliza el renderizado)
+RAG_JSON_MODE = "json"     # [Opciones: "json" (documento completo), "stream" (escritura incremental, memoria acotada), "jsonl" (una seccion por linea)]
+RAG_JSON_COMPACT = False   # True = JSON sin indentacion (modos "json" y "stream")
+PANDOC_SERVER = True       # Mantener un `pandoc server` (pandoc >= 3) durante toda la ejecucion en lugar de un proceso por documento
+PANDOC_TIMEOUT = 120       # Segundos maximos de conversion Pandoc por documento
+PAGE_IMAGE_CACHE_MB = 256  # Memoria maxima por documento para paginas renderizadas (auditoria + OCR)
+OCR_DPI = 200              # Resolucion con la que se rasterizan las paginas para Tesseract
+OCR_MAX_PIXELS = 6_000_000 # Tope de pixeles por pagina para el OCR: planos y laminas de gran formato se renderizan a menos ppp
+OCR_GRAYSCALE = True       # Renderizar en escala de grises para el OCR (Tesseract convierte a grises de todos modos)
+AUDIT_DPI = 96             # Resolucion de las paginas incrustadas en el reporte de auditoria
+AUDIT_MAX_PIXELS = 1_500_000 # Tope de pixeles por pagina en el reporte de auditoria
+AUDIT_GRAYSCALE = True     # Paginas del reporte en escala de grises (con OCR_GRAYSCALE, se reutiliza el renderizado del OCR)
+AUDIT_IMAGE_FORMAT = "JPEG" # [Opciones: "JPEG" (con perdida, compacto), None (sin perdida)]; un PDF no admite WebP
+AUDIT_JPEG_QUALITY = 70    # Calidad JPEG de las paginas del reporte de auditoria
+HASH_WORKERS = None        # Archivos hasheados en paralelo cuando cambian (None = min(8, nucleos))
+HASH_CHUNK_SIZE = 1024 * 1024 # Bytes por lectura al calcular SHA-256
+MMD_READ_CHUNK = 4 * 1024 * 1024 # Caracteres por lectura al cargar un .mmd (acota la copia temporal del decodificado)
+WATCH_MODE = False         # True (o `--watch`) = modo demonio: el motor queda cargado y se procesan los PDFs que lleguen a input/
+WATCH_DEBOUNCE = 2.0       # Segundos sin cambios de tamaño/mtime antes de considerar completo un PDF recien copiado
+WATCH_POLL_INTERVAL = 2.0  # Segundos entre sondeos de input/ cuando no hay notificaciones del sistema (watchdog)
+METRICS = True             # Registrar tiempo, CPU, memoria y contadores por documento y etapa en checkpoint/metrics/
+PROFILE_STAGE = None       # Etapa a perfilar con cProfile ("hash", "nougat", "auditoria", "ocr", "json", "latex"; None = ninguna)
+STAGE_WORKERS = {"auditoria": 1, "ocr": 1, "json": 1, "latex": 2} # Hilos por etapa (la etapa "nougat" se ajusta al motor)
+STAGE_QUEUE_SIZE = 2       # Documentos en espera entre etapas consecutivas (colas acotadas)
+STAGE_REPORT_INTERVAL = 60 # Segundos entre reportes de profundidad de colas (None = solo resumen final)
+SCHEDULE_POLICY = "sjf"    # [Opciones: "sjf" (menos paginas primero), "fifo" (orden de llegada), "fifo-cap" (orden de llegada, los PDFs grandes intercalados)]
+SCHEDULE_SIZE_CAP = 100    # Paginas a partir de las cuales "fifo-cap" trata un PDF como grande
+SCHEDULE_LARGE_EVERY = 0   # En "fifo-cap", un PDF grande despues de cada tantos chicos (0 = los grandes al final)
+SCHEDULE_LOG_JOBS = 10     # Trabajos del plan que se muestran en el log con su tiempo estimado
+COORDINATION = False       # True (o `--worker`) = varios nodos comparten input/ y checkpoint/; cada PDF se reclama con un lease
+WORKER_ID = None           # Identificador de este nodo en modo coordinado (None = maquina-pid)
+LEASE_SECONDS = 600        # Segundos sin renovar tras los que el lease de un nodo caido puede tomarlo otro
+LEASE_HEARTBEAT = 30       # Segundos entre renovaciones de los leases propios
+LEASE_POLL_INTERVAL = 5    # Segundos entre reintentos sobre los PDFs que otro nodo tiene en curso
 STRUCTURE = {
     "input": BASE_DIR / "input",
     "output": BASE_DIR / "output",
@@ -21,142 +80,632 @@ STRUCTURE = {
     "checkpoint": BASE_DIR / "checkpoint"
 }
 
-for p in STRUCTURE.values():
-    p.mkdir(parents=True, exist_ok=True)
-
-REGISTRY_PATH = STRUCTURE["checkpoint"] / "registry.json"
+REGISTRY_PATH = STRUCTURE["checkpoint"] / "registry.jsonl"
+LEGACY_REGISTRY_PATH = STRUCTURE["checkpoint"] / "registry.json"
+HASH_CACHE_PATH = STRUCTURE["checkpoint"] / "hash_cache.json"
+PAGE_CHECKPOINT_DIR = STRUCTURE["checkpoint"] / "pages"
+PAGE_RESULT_CACHE_DIR = STRUCTURE["checkpoint"] / "page_results"
+HARDWARE_PROFILE_PATH = STRUCTURE["checkpoint"] / "hardware_profile.json"
+TOOL_PATHS_PATH = STRUCTURE["checkpoint"] / "tool_paths.json"
+METRICS_DIR = STRUCTURE["checkpoint"] / "metrics"
 LOG_PATH = STRUCTURE["checkpoint"] / "pipeline.log"
+LEASE_DIR = STRUCTURE["checkpoint"] / "leases"
+
+def configure_worker(worker_id):
+    # Modo coordinado: lo propio de cada maquina (rutas de herramientas, perfil de hardware) y
+    # de cada proceso (log) va en archivos separados; el registro y las caches se comparten
+    global LOG_PATH, TOOL_PATHS_PATH, HARDWARE_PROFILE_PATH
+    host = socket.gethostname()
+    LOG_PATH = STRUCTURE["checkpoint"] / f"pipeline-{worker_id}.log"
+    TOOL_PATHS_PATH = STRUCTURE["checkpoint"] / f"tool_paths-{host}.json"
+    HARDWARE_PROFILE_PATH = STRUCTURE["checkpoint"] / f"hardware_profile-{host}.json"
+
+def ensure_structure():
+    # Las carpetas se crean al ejecutar el pipeline, no al importar el modulo (benchmarks, herramientas)
+    for p in STRUCTURE.values():
+        p.mkdir(parents=True, exist_ok=True)
 
 def log_message(msg):
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {msg}\n")
+    try:
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(f"[{timestamp}] {msg}\n")
+    except FileNotFoundError:
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(f"[{timestamp}] {msg}\n")
     print(f"[{timestamp}] {msg}")
 
 class PipelineState:
-    def __init__(self, path):
-        self.path = path
-        self.state = self._load()
+    # Registro append-only (JSON Lines): cada documento agrega una linea con fsync en O(1), sin
+    # reescribir el archivo. Al cargar se reproduce el log; una linea truncada por un corte se ignora.
+    # Con `shared` varios procesos o nodos escriben el mismo registro: cada escritura toma un
+    # candado del sistema (`<registro>.lock`) y `refresh()` incorpora las lineas de los demas.
+    def __init__(self, path, legacy_path=None, compact_min_lines=1000, shared=False):
+        self.path = Path(path)
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.compact_min_lines = compact_min_lines
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._file_lock = work_leases.FileLock(self.path.with_name(self.path.name + ".lock")) if shared else None
+        self.state = {"processed": {}, "failed": {}}
+        self._lines = 0
+        self._offset = 0
+        self._identity = None
+        with self._exclusive():
+            self._migrate_legacy()
+            self._load()
+        # Compactacion periodica: solo cuando el log acumula muchas entradas reemplazadas
+        if self._lines > max(self.compact_min_lines, 2 * self._entries()):
+            self.compact()
+
+    def _exclusive(self):
+        return self._file_lock if self._file_lock is not None else contextlib.nullcontext()
+
+    def _entries(self):
+        return len(self.state["processed"]) + len(self.state["failed"])
+
+    def _migrate_legacy(self):
+        # Un registry.json de versiones anteriores se convierte una sola vez y se conserva como respaldo
+        if self.path.exists() or not self.legacy_path or not self.legacy_path.exists():
+            return
+        with open(self.legacy_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        self.state["processed"].update(legacy.get("processed", {}))
+        self.state["failed"].update(legacy.get("failed", {}))
+        self._rewrite()
+        self.legacy_path.replace(self.legacy_path.with_name(self.legacy_path.name + ".migrated"))
+        log_message(f"Registro migrado a {self.path.name}: {self._entries()} entradas.")
 
     def _load(self):
-        if self.path.exists():
-            with open(self.path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {"processed": {}, "failed": {}}
+        # Lee las lineas agregadas desde la ultima lectura (todas, la primera vez). En modo
+        # compartido una linea sin salto final puede estar escribiendose: queda para la proxima.
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            identity = (st.st_dev, st.st_ino)
+            if identity != self._identity or st.st_size < self._offset:
+                # Primera lectura, o el archivo fue reemplazado por la compactacion de otro nodo
+                if self._identity is not None:
+                    self.state = {"processed": {}, "failed": {}}
+                self._identity = identity
+                self._offset = 0
+                self._lines = 0
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1 if self.shared else len(data)
+        self._offset += end
+        skipped = 0
+        for line in data[:end].split(b"\n"):
+            if not line.strip():
+                continue
+            self._lines += 1
+            try:
+                self._apply(json.loads(line.decode("utf-8")))
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+        if skipped:
+            log_message(f"ADVERTENCIA: {skipped} líneas ilegibles ignoradas en {self.path.name}.")
 
-    def save(self):
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(self.state, f, indent=2)
+    def refresh(self):
+        # Incorpora lo que registraron otros nodos desde la ultima lectura
+        if self.shared:
+            with self._lock:
+                self._load()
+
+    def _apply(self, record):
+        record = dict(record)
+        status = record.pop("status")
+        file_hash = record.pop("hash")
+        self.state[status][file_hash] = record
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with open(self.path, "a+b") as f:
+            # Si un corte dejo la ultima linea incompleta, la nueva entrada empieza en su propia linea
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = "\n" + line
+            f.write(line.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self._lines += 1
+
+    def _record(self, status, file_hash, fields):
+        record = {"status": status, "hash": file_hash, **fields}
+        with self._lock, self._exclusive():
+            if self.shared:
+                # Primero lo ajeno: la linea propia queda como la ultima palabra sobre este documento
+                self._load()
+            self._append(record)
+            if self.shared:
+                self._offset = os.path.getsize(self.path)
+            self._apply(record)
+
+    def _rewrite(self):
+        tmp_path = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for status in ("processed", "failed"):
+                for file_hash, entry in self.state[status].items():
+                    f.write(json.dumps({"status": status, "hash": file_hash, **entry}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._identity = (st.st_dev, st.st_ino)
+        self._offset = st.st_size
+        self._lines = self._entries()
+
+    def compact(self):
+        # Reescribe el log con una linea por entrada vigente; el reemplazo es atomico
+        with self._lock, self._exclusive():
+            if self.shared:
+                self._load()
+            self._rewrite()
 
     def is_processed(self, file_hash):
         return file_hash in self.state["processed"]
 
-    def mark_success(self, file_hash, filename, output_path):
-        self.state["processed"][file_hash] = {
+    def mark_success(self, file_hash, filename, output_path, pages=None, seconds=None):
+        fields = {
             "filename": filename,
             "output": str(output_path),
             "timestamp": str(datetime.datetime.now())
         }
-        self.save()
+        # Paginas y segundos en la etapa Nougat: el ritmo historico con el que se estiman los tiempos
+        if pages:
+            fields["pages"] = pages
+        if seconds is not None:
+            fields["seconds"] = round(seconds, 3)
+        self._record("processed", file_hash, fields)
+
+    def pages_per_second(self):
+        return job_scheduler.historical_rate(list(self.state["processed"].values()))
 
     def mark_failed(self, file_hash, filename, error):
-        self.state["failed"][file_hash] = {
+        self._record("failed", file_hash, {
             "filename": filename,
             "error": str(error),
             "timestamp": str(datetime.datetime.now())
-        }
-        self.save()
+        })
 
-def get_file_hash(path):
+def get_file_hash(path, chunk_size=HASH_CHUNK_SIZE):
+    # Lecturas grandes sobre un buffer reutilizado; hashlib libera el GIL, asi que varios
+    # archivos pueden hashearse en paralelo desde hilos
     sha256 = hashlib.sha256()
-    with open(path, "rb") as f:
-        while chunk := f.read(8192):
-            sha256.update(chunk)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while n := f.readinto(buf):
+            sha256.update(view[:n])
     return sha256.hexdigest()
 
-def extract_structured_data(mmd_path):
-    print(f"Buscando estructuras en {mmd_path.name}...")
+class HashCache:
+    # SHA-256 de cada PDF, reutilizado mientras no cambien su ruta, tamaño, mtime ni inodo.
+    # Evita releer todo `input/` en cada arranque solo para descubrir que ya estaba procesado.
+    def __init__(self, path, racy_seconds=2.0):
+        self.path = Path(path)
+        # Un archivo modificado hace menos de `racy_seconds` puede seguir escribiendose con el
+        # mismo mtime: su hash se calcula pero no se guarda
+        self.racy_seconds = racy_seconds
+        self.entries = self._load()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        # Nombre temporal unico: en modo coordinado varios nodos guardan la misma cache. Si el
+        # reemplazo falla (p. ej. otro nodo la tiene abierta en Windows) solo se pierde la cache
+        tmp_path = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log_message(f"No se pudo guardar la caché de hashes en {self.path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _signature(st):
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    @staticmethod
+    def _hash_or_error(path):
+        try:
+            return get_file_hash(path), None
+        except OSError as e:
+            return None, e
+
+    def hash_files(self, paths, workers=None, prune=True):
+        # Un PDF movido o borrado entre el listado y el hash (otro nodo, el usuario) queda fuera del resultado
+        hashes = {}
+        entries = {} if prune else dict(self.entries)
+        pending = []
+        now = time.time()
+        for path in paths:
+            key = str(Path(path).resolve())
+            try:
+                signature = self._signature(os.stat(path))
+            except OSError as e:
+                log_message(f"Omitiendo {Path(path).name}: no se pudo leer ({e}).")
+                continue
+            entry = self.entries.get(key)
+            if entry and entry[:3] == signature:
+                hashes[path] = entry[3]
+                entries[key] = entry
+                self.hits += 1
+            else:
+                pending.append((path, key, signature))
+
+        if pending:
+            workers = min(workers or min(8, os.cpu_count() or 1), len(pending))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for (path, key, signature), (file_hash, error) in zip(pending, pool.map(lambda item: self._hash_or_error(item[0]), pending)):
+                    if error is not None:
+                        log_message(f"Omitiendo {Path(path).name}: no se pudo leer ({error}).")
+                        continue
+                    hashes[path] = file_hash
+                    if now - signature[1] / 1e9 >= self.racy_seconds:
+                        entries[key] = signature + [file_hash]
+
+        self.misses += len(pending)
+        # Con `prune` solo se conservan los archivos recibidos: la cache no crece con PDFs ya movidos o borrados
+        if entries != self.entries:
+            self.entries = entries
+            self.save()
+        return hashes
+
+class ToolPaths:
+    # Rutas de ejecutables externos (nougat, pandoc, tesseract) encontradas en ejecuciones
+    # anteriores. Cada entrada guarda el tamaño y mtime del ejecutable: si ya no existe o cambio,
+    # se vuelve a buscar. Evita recorrer %APPDATA% o importar pypandoc en cada arranque.
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.changed = False
+
+    @staticmethod
+    def _signature(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def find(self, name, discover):
+        entry = self.entries.get(name)
+        if entry:
+            try:
+                if self._signature(entry["path"]) == entry["signature"]:
+                    return entry["path"]
+            except OSError:
+                pass
+            log_message(f"La ruta guardada de {name} ({entry['path']}) ya no es válida. Buscando de nuevo...")
+        path = discover()
+        # Solo se guardan ejecutables que existen: un nombre sin ruta se vuelve a buscar la proxima vez
+        if path and os.path.isfile(path):
+            self.entries[name] = {"path": str(path), "signature": self._signature(path)}
+            self.changed = True
+        elif self.entries.pop(name, None) is not None:
+            self.changed = True
+        return path
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            tmp_path = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex[:8]}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self.changed = False
+        except OSError as e:
+            log_message(f"No se pudieron guardar las rutas de herramientas en {self.path}: {e}")
+
+HEADER_PREFIX_PATTERN = re.compile(r'(#{1,4})[^\S\n]+')
+
+# Valor provisional del campo "content" cuando la seccion se escribe por bloques desde el buffer
+SECTION_CONTENT_PLACEHOLDER = "\x00"
+SECTION_CONTENT_JSON = json.dumps(SECTION_CONTENT_PLACEHOLDER)
+
+def _make_section(content, hierarchy, level, start, end, with_text=True):
+    # La seccion es content[start:end]; sin `with_text` el texto no se copia y el escritor lo
+    # toma por bloques del buffer del documento
+    hierarchy_path = [h for h in hierarchy if h]
+    return {
+        "title": hierarchy[level - 1],
+        "hierarchy": hierarchy_path,
+        "full_title": " > ".join(hierarchy_path),
+        "level": level,
+        "content": content[start:end] if with_text else SECTION_CONTENT_PLACEHOLDER,
+        "metrics": {
+            "characters": end - start,
+            "estimated_tokens": int(_word_count(content, start, end) * 1.3)
+        }
+    }
+
+def _word_count(text, start=0, end=None, chunk=64 * 1024):
+    # Igual a len(text[start:end].split()), pero solo existen a la vez las palabras de un bloque:
+    # un documento sin encabezados es una sola seccion y su lista de palabras ocupaba varias
+    # veces el tamaño del archivo
+    end = len(text) if end is None else end
+    count = 0
+    for pos in range(start, end, chunk):
+        part = text[pos:min(pos + chunk, end)]
+        count += len(part.split())
+        # Una palabra cortada entre dos bloques se conto dos veces
+        if pos > start and not part[0].isspace() and not text[pos - 1].isspace():
+            count -= 1
+    return count
+
+def _strip_span(content, start, end):
+    # Desplazamientos de content[start:end].strip(), sin copiar el texto
+    while start < end and content[start].isspace():
+        start += 1
+    while end > start and content[end - 1].isspace():
+        end -= 1
+    return start, end
+
+def _write_section(f, content, start, end, section_json):
+    # `section_json` es la seccion serializada con SECTION_CONTENT_PLACEHOLDER; el texto se
+    # escapa y escribe por bloques. Despues de "content" solo hay numeros, asi que la ultima
+    # aparicion del marcador es la suya aunque un titulo lo contenga.
+    head, tail = section_json.rsplit(SECTION_CONTENT_JSON, 1)
+    f.write(head)
+    f.write('"')
+    for pos in range(start, end, MMD_READ_CHUNK):
+        f.write(json.dumps(content[pos:min(pos + MMD_READ_CHUNK, end)], ensure_ascii=False)[1:-1])
+    f.write('"')
+    f.write(tail)
+
+def scan_mmd(content):
+    # Recorre el documento una sola vez, de izquierda a derecha, y emite en orden:
+    #   ("equation", inicio, fin), ("caption", inicio, fin) y ("section", jerarquia, nivel, inicio, fin)
+    # Cada tipo de estructura tiene su propio cursor (busqueda con str.find) y siempre se
+    # atiende el mas cercano. Los cursores son independientes, asi que un "[caption]" o un
+    # encabezado dentro de una ecuacion se detectan igual que con busquedas separadas.
+    # Las secciones tambien son desplazamientos en el buffer (ya sin espacios en los extremos).
+    find = content.find
+    n = len(content)
+
+    def next_pos(sub, start):
+        pos = find(sub, start)
+        return n if pos == -1 else pos
+
+    def next_header(start):
+        pos = find("\n#", start)
+        return n if pos == -1 else pos + 1
+
+    inline_eq = next_pos("\\(", 0)
+    block_eq = next_pos("\\[", 0)
+    caption = next_pos("[caption]", 0)
+    header = 0 if content.startswith("#") else next_header(0)
+
+    hierarchy = ["Preliminares", "", "", ""]
+    level = 1
+    body_start = 0
+
+    while True:
+        pos = min(inline_eq, block_eq, caption, header)
+        if pos >= n:
+            break
+
+        if pos == header:
+            m = HEADER_PREFIX_PATTERN.match(content, pos)
+            if m:
+                start, end = _strip_span(content, body_start, pos)
+                if start < end:
+                    yield ("section", hierarchy[:], level, start, end)
+                line_end = next_pos("\n", m.end())
+                level = len(m.group(1))
+                hierarchy[level - 1] = content[m.end():line_end].strip()
+                for i in range(level, 4):
+                    hierarchy[i] = ""
+                body_start = line_end + 1
+            header = next_header(pos)
+
+        elif pos == caption:
+            line_end = find("\n", pos + 9)
+            if line_end == -1:
+                caption = n
+            else:
+                yield ("caption", pos, line_end + 1)
+                caption = next_pos("[caption]", line_end + 1)
+
+        else:
+            is_inline = pos == inline_eq
+            end = find("\\)" if is_inline else "\\]", pos + 2)
+            if end == -1:
+                # Sin cierre posterior ninguna apertura de este tipo puede completarse
+                if is_inline:
+                    inline_eq = n
+                else:
+                    block_eq = n
+                continue
+            end += 2
+            yield ("equation", pos, end)
+            if inline_eq < end:
+                inline_eq = next_pos("\\(", end)
+            if block_eq < end:
+                block_eq = next_pos("\\[", end)
+
+    start, end = _strip_span(content, body_start, n)
+    if start < end:
+        yield ("section", hierarchy, level, start, end)
+
+def _read_mmd(mmd_path, chunk=MMD_READ_CHUNK):
+    # Decodifica por bloques: leer el archivo entero de una vez mantenia los bytes y el texto
+    # (mas el bufer del decodificador) a la vez, unas tres veces el tamaño del archivo.
+    # El modo de saltos universal traduce "\r\n" y "\r" a "\n" como read_text().
+    parts = []
     with open(mmd_path, "r", encoding="utf-8") as f:
-        content = f.read()
-    
-    p_inline = r"\\\(.*?\\\)"
-    p_block = r"\\\[.*?\\\]"
-    
-    equations = re.findall(f"{p_inline}|{p_block}", content, re.DOTALL)
-    print(f"Ecuaciones detectadas: {len(equations)}")
-    
-    p_caption = r"\[caption\].*?\n"
-    captions = re.findall(p_caption, content)
-    
+        while True:
+            part = f.read(chunk)
+            if not part:
+                break
+            parts.append(part)
+    return "".join(parts)
+
+def _structured_metadata(mmd_path, equation_count, section_count):
+    return {
+        "source": mmd_path.name,
+        "processed_at": str(datetime.datetime.now()),
+        "equation_count": equation_count,
+        "section_count": section_count
+    }
+
+def extract_structured_data(mmd_path, content=None):
+    # `content`: texto del .mmd ya cargado por el pipeline (se evita releer y decodificar el archivo)
+    print(f"Buscando estructuras en {mmd_path.name}...")
+    if content is None:
+        content = _read_mmd(mmd_path)
+
+    equations = []
+    captions = []
     sections = []
-    current_hierarchy = ["Preliminares", "", "", ""]
-    current_level = 1
-    current_lines = []
-    
-    lines = content.replace("\r\n", "\n").split("\n")
-    for line in lines:
-        header_match = re.match(r'^(#{1,4})\s+(.*)$', line)
-        if header_match:
-            if current_lines:
-                section_text = "\n".join(current_lines).strip()
-                if section_text:
-                    hierarchy_path = [h for h in current_hierarchy if h]
-                    sections.append({
-                        "title": current_hierarchy[current_level - 1],
-                        "hierarchy": hierarchy_path,
-                        "full_title": " > ".join(hierarchy_path),
-                        "level": current_level,
-                        "content": section_text,
-                        "metrics": {
-                            "characters": len(section_text),
-                            "estimated_tokens": int(len(section_text.split()) * 1.3)
-                        }
-                    })
-            level = len(header_match.group(1))
-            title = header_match.group(2).strip()
-            current_level = level
-            current_hierarchy[level - 1] = title
-            for i in range(level, 4):
-                current_hierarchy[i] = ""
-            current_lines = []
+    for token in scan_mmd(content):
+        kind = token[0]
+        if kind == "equation":
+            equations.append(content[token[1]:token[2]])
+        elif kind == "caption":
+            captions.append(content[token[1]:token[2]])
         else:
-            current_lines.append(line)
-            
-    if current_lines:
-        section_text = "\n".join(current_lines).strip()
-        if section_text:
-            hierarchy_path = [h for h in current_hierarchy if h]
-            sections.append({
-                "title": current_hierarchy[current_level - 1],
-                "hierarchy": hierarchy_path,
-                "full_title": " > ".join(hierarchy_path),
-                "level": current_level,
-                "content": section_text,
-                "metrics": {
-                    "characters": len(section_text),
-                    "estimated_tokens": int(len(section_text.split()) * 1.3)
-                }
-            })
+            sections.append(_make_section(content, *token[1:]))
 
+    print(f"Ecuaciones detectadas: {len(equations)}")
     print(f"Secciones identificadas: {len(sections)}")
     return {
-        "metadata": {
-            "source": mmd_path.name,
-            "processed_at": str(datetime.datetime.now()),
-            "equation_count": len(equations),
-            "section_count": len(sections)
-        },
+        "metadata": _structured_metadata(mmd_path, len(equations), len(sections)),
         "equations": equations,
         "captions": captions,
         "sections": sections
     }
 
-def save_structured_json(mmd_path):
+def _json_text(value, indent, level):
+    if indent is None:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    # Los saltos de linea dentro de cadenas van escapados, asi que solo se re-indenta la estructura
+    return json.dumps(value, ensure_ascii=False, indent=indent).replace("\n", "\n" + " " * (indent * level))
+
+def _write_json_array(f, items, indent, level, write_item=None):
+    # `write_item(f, item, nivel)` reemplaza la serializacion directa de cada elemento
+    count = 0
+    for item in items:
+        if indent is None:
+            f.write("[" if count == 0 else ",")
+        else:
+            f.write("[\n" if count == 0 else ",\n")
+            f.write(" " * (indent * (level + 1)))
+        if write_item is None:
+            f.write(_json_text(item, indent, level + 1))
+        else:
+            write_item(f, item, level + 1)
+        count += 1
+    if count == 0:
+        f.write("[]")
+    elif indent is None:
+        f.write("]")
+    else:
+        f.write("\n" + " " * (indent * level) + "]")
+    return count
+
+def write_structured_stream(mmd_path, json_path, compact=False, content=None):
+    # Escribe cada seccion en cuanto el escaner la cierra. De ecuaciones y leyendas solo se
+    # guardan desplazamientos, y los contadores van en "metadata" al final del archivo.
+    print(f"Buscando estructuras en {mmd_path.name}...")
+    if content is None:
+        content = _read_mmd(mmd_path)
+    equation_spans = []
+    caption_spans = []
+
+    def sections():
+        for token in scan_mmd(content):
+            kind = token[0]
+            if kind == "section":
+                yield token
+            elif kind == "equation":
+                equation_spans.append((token[1], token[2]))
+            else:
+                caption_spans.append((token[1], token[2]))
+
+    def write_section(f, token, level):
+        section = _make_section(content, *token[1:], with_text=False)
+        _write_section(f, content, token[3], token[4], _json_text(section, indent, level))
+
+    indent = None if compact else 2
+    key_sep = ":" if compact else ": "
+    item_sep = "," if compact else ",\n  "
+    with open(json_path, "w", encoding="utf-8") as f:
+        f.write("{" if compact else "{\n  ")
+        f.write('"sections"' + key_sep)
+        section_count = _write_json_array(f, sections(), indent, 1, write_section)
+        f.write(item_sep + '"equations"' + key_sep)
+        _write_json_array(f, (content[a:b] for a, b in equation_spans), indent, 1)
+        f.write(item_sep + '"captions"' + key_sep)
+        _write_json_array(f, (content[a:b] for a, b in caption_spans), indent, 1)
+        f.write(item_sep + '"metadata"' + key_sep)
+        metadata = _structured_metadata(mmd_path, len(equation_spans), section_count)
+        f.write(_json_text(metadata, indent, 1))
+        f.write("}" if compact else "\n}")
+
+    print(f"Ecuaciones detectadas: {len(equation_spans)}")
+    print(f"Secciones identificadas: {section_count}")
+    return metadata
+
+def write_structured_jsonl(mmd_path, jsonl_path, content=None):
+    # Una seccion por linea, para cargadores que no deben parsear el documento completo
+    print(f"Buscando estructuras en {mmd_path.name}...")
+    if content is None:
+        content = _read_mmd(mmd_path)
+    section_count = 0
+    equation_count = 0
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for token in scan_mmd(content):
+            if token[0] != "section":
+                equation_count += token[0] == "equation"
+                continue
+            record = {"source": mmd_path.name, "section_index": section_count}
+            record.update(_make_section(content, *token[1:], with_text=False))
+            _write_section(f, content, token[3], token[4], json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            section_count += 1
+    print(f"Secciones identificadas: {section_count}")
+    return _structured_metadata(mmd_path, equation_count, section_count)
+
+def save_structured_json(mmd_path, mode="json", compact=False, counts=None, content=None):
+    # `counts`, si se pasa, recibe los contadores de ecuaciones y secciones para las metricas
     try:
-        structured_data = extract_structured_data(mmd_path)
-        json_path = mmd_path.with_suffix(".json")
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(structured_data, f, indent=2, ensure_ascii=False)
+        if mode == "jsonl":
+            json_path = mmd_path.with_suffix(".jsonl")
+            metadata = write_structured_jsonl(mmd_path, json_path, content)
+        elif mode == "stream":
+            json_path = mmd_path.with_suffix(".json")
+            metadata = write_structured_stream(mmd_path, json_path, compact, content)
+        else:
+            structured_data = extract_structured_data(mmd_path, content)
+            metadata = structured_data["metadata"]
+            json_path = mmd_path.with_suffix(".json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                if compact:
+                    json.dump(structured_data, f, ensure_ascii=False, separators=(",", ":"))
+                else:
+                    json.dump(structured_data, f, indent=2, ensure_ascii=False)
+        if counts is not None:
+            counts.update(equations=metadata["equation_count"], sections=metadata["section_count"])
         return json_path
     except Exception as e:
         log_message(f"Fallo en post-procesamiento para {mmd_path.name}: {e}")
@@ -188,6 +737,24 @@ def get_nougat_cmd():
     log_message("ADVERTENCIA: No se encontro nougat.exe de forma automatica.")
     return "nougat" # Fallback
 
+def find_tesseract():
+    path_cmd = shutil.which("tesseract")
+    if path_cmd:
+        return path_cmd
+    # Instalador de Windows (UB Mannheim): no agrega tesseract al PATH
+    for base in (os.environ.get("ProgramFiles"), os.environ.get("ProgramFiles(x86)"), os.environ.get("LOCALAPPDATA")):
+        if base:
+            target = Path(base) / "Tesseract-OCR" / "tesseract.exe"
+            if target.exists():
+                return str(target)
+    return None
+
+def find_pandoc():
+    try:
+        return post_processor.find_pandoc()
+    except Exception:
+        return None
+
 def check_hardware():
     try:
         import torch
@@ -196,90 +763,433 @@ def check_hardware():
             log_message("El pipeline se ejecutará en modo CPU. Esto es SIGNIFICATIVAMENTE más lento")
             log_message("(aprox. 5-10 minutos por página en lugar de segundos).")
             log_message("Por favor, tenga paciencia. El programa NO está bloqueado.")
-        else:
-            log_message(f"GPU Detectada: {torch.cuda.get_device_name(0)} - Motor optimizado.")
+            return False
+        log_message(f"GPU Detectada: {torch.cuda.get_device_name(0)} - Motor optimizado.")
+        return True
     except Exception as e:
         log_message(f"Error al verificar hardware: {e}")
+        return False
+
+def engine_settings(has_gpu=False, recalibrate=False):
+    # Valores fijados en la configuracion > perfil guardado de esta maquina > deteccion de hardware
+    settings = {
+        "model_size": MODEL_SIZE if MODEL_SIZE != "auto" else "0.1.0-small",
+        "batch_size": NOUGAT_BATCH_SIZE,
+        "torch_threads": TORCH_THREADS,
+        # Con GPU varios procesos competirian por la VRAM: los fragmentos se procesan de a uno
+        "shard_workers": NOUGAT_SHARD_WORKERS or (1 if has_gpu else None),
+        "hardware": None,
+        "calibrated": False,
+    }
+    if not AUTO_TUNE:
+        return settings
+
+    hardware = hardware_profile.detect()
+    saved = None if recalibrate else hardware_profile.HardwareProfile(HARDWARE_PROFILE_PATH).load(hardware)
+    tuned = saved["settings"] if saved else hardware_profile.choose(hardware)
+    overrides = {"model_size": MODEL_SIZE if MODEL_SIZE != "auto" else None, "batch_size": NOUGAT_BATCH_SIZE,
+                 "torch_threads": TORCH_THREADS, "shard_workers": NOUGAT_SHARD_WORKERS}
+    for name, value in overrides.items():
+        settings[name] = value or tuned[name]
+    settings["hardware"] = hardware
+    settings["calibrated"] = saved is not None
+
+    memory = f"{hardware['memory_gb']:g} GB" if hardware["memory_gb"] else "memoria desconocida"
+    device = f"{hardware['gpu']} ({hardware['vram_gb']:g} GB)" if hardware["gpu"] else hardware["device"].upper()
+    origin = "perfil calibrado guardado" if saved else "detección de hardware"
+    log_message(f"Ajuste automático ({origin}): {hardware['cores']} núcleos, {memory}, {device} -> modelo {settings['model_size']}, "
+                f"lote {settings['batch_size']}, {settings['torch_threads']} hilos de torch, "
+                f"{settings['shard_workers']} procesos por PDF dividido.")
+    if saved and saved.get("pages_per_sec"):
+        rates = ", ".join(f"lote {size}: {rate:.3f} pág/s" for size, rate in saved["pages_per_sec"].items())
+        log_message(f"Calibración del {saved['calibrated_at'][:16]}: {rates}.")
+    return settings
+
+def calibrate_engine(engine, settings):
+    # Una pagina de muestra incorporada mide el rendimiento real del modelo en esta maquina; el
+    # lote mas rapido queda en el perfil y las siguientes ejecuciones lo reutilizan sin medir
+    batch = settings["batch_size"]
+    if NOUGAT_BATCH_SIZE:
+        candidates = [batch]
+    elif settings["hardware"]["device"] == "cuda":
+        # El lote inicial ya llena la VRAM segun la regla de Nougat: solo se prueba uno menor
+        candidates = sorted({max(1, batch // 2), batch})
+    else:
+        candidates = [batch, batch * 2]
+    log_message(f"Calibrando Nougat con una página de muestra (lotes {', '.join(map(str, candidates))})...")
+    try:
+        rates = engine.calibrate(hardware_profile.sample_page(), candidates)
+    except Exception as e:
+        log_message(f"No se pudo calibrar ({e}). Se mantiene el lote {batch}.")
+        return
+    settings["batch_size"] = engine.batch_size
+    log_message("Calibración: " + ", ".join(f"lote {size}: {rate:.3f} pág/s" for size, rate in rates.items())
+                + f" -> lote {engine.batch_size}.")
+    tuned = {name: settings[name] for name in ("model_size", "batch_size", "torch_threads", "shard_workers")}
+    try:
+        hardware_profile.HardwareProfile(HARDWARE_PROFILE_PATH).save(settings["hardware"], tuned, rates)
+    except OSError as e:
+        log_message(f"No se pudo guardar el perfil de hardware: {e}")
+
+def create_engine(settings, page_results=None, tools=None):
+    checkpoint_dir = PAGE_CHECKPOINT_DIR if PAGE_CHECKPOINTS else None
+    if NOUGAT_ENGINE == "inprocess":
+        try:
+            engine = nougat_engine.InProcessEngine(STRUCTURE["output"], settings["model_size"], settings["batch_size"],
+                                                   checkpoint_dir=checkpoint_dir, result_cache=page_results, route_pages=PAGE_ROUTING,
+                                                   torch_threads=settings["torch_threads"], log=log_message).start()
+            if settings["hardware"] is not None and not settings["calibrated"]:
+                calibrate_engine(engine, settings)
+            return engine
+        except Exception as e:
+            log_message(f"No se pudo cargar Nougat en proceso ({e}). Usando motor subprocess como respaldo.")
+    nougat_cmd = tools.find("nougat", get_nougat_cmd) if tools is not None else get_nougat_cmd()
+    return nougat_engine.SubprocessEngine(nougat_cmd, STRUCTURE["output"], settings["model_size"],
+                                          shard_pages=NOUGAT_SHARD_PAGES, shard_workers=settings["shard_workers"],
+                                          checkpoint_dir=checkpoint_dir, timeout=NOUGAT_TIMEOUT, stall_timeout=NOUGAT_STALL_TIMEOUT,
+                                          progress_interval=NOUGAT_PROGRESS_INTERVAL, torch_threads=settings["torch_threads"],
+                                          log=log_message)
+
+def create_latex_converter(tools=None):
+    # Pandoc se localiza una sola vez por ejecucion; si falta, todo va al conversor de respaldo
+    try:
+        pandoc_path = tools.find("pandoc", find_pandoc) if tools is not None else None
+        return post_processor.PandocConverter(use_server=PANDOC_SERVER, timeout=PANDOC_TIMEOUT, pandoc_path=pandoc_path,
+                                              log=log_message).start()
+    except Exception as e:
+        log_message(f"Pandoc no disponible ({e}). Se usará el conversor de respaldo (Regex) para el LaTeX.")
+        return None
+
+def stage_nougat(engine, doc):
+    pdf_path = doc["pdf_path"]
+    log_message(f"--- Procesando: {pdf_path.name} ---")
+    t0 = time.time()
+    expected_md = engine.process(pdf_path, key=doc["hash"])
+    doc["nougat_seconds"] = time.time() - t0
+    if not expected_md.exists():
+        log_message(f"AVISO: {expected_md} no encontrado. Contenido de {STRUCTURE['output']}: {os.listdir(STRUCTURE['output'])}")
+        raise Exception("Archivo .mmd no generado.")
+    # Unica lectura del .mmd: las etapas siguientes trabajan sobre este mismo texto
+    doc["mmd_content"] = _read_mmd(expected_md)
+    doc["mmd_path"] = expected_md
+    # El planificador ya conto las paginas al ordenar la cola
+    doc["pages"] = doc.get("pages") or nougat_engine.count_pages(pdf_path)
+    doc["counts"] = {"pages": doc["pages"],
+                     "missing_pages": len(post_processor.MISSING_PAGE_PATTERN.findall(doc["mmd_content"]))}
+
+def stage_audit(doc):
+    # 1. Reporte de Auditoría de Páginas Vacías (usar contenido crudo)
+    pdf_path = doc["pdf_path"]
+    # Cada pagina se renderiza una sola vez y la reutiliza la recuperacion OCR
+    doc["page_cache"] = post_processor.PageImageCache(pdf_path, PAGE_IMAGE_CACHE_MB * 1024 * 1024, dpi=OCR_DPI,
+                                                      max_pixels=OCR_MAX_PIXELS, grayscale=OCR_GRAYSCALE)
+    audit_pdf_path = STRUCTURE["output"] / f"{pdf_path.stem}_auditoria_blancos.pdf"
+    if post_processor.generate_blank_page_report(pdf_path, doc["mmd_content"], audit_pdf_path, page_cache=doc["page_cache"],
+                                                 dpi=AUDIT_DPI, max_pixels=AUDIT_MAX_PIXELS, grayscale=AUDIT_GRAYSCALE,
+                                                 image_format=AUDIT_IMAGE_FORMAT, quality=AUDIT_JPEG_QUALITY):
+        log_message(f"Reporte de auditoría generado: {audit_pdf_path.name}")
+
+def stage_ocr(doc, page_results=None, tesseract_cmd=None):
+    # 2. Recuperación de páginas omitidas vía Tesseract OCR
+    pdf_path = doc["pdf_path"]
+    mmd_content = doc["mmd_content"]
+    log_message(f"Buscando páginas omitidas para recuperar en {pdf_path.name}...")
+    page_cache = doc.pop("page_cache", None)
+    try:
+        recovered_mmd = post_processor.recover_missing_pages(pdf_path, mmd_content, LATEX_LANGUAGE, workers=OCR_WORKERS,
+                                                             use_processes=OCR_USE_PROCESSES, page_cache=page_cache,
+                                                             result_cache=page_results, tesseract_cmd=tesseract_cmd)
+    finally:
+        if page_cache is not None:
+            if page_cache.misses:
+                log_message(f"Caché de páginas de {pdf_path.name}: {page_cache.misses} renderizadas, {page_cache.hits} reutilizadas.")
+            page_cache.close()
+    if recovered_mmd != mmd_content:
+        with open(doc["mmd_path"], "w", encoding="utf-8") as f:
+            f.write(recovered_mmd)
+        doc["mmd_content"] = recovered_mmd
+        missing_after = len(post_processor.MISSING_PAGE_PATTERN.findall(recovered_mmd))
+        doc["counts"] = {"recovered_pages": len(post_processor.MISSING_PAGE_PATTERN.findall(mmd_content)) - missing_after}
+
+def stage_json(doc):
+    # 3. RAG JSON (ahora con contenido recuperado)
+    doc["counts"] = {}
+    save_structured_json(doc["mmd_path"], RAG_JSON_MODE, RAG_JSON_COMPACT, counts=doc["counts"], content=doc["mmd_content"])
+
+def stage_latex(converter, doc):
+    # 4. Generación LaTeX (con contenido recuperado)
+    pdf_path = doc["pdf_path"]
+    log_message(f"Generando LaTeX para {pdf_path.name}...")
+    if converter is None:
+        latex_code = post_processor.mmd_to_latex_fallback(doc["mmd_content"], title=pdf_path.stem, language=LATEX_LANGUAGE)
+    else:
+        latex_code = post_processor.mmd_to_latex(doc["mmd_content"], title=pdf_path.stem, language=LATEX_LANGUAGE, converter=converter)
+    with open(doc["mmd_path"].with_suffix(".tex"), "w", encoding="utf-8") as f:
+        f.write(latex_code)
 
-def main():
-    check_hardware()
-    nougat_cmd = get_nougat_cmd()
-    state = PipelineState(REGISTRY_PATH)
+def build_pipeline(engine, state, converter=None, on_finished=None, page_results=None, metrics=None, tesseract_cmd=None):
+    def on_done(doc):
+        try:
+            state.mark_success(doc["hash"], doc["pdf_path"].name, doc["mmd_path"],
+                               pages=doc.get("pages"), seconds=doc.get("nougat_seconds"))
+            # Las paginas guardadas solo hacen falta hasta que el documento termina completo
+            nougat_engine.PageCheckpoint(PAGE_CHECKPOINT_DIR, doc["hash"]).clear()
+            if "arrived_at" in doc:
+                log_message(f"Exito: {doc['pdf_path'].name} ({time.time() - doc['arrived_at']:.1f}s desde su llegada)")
+            else:
+                log_message(f"Exito: {doc['pdf_path'].name}")
+        finally:
+            if on_finished is not None:
+                on_finished(doc)
+
+    def on_error(doc, stage_name, e):
+        try:
+            pdf_path = doc["pdf_path"]
+            page_cache = doc.pop("page_cache", None)
+            if page_cache is not None:
+                page_cache.close()
+            log_message(f"Error en {pdf_path.name} (etapa {stage_name}): {e}")
+            state.mark_failed(doc["hash"], pdf_path.name, str(e))
+            if is_transient_failure(e):
+                log_message(f"Fallo transitorio: se conservan las páginas guardadas de {pdf_path.name} para reintentarlo desde failed/.")
+            else:
+                # Las paginas guardadas se descartan: un PDF devuelto de failed/ a input/ empieza de cero
+                nougat_engine.PageCheckpoint(PAGE_CHECKPOINT_DIR, doc["hash"]).clear()
+            shutil.move(str(pdf_path), str(STRUCTURE["failed"] / pdf_path.name))
+        finally:
+            if on_finished is not None:
+                on_finished(doc)
+
+    profiled = metrics.profiled if metrics is not None else (lambda name, func: func)
+    # Mientras el documento N esta en post-procesamiento, el N+1 ya puede estar en Nougat
+    stages = [
+        stage_pipeline.Stage("nougat", profiled("nougat", lambda doc: stage_nougat(engine, doc)), engine.max_inflight, STAGE_QUEUE_SIZE),
+        stage_pipeline.Stage("auditoria", profiled("auditoria", stage_audit), STAGE_WORKERS.get("auditoria", 1), STAGE_QUEUE_SIZE),
+        stage_pipeline.Stage("ocr", profiled("ocr", lambda doc: stage_ocr(doc, page_results, tesseract_cmd)), STAGE_WORKERS.get("ocr", 1), STAGE_QUEUE_SIZE),
+        stage_pipeline.Stage("json", profiled("json", stage_json), STAGE_WORKERS.get("json", 1), STAGE_QUEUE_SIZE),
+        stage_pipeline.Stage("latex", profiled("latex", lambda doc: stage_latex(converter, doc)), STAGE_WORKERS.get("latex", 1), STAGE_QUEUE_SIZE),
+    ]
+    return stage_pipeline.StagePipeline(stages, on_done=on_done, on_error=on_error,
+                                        report_interval=STAGE_REPORT_INTERVAL, metrics=metrics, log=log_message)
+
+def is_transient_failure(error):
+    # Falta de memoria (tambien la de CUDA, que torch informa como RuntimeError) o un limite de
+    # tiempo: el mismo PDF puede terminar en otro intento, asi que sus paginas guardadas valen
+    return isinstance(error, (MemoryError, TimeoutError)) or "out of memory" in str(error).lower()
+
+def select_new_files(paths, state, hash_cache, prune=True, skip=(), quiet=False):
+    t0 = time.time()
+    state.refresh()
+    hits, misses = hash_cache.hits, hash_cache.misses
+    hashes = hash_cache.hash_files(paths, HASH_WORKERS, prune=prune)
+    if hash_cache.misses > misses:
+        log_message(f"Hashes: {hash_cache.hits - hits} reutilizados de caché, {hash_cache.misses - misses} calculados en {time.time() - t0:.1f}s.")
+
+    to_process = []
+    for pdf_path in paths:
+        f_hash = hashes.get(pdf_path)
+        if f_hash is None or f_hash in skip:
+            continue
+        if state.is_processed(f_hash) and not FORCE_REPROCESS:
+            if not quiet:
+                log_message(f"Saltando {pdf_path.name} (ya procesado). Use FORCE_REPROCESS=True para forzar.")
+            continue
+        to_process.append((pdf_path, f_hash))
+    return to_process
+
+def schedule_jobs(to_process):
+    # Cola ordenada segun la prioridad de cada PDF y SCHEDULE_POLICY (ver job_scheduler)
+    jobs = job_scheduler.make_jobs(to_process, nougat_engine.count_pages)
+    return job_scheduler.order_jobs(jobs, SCHEDULE_POLICY, SCHEDULE_SIZE_CAP, SCHEDULE_LARGE_EVERY)
+
+def log_schedule(jobs, state, slots, elapsed):
+    line = f"Plan ({SCHEDULE_POLICY}): {len(jobs)} PDFs, {sum(job['pages'] for job in jobs)} páginas (contadas en {elapsed:.2f}s)"
+    rate = state.pages_per_second()
+    if rate is None:
+        finish = [None] * len(jobs)
+        log_message(line + "; sin historial en el registro para estimar tiempos.")
+    else:
+        finish = job_scheduler.estimate_finish(jobs, rate, slots)
+        log_message(line + f"; a {rate:.2f} pág/s por documento ({slots} en curso a la vez), "
+                           f"fin estimado en {job_scheduler.format_duration(max(finish))}.")
+    for i, (job, eta) in enumerate(zip(jobs[:SCHEDULE_LOG_JOBS], finish), 1):
+        eta = f", listo en ~{job_scheduler.format_duration(eta)}" if eta is not None else ""
+        log_message(f"  {i}. {job['pdf_path'].name}: {job['pages']} págs, prioridad {job['priority']}{eta}")
+    if len(jobs) > SCHEDULE_LOG_JOBS:
+        log_message(f"  ... y {len(jobs) - SCHEDULE_LOG_JOBS} más.")
+
+def job_doc(job):
+    return {"pdf_path": job["pdf_path"], "hash": job["hash"], "pages": job["pages"]}
+
+def submit_claimed(pipeline, state, leases, jobs, inflight, arrived=False):
+    # Modo coordinado: cada PDF se reclama justo antes de entrar al pipeline, cuando la etapa
+    # nougat ya puede tomarlo, asi los nodos se reparten el trabajo a medida que se liberan.
+    # Devuelve los PDFs que otro nodo tiene en curso.
+    busy = []
+    for job in jobs:
+        pdf_path, f_hash = job["pdf_path"], job["hash"]
+        if f_hash in inflight:
+            continue
+        pipeline.wait_for_room()
+        if not leases.claim(f_hash, pdf_path.name):
+            busy.append(job)
+            continue
+        # Otro nodo pudo terminarlo (o moverlo a failed/) despues de listar input/
+        state.refresh()
+        if (state.is_processed(f_hash) and not FORCE_REPROCESS) or not pdf_path.exists():
+            leases.release(f_hash)
+            continue
+        inflight.add(f_hash)
+        doc = job_doc(job)
+        if arrived:
+            log_message(f"Nuevo PDF detectado: {pdf_path.name}")
+            doc["arrived_at"] = job["mtime"]
+        pipeline.submit(doc)
+    return busy
+
+def watch_input(pipeline, state, hash_cache, inflight, known, leases=None):
+    # Modo demonio: los PDFs que llegan a input/ entran al mismo pipeline con el motor ya cargado
+    submit_lock = threading.Lock()
+
+    def on_ready(paths, quiet=False):
+        with submit_lock:
+            # Un PDF movido o borrado despues de detectarse (otro nodo, el usuario) se descarta solo
+            paths = [path for path in paths if path.exists()]
+            jobs = schedule_jobs(select_new_files(paths, state, hash_cache, prune=False, skip=inflight, quiet=quiet))
+            if leases is not None:
+                submit_claimed(pipeline, state, leases, jobs, inflight, arrived=not quiet)
+                return
+            for job in jobs:
+                log_message(f"Nuevo PDF detectado: {job['pdf_path'].name}")
+                inflight.add(job["hash"])
+                # La latencia se mide desde la ultima escritura del archivo (fin de la copia), no desde la deteccion
+                pipeline.submit({**job_doc(job), "arrived_at": job["mtime"]})
+
+    stop = threading.Event()
+    if leases is not None:
+        # Los PDFs de un nodo caido solo quedan libres cuando vence su lease: se reintentan periodicamente
+        def retry():
+            while not stop.wait(LEASE_POLL_INTERVAL):
+                # Un error en una vuelta no detiene los reintentos: sin este hilo, los PDFs de un
+                # nodo caido no volverian a tomarse
+                try:
+                    on_ready([p for p in STRUCTURE["input"].iterdir() if p.suffix.lower() == ".pdf"], quiet=True)
+                except Exception as e:
+                    log_message(f"Error al reintentar PDFs con lease vencido ({e}).")
+        threading.Thread(target=retry, name="leases-reintento", daemon=True).start()
+
+    watcher = folder_watcher.FolderWatcher(STRUCTURE["input"], on_ready, debounce=WATCH_DEBOUNCE,
+                                           poll_interval=WATCH_POLL_INTERVAL, log=log_message).start(known)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        log_message("Deteniendo la vigilancia de input/. Terminando los documentos en curso...")
+    finally:
+        stop.set()
+        watcher.stop()
+
+def main(watch=False, profile_stage=PROFILE_STAGE, recalibrate=False, worker=None):
+    # `worker`: identificador del nodo en modo coordinado ("" = automatico; None = segun COORDINATION)
+    if worker is None and COORDINATION:
+        worker = WORKER_ID or ""
+    if worker is not None:
+        worker = worker or work_leases.default_worker_id()
+        configure_worker(worker)
+    ensure_structure()
+    state = PipelineState(REGISTRY_PATH, LEGACY_REGISTRY_PATH, shared=worker is not None)
     input_path = STRUCTURE["input"]
     all_files = [input_path / f for f in os.listdir(input_path) if f.lower().endswith(".pdf")]
     
     log_message(f"Se encontraron {len(all_files)} PDFs locales.")
     
-    to_process = []
-    for pdf_path in all_files:
-        f_hash = get_file_hash(pdf_path)
-        if state.is_processed(f_hash) and not FORCE_REPROCESS:
-            log_message(f"Saltando {pdf_path.name} (ya procesado). Use FORCE_REPROCESS=True para forzar.")
-            continue
-        to_process.append((pdf_path, f_hash))
+    hash_cache = HashCache(HASH_CACHE_PATH)
+    metrics = run_metrics.RunMetrics(METRICS_DIR, profile_stage, worker=worker, log=log_message) if METRICS else None
+    t0, c0 = time.time(), time.process_time()
+    select = metrics.profiled("hash", select_new_files) if metrics is not None else select_new_files
+    to_process = select(all_files, state, hash_cache)
 
-    if not to_process:
+    if not to_process and not watch:
         log_message("Nada nuevo que procesar.")
+        if metrics is not None:
+            metrics.close()
         return
+    if metrics is not None:
+        # Antes de arrancar las etapas el proceso solo hashea: su CPU total es la del hasheo
+        metrics.record("hash", None, time.time() - t0, time.process_time() - c0,
+                       counts={"files": len(all_files), "hashed": hash_cache.misses})
 
     log_message(f"Iniciando procesamiento de {len(to_process)} archivos.")
+    # torch, el modelo y las herramientas externas solo se cargan cuando hay trabajo
+    has_gpu = check_hardware()
+    tools = ToolPaths(TOOL_PATHS_PATH)
+    page_results = result_cache.PageResultCache(PAGE_RESULT_CACHE_DIR, PAGE_RESULT_CACHE_MB * 1024 * 1024) if PAGE_RESULT_CACHE_MB else None
+    engine = create_engine(engine_settings(has_gpu, recalibrate), page_results, tools)
+    log_message(f"Motor Nougat: {engine.name}")
+    converter = create_latex_converter(tools)
+    tesseract_cmd = tools.find("tesseract", find_tesseract)
+    tools.save()
+    t0 = time.time()
+    jobs = schedule_jobs(to_process)
+    if jobs:
+        log_schedule(jobs, state, engine.max_inflight, time.time() - t0)
 
-    for pdf_path, f_hash in to_process:
-        try:
-            log_message(f"--- Procesando: {pdf_path.name} ---")
-            
-            # Ejecutar nougat via subprocess con ruta descubierta
-            out_dir = str(STRUCTURE["output"])
-            cmd = [nougat_cmd, str(pdf_path), "-o", out_dir, "--model", "0.1.0-small", "--no-skipping"]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="replace")
-            
-            if result.stdout:
-                log_message(f"STDOUT Nougat:\n{result.stdout}")
-            if result.stderr:
-                log_message(f"STDERR Nougat:\n{result.stderr}")
-
-            if result.returncode != 0:
-                err_msg = result.stderr if result.stderr else "Error desconocido de Nougat"
-                raise Exception(f"Nougat falló (Código {result.returncode}): {err_msg}")
-
-            expected_md = STRUCTURE["output"] / f"{pdf_path.stem}.mmd"
-            if expected_md.exists():
-                with open(expected_md, "r", encoding="utf-8") as f:
-                    mmd_content = f.read()
-
-                # 1. Reporte de Auditoría de Páginas Vacías (usar contenido crudo)
-                audit_pdf_path = STRUCTURE["output"] / f"{pdf_path.stem}_auditoria_blancos.pdf"
-                if post_processor.generate_blank_page_report(pdf_path, mmd_content, audit_pdf_path):
-                    log_message(f"Reporte de auditoría generado: {audit_pdf_path.name}")
-
-                # 2. Recuperación de páginas omitidas vía Tesseract OCR
-                log_message(f"Buscando páginas omitidas para recuperar en {pdf_path.name}...")
-                recovered_mmd = post_processor.recover_missing_pages(pdf_path, mmd_content, LATEX_LANGUAGE)
-                if recovered_mmd != mmd_content:
-                    with open(expected_md, "w", encoding="utf-8") as f:
-                        f.write(recovered_mmd)
-                    mmd_content = recovered_mmd
-
-                # 3. RAG JSON (ahora con contenido recuperado)
-                save_structured_json(expected_md)
-                
-                # 4. Generación LaTeX (con contenido recuperado)
-                log_message(f"Generando LaTeX para {pdf_path.name}...")
-                latex_code = post_processor.mmd_to_latex(mmd_content, title=pdf_path.stem, language=LATEX_LANGUAGE)
-                with open(expected_md.with_suffix(".tex"), "w", encoding="utf-8") as f:
-                    f.write(latex_code)
-                
-                state.mark_success(f_hash, pdf_path.name, expected_md)
-                log_message(f"Exito: {pdf_path.name}")
-            else:
-                log_message(f"AVISO: {expected_md} no encontrado. Contenido de {STRUCTURE['output']}: {os.listdir(STRUCTURE['output'])}")
-                raise Exception("Archivo .mmd no generado.")
-                
-        except Exception as e:
-            log_message(f"Error en {pdf_path.name}: {e}")
-            state.mark_failed(f_hash, pdf_path.name, str(e))
-            shutil.move(str(pdf_path), str(STRUCTURE["failed"] / pdf_path.name))
+    leases = None
+    if worker is not None:
+        leases = work_leases.LeaseManager(LEASE_DIR, worker, LEASE_SECONDS, LEASE_HEARTBEAT, log=log_message).start()
+
+    def on_finished(doc):
+        inflight.discard(doc["hash"])
+        if leases is not None:
+            leases.release(doc["hash"])
+
+    # Hashes en curso: el modo demonio no vuelve a encolar un PDF que aun no termino
+    inflight = set() if leases is not None else {f_hash for _, f_hash in to_process}
+    pipeline = build_pipeline(engine, state, converter, on_finished=on_finished,
+                              page_results=page_results, metrics=metrics, tesseract_cmd=tesseract_cmd).start()
+    try:
+        if leases is None:
+            for job in jobs:
+                pipeline.submit(job_doc(job))
+        else:
+            busy = submit_claimed(pipeline, state, leases, jobs, inflight)
+            if busy:
+                log_message(f"{len(busy)} PDFs en curso en otros nodos: se retoman si su lease vence.")
+            # Sin --watch el nodo espera a que el lote entero termine: si otro nodo cae, retoma sus PDFs
+            while busy and not watch:
+                time.sleep(LEASE_POLL_INTERVAL)
+                state.refresh()
+                pending = [job for job in busy if not state.is_processed(job["hash"]) and job["pdf_path"].exists()]
+                busy = submit_claimed(pipeline, state, leases, pending, inflight)
+        if watch:
+            watch_input(pipeline, state, hash_cache, inflight, all_files, leases)
+        pipeline.close()
+        engine.report()
+        if converter is not None:
+            converter.report()
+        if page_results is not None:
+            log_message(page_results.summary())
+        pipeline.report()
+        if metrics is not None:
+            metrics.report()
+        if leases is not None:
+            log_message(leases.summary())
+    finally:
+        engine.close()
+        if leases is not None:
+            leases.close()
+        if converter is not None:
+            converter.close()
+        if metrics is not None:
+            metrics.close()
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Pipeline Nougat local: PDF -> Markdown, JSON RAG y LaTeX.")
+    parser.add_argument("--watch", action="store_true", help="Modo demonio: vigilar input/ y procesar los PDFs nuevos al llegar")
+    parser.add_argument("--profile-stage", default=PROFILE_STAGE, choices=["hash", "nougat", "auditoria", "ocr", "json", "latex"],
+                        help="Perfilar una etapa con cProfile (requiere METRICS = True); el .prof queda en checkpoint/metrics/")
+    parser.add_argument("--recalibrate", action="store_true", help="Ignorar el perfil de hardware guardado y volver a calibrar el motor")
+    parser.add_argument("--worker", nargs="?", const="", default=None, metavar="ID",
+                        help="Modo coordinado: varios nodos sobre las mismas carpetas compartidas (ID por defecto: maquina-pid)")
+    args = parser.parse_args()
+    main(watch=args.watch or WATCH_MODE, profile_stage=args.profile_stage, recalibrate=args.recalibrate, worker=args.worker)
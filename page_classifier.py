@@ -0,0 +1,155 @@
+import re
+import ctypes
+from collections import Counter
+
+import post_processor
+
+ROUTE_NOUGAT = "nougat"       # Matematicas, escaneos, tablas o figuras: requieren el modelo
+ROUTE_TEXT = "texto"          # Prosa con capa de texto limpia: se extrae directamente
+ROUTE_TESSERACT = "tesseract" # Prosa con capa de texto ilegible (sin ToUnicode, codificacion rota)
+ROUTE_BLANK = "vacia"         # Sin texto ni imagenes
+
+MIN_TEXT_CHARS = 200     # Menos caracteres visibles: portada, figura o pagina escaneada
+SCAN_IMAGE_COVERAGE = 0.5 # Fraccion de la pagina cubierta por imagenes a partir de la cual se trata como escaneo
+FIGURE_IMAGE_COVERAGE = 0.15 # Con poco texto, imagenes por encima de esto son figuras que Nougat debe ver
+MATH_FONT_RATIO = 0.02   # Fraccion de caracteres en fuentes matematicas (CMMI, CMSY, Cambria Math, ...)
+MATH_SYMBOL_RATIO = 0.01 # Fraccion de simbolos matematicos Unicode (griegas, operadores, flechas)
+MATH_EQUALS_LINES = 3    # Lineas con "=" a partir de las cuales hay ecuaciones en el texto
+GARBLED_RATIO = 0.05     # Fraccion de caracteres ilegibles (U+FFFD, uso privado, control)
+SHORT_LINE_CHARS = 25    # Una linea mas corta que esto es un fragmento (celda, formula, etiqueta)
+SHORT_LINE_RATIO = 0.5   # Con mas fragmentos que esto (y al menos 15 lineas) hay tablas o formulas
+NUMERIC_TOKEN_RATIO = 0.3 # Fraccion de palabras numericas a partir de la cual la pagina es una tabla de datos
+FONT_SAMPLES = 400       # Caracteres muestreados para el nombre de la fuente
+
+MATH_FONT_PATTERN = re.compile(r"CMMI|CMSY|CMEX|CMBSY|MSAM|MSBM|EUFM|EUSM|RSFS|STIX|Math|Symbol", re.IGNORECASE)
+MATH_SYMBOL_PATTERN = re.compile("[\u0391-\u03c9\u2190-\u21ff\u2200-\u22ff\u2070-\u209f\u27c0-\u27ef\u2980-\u2aff\u00b1\u00d7\u00f7\U0001d400-\U0001d7ff]")
+GARBLED_PATTERN = re.compile("[\ufffd\ue000-\uf8ff\x00\x01\x03-\x08\x0b\x0c\x0e-\x1f]")
+NUMERIC_TOKEN_PATTERN = re.compile(r"[-+(]?[\d.,]*\d[\d.,%)]*")
+SOFT_HYPHEN_BREAK = re.compile("(\\w)[\x02\u00ad-]\n(?=[a-záéíóúñü])")
+
+def _chars(textpage):
+    # Texto y tamaño de fuente por caracter (los saltos de linea generados por pdfium incluidos)
+    import pypdfium2.raw as pdfium_c
+    n_chars = pdfium_c.FPDFText_CountChars(textpage.raw)
+    codes = [pdfium_c.FPDFText_GetUnicode(textpage.raw, i) for i in range(n_chars)]
+    sizes = [pdfium_c.FPDFText_GetFontSize(textpage.raw, i) for i in range(n_chars)]
+    return "".join(chr(c) if c < 0x110000 else "\ufffd" for c in codes), sizes
+
+def _math_font_ratio(textpage, text):
+    import pypdfium2.raw as pdfium_c
+    visible = [i for i, ch in enumerate(text) if not ch.isspace()]
+    if not visible:
+        return 0.0
+    step = max(1, len(visible) // FONT_SAMPLES)
+    buf = ctypes.create_string_buffer(256)
+    flags = ctypes.c_int()
+    math = sampled = 0
+    for i in visible[::step]:
+        if pdfium_c.FPDFText_GetFontInfo(textpage.raw, i, ctypes.cast(buf, ctypes.c_void_p), len(buf), ctypes.byref(flags)):
+            sampled += 1
+            if MATH_FONT_PATTERN.search(buf.value.decode("utf-8", "replace")):
+                math += 1
+    return math / sampled if sampled else 0.0
+
+def _image_coverage(page):
+    import pypdfium2.raw as pdfium_c
+    width, height = page.get_size()
+    left, bottom, right, top = (ctypes.c_float() for _ in range(4))
+    covered = 0.0
+    for i in range(pdfium_c.FPDFPage_CountObjects(page.raw)):
+        obj = pdfium_c.FPDFPage_GetObject(page.raw, i)
+        if pdfium_c.FPDFPageObj_GetType(obj) != pdfium_c.FPDF_PAGEOBJ_IMAGE:
+            continue
+        if pdfium_c.FPDFPageObj_GetBounds(obj, left, bottom, right, top):
+            w = min(right.value, width) - max(left.value, 0)
+            h = min(top.value, height) - max(bottom.value, 0)
+            covered += max(w, 0) * max(h, 0)
+    return min(covered / (width * height), 1.0) if width and height else 0.0
+
+def _lines(text, sizes):
+    # (texto, tamaño de fuente mayor) por linea
+    lines = []
+    start = 0
+    for i, ch in enumerate(text + "\n"):
+        if ch == "\n":
+            line = text[start:i].rstrip("\r")
+            size = max((sizes[j] for j in range(start, min(i, len(sizes))) if not text[j].isspace()), default=0.0)
+            lines.append((line, size))
+            start = i + 1
+    return lines
+
+def classify_page(page):
+    # Devuelve (ruta, motivo, markdown). El markdown solo se calcula para ROUTE_TEXT.
+    with post_processor.PDFIUM_LOCK:
+        return _classify(page)
+
+def _classify(page):
+    textpage = page.get_textpage()
+    try:
+        text, sizes = _chars(textpage)
+        visible = sum(1 for ch in text if not ch.isspace())
+        coverage = _image_coverage(page)
+        if coverage >= SCAN_IMAGE_COVERAGE:
+            return ROUTE_NOUGAT, "escaneada", None
+        if not visible:
+            return (ROUTE_NOUGAT, "figura", None) if coverage > 0 else (ROUTE_BLANK, "vacía", "")
+        if visible < MIN_TEXT_CHARS and coverage >= FIGURE_IMAGE_COVERAGE:
+            return ROUTE_NOUGAT, "figura", None
+        if _math_font_ratio(textpage, text) >= MATH_FONT_RATIO:
+            return ROUTE_NOUGAT, "matemáticas", None
+        if len(GARBLED_PATTERN.findall(text)) / visible >= GARBLED_RATIO:
+            return ROUTE_TESSERACT, "capa de texto ilegible", None
+        if len(MATH_SYMBOL_PATTERN.findall(text)) / visible >= MATH_SYMBOL_RATIO:
+            return ROUTE_NOUGAT, "matemáticas", None
+        lines = _lines(text, sizes)
+        content = [(line.strip(), size) for line, size in lines if line.strip()]
+        if sum(1 for line, _ in content if "=" in line) >= MATH_EQUALS_LINES:
+            return ROUTE_NOUGAT, "matemáticas", None
+        if len(content) >= 15 and sum(1 for line, _ in content if len(line) < SHORT_LINE_CHARS) / len(content) > SHORT_LINE_RATIO:
+            return ROUTE_NOUGAT, "tablas o fragmentos", None
+        tokens = text.split()
+        if sum(1 for token in tokens if NUMERIC_TOKEN_PATTERN.fullmatch(token)) / len(tokens) >= NUMERIC_TOKEN_RATIO:
+            return ROUTE_NOUGAT, "tablas o fragmentos", None
+        # pdfium entrega los caracteres fuera del plano basico como pares sustitutos UTF-16
+        markdown = text_markdown(content).encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+        return ROUTE_TEXT, "prosa", markdown
+    finally:
+        textpage.close()
+
+def _body_size(content):
+    # Tamaño de fuente con mas caracteres en la pagina
+    weights = Counter()
+    for line, size in content:
+        weights[round(size * 2) / 2] += len(line)
+    return weights.most_common(1)[0][0] if weights else 0.0
+
+def text_markdown(content):
+    # Reconstruye parrafos a partir de las lineas de la capa de texto: los encabezados se
+    # detectan por tamaño de fuente y un parrafo termina en una linea corta con punto final.
+    body = _body_size(content)
+    full_width = max((len(line) for line, _ in content), default=0)
+    blocks = []
+    paragraph = []
+    for line, size in content:
+        ratio = size / body if body else 1.0
+        if ratio >= 1.15 and len(line) < 120 and not line.endswith("."):
+            if paragraph:
+                blocks.append("\n".join(paragraph))
+                paragraph = []
+            level = "#" if ratio >= 1.6 else "##" if ratio >= 1.3 else "###"
+            blocks.append(f"{level} {line}")
+            continue
+        paragraph.append(line)
+        if line[-1] in ".:!?" and len(line) < 0.8 * full_width:
+            blocks.append("\n".join(paragraph))
+            paragraph = []
+    if paragraph:
+        blocks.append("\n".join(paragraph))
+    out = []
+    for block in blocks:
+        if block.startswith("#"):
+            out.append(block)
+        else:
+            block = SOFT_HYPHEN_BREAK.sub(r"\1", block).replace("\x02", "-")
+            out.append(" ".join(part.strip() for part in block.split("\n")))
+    return "\n\n" + "\n\n".join(out) + "\n\n"
@@ -1,6 +1,132 @@
+import io
 import re
 import os
-from pathlib import Path
+import math
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MISSING_PAGE_PATTERN = re.compile(r'\[MISSING_PAGE_(EMPTY|FAIL):(\d+)\]')
+
+# pdfium no es seguro entre hilos, ni siquiera sobre documentos distintos: toda llamada a
+# pypdfium2 del proceso (abrir, renderizar, leer texto, cerrar) pasa por este candado.
+# Es reentrante porque el motor clasifica y renderiza una pagina dentro de la misma seccion.
+PDFIUM_LOCK = threading.RLock()
+
+# Patrones del conversor de respaldo: se compilan una sola vez al importar el modulo
+LATEX_EMPTY_PAGE_PATTERN = re.compile(r'\[MISSING_PAGE_EMPTY:\d+\]')
+LATEX_FAIL_PAGE_PATTERN = re.compile(r'\[MISSING_PAGE_FAIL:\d+\]')
+LATEX_FAIL_PAGE_TEXT = r'\begin{center}\textbf{[ERROR: Pagina no procesada en el original]}\end{center}'
+
+# Fragmentos que no deben escaparse: (apertura, cierre), en el orden de la alternancia original
+LATEX_PROTECTED_SPANS = (
+    ('\\(', '\\)'), ('\\[', '\\]'), ('\\cite{', '}'), ('\\ref{', '}'),
+    ('\\label{', '}'), ('\\begin{', '}'), ('\\end{', '}'),
+)
+
+# (texto que debe aparecer para que el patron pueda coincidir, patron, marcador)
+LATEX_RAW_COMMANDS = [
+    (trigger, re.compile(pattern), marker) for trigger, pattern, marker in (
+        ('\\section', r'\\section\*?\{([^{}]*)\}', r'LSECS\1LEND'),
+        ('\\subsection', r'\\subsection\*?\{([^{}]*)\}', r'LSUBS\1LEND'),
+        ('\\subsubsection', r'\\subsubsection\*?\{([^{}]*)\}', r'LSUBSUBS\1LEND'),
+        ('\\paragraph', r'\\paragraph\*?\{([^{}]*)\}', r'LPARAGS\1LEND'),
+        ('\\subparagraph', r'\\subparagraph\*?\{([^{}]*)\}', r'LSTARTPAGS\1LEND'),
+        ('\\textbf{', r'\\textbf\{([^{}]*)\}', r'LBOLDS\1LEND'),
+        ('\\textit{', r'\\textit\{([^{}]*)\}', r'LITALS\1LEND'),
+        ('\\underline{', r'\\underline\{([^{}]*)\}', r'LBOLDS\1LEND'),
+    )
+]
+
+# Un solo patron para los seis niveles de encabezado: cada linea coincide con a lo sumo uno
+LATEX_HEADER_PATTERN = re.compile(r'^(#{1,6}) (.*)', re.MULTILINE)
+LATEX_HEADER_MARKERS = {1: 'LSECS', 2: 'LSUBS', 3: 'LSUBSUBS', 4: 'LPARAGS', 5: 'LSTARTPAGS', 6: 'LSTARTPAGS'}
+
+LATEX_EMPHASIS = [
+    ('*', re.compile(r'\*\*(.*?)\*\*'), r'LBOLDS\1LEND'),
+    ('*', re.compile(r'\*(.*?)\*'), r'LITALS\1LEND'),
+    ('_', re.compile(r'_(.*?)_'), r'LITALS\1LEND'),
+]
+
+LATEX_SPECIAL_CHARS = (
+    ('&', r'\&'), ('%', r'\%'), ('$', r'\$'), ('_', r'\_'),
+    ('{', r'\{'), ('}', r'\}'), ('#', r'\#'), ('~', r'\textasciitilde{}'), ('^', r'\textasciicircum{}'),
+)
+
+# LSUBSUBS va antes que LSUBS: es el unico marcador que contiene a otro
+LATEX_MARKERS = (
+    ("LSECS", r"\section{"), ("LSUBSUBS", r"\subsubsection{"), ("LSUBS", r"\subsection{"),
+    ("LPARAGS", r"\paragraph{"), ("LSTARTPAGS", r"\subparagraph{"), ("LBOLDS", r"\textbf{"),
+    ("LITALS", r"\textit{"), ("LEND", "}"),
+)
+
+LATEX_PLACEHOLDER_PATTERN = re.compile(r'MATHPROTECT(\d+)Z')
+
+# Linea de lista: "\* " tras espacios opcionales y con texto despues (como line.strip().startswith('\\* '))
+LATEX_ITEM_LINE_PATTERN = re.compile(r'^[^\S\n]*\\\* (?=[^\n]*\S)', re.MULTILINE)
+
+def _protect_latex_spans(body, protected_math):
+    # Recorrido lineal con un cursor por tipo de apertura (equivale a la alternancia no codiciosa
+    # original). Una apertura sin cierre desactiva su tipo: las siguientes tampoco lo tendrian.
+    cursors = [body.find(opener) for opener, _ in LATEX_PROTECTED_SPANS]
+    if max(cursors) < 0:
+        return body
+    parts = []
+    pos = 0
+    while True:
+        start = -1
+        kind = 0
+        for k, cursor in enumerate(cursors):
+            if 0 <= cursor < pos:
+                cursor = cursors[k] = body.find(LATEX_PROTECTED_SPANS[k][0], pos)
+            if cursor >= 0 and (start < 0 or cursor < start):
+                start, kind = cursor, k
+        if start < 0:
+            break
+        opener, closer = LATEX_PROTECTED_SPANS[kind]
+        close = body.find(closer, start + len(opener))
+        if close < 0:
+            cursors[kind] = -1
+            continue
+        end = close + len(closer)
+        parts.append(body[pos:start])
+        parts.append(f"MATHPROTECT{len(protected_math)}Z")
+        protected_math.append(body[start:end])
+        pos = end
+    parts.append(body[pos:])
+    return "".join(parts)
+
+def _latex_header(m):
+    return LATEX_HEADER_MARKERS[len(m.group(1))] + m.group(2) + 'LEND'
+
+def _latex_itemize(body):
+    # Solo se copian las lineas de las listas; el texto entre listas pasa en bloques, sin
+    # partir el documento en una cadena por linea
+    parts = []
+    pos = 0
+    in_list = False
+    last_end = -1
+    for m in LATEX_ITEM_LINE_PATTERN.finditer(body):
+        start = m.start()
+        line_end = body.find('\n', start)
+        if line_end == -1:
+            line_end = len(body)
+        if in_list and start == last_end + 1:
+            parts.append('\n')
+        else:
+            if in_list:
+                parts.append('\n\\end{itemize}')
+            parts.append(body[pos:start])
+            parts.append('\\begin{itemize}\n')
+        parts.append('  \\item ' + body[start:line_end].strip()[3:])
+        pos = last_end = line_end
+        in_list = True
+    if in_list:
+        parts.append('\n\\end{itemize}')
+    parts.append(body[pos:])
+    return ''.join(parts)
 
 def mmd_to_latex_fallback(mmd_content, title="Export", language="spanish"):
     preamble = [
@@ -20,99 +146,220 @@ def mmd_to_latex_fallback(mmd_content, title="Export", language="spanish"):
         "\\tableofcontents",
         "\\newpage"
     ]
-    
-    protected_math = []
-    def save_math(m):
-        protected_math.append(m.group(0))
-        return f"MATHPROTECT{len(protected_math)-1}Z"
-    
+
+    # Cada pasada se omite si el texto que la dispara no aparece: el resultado es el mismo
+    # y un documento tipico solo paga las pocas pasadas que realmente necesita.
     body = mmd_content
-    body = re.sub(r'\[MISSING_PAGE_EMPTY:\d+\]', '', body)
-    body = re.sub(r'\[MISSING_PAGE_FAIL:\d+\]', r'\\begin{center}\\textbf{[ERROR: Pagina no procesada en el original]}\\end{center}', body)
-    
+    if '[MISSING_PAGE_' in body:
+        body = LATEX_EMPTY_PAGE_PATTERN.sub('', body)
+        body = LATEX_FAIL_PAGE_PATTERN.sub(lambda m: LATEX_FAIL_PAGE_TEXT, body)
+
     # Marcamos entornos matemáticos y comandos estructurales clave para evitar que sean escapados
-    body = re.sub(
-        r'\\\(.*?\\\)|\\\[.*?\\\]|\\cite\{.*?\}|\\ref\{.*?\}|\\label\{.*?\}|\\begin\{.*?\}|\\end\{.*?\}',
-        save_math,
-        body,
-        flags=re.DOTALL
-    )
+    protected_math = []
+    body = _protect_latex_spans(body, protected_math)
 
-    raw_cmds_map = {
-        r'\\section\*?\{([^{}]*)\}': r'LSECS\1LEND',
-        r'\\subsection\*?\{([^{}]*)\}': r'LSUBS\1LEND',
-        r'\\subsubsection\*?\{([^{}]*)\}': r'LSUBSUBS\1LEND',
-        r'\\paragraph\*?\{([^{}]*)\}': r'LPARAGS\1LEND',
-        r'\\subparagraph\*?\{([^{}]*)\}': r'LSTARTPAGS\1LEND',
-        r'\\textbf\{([^{}]*)\}': r'LBOLDS\1LEND',
-        r'\\textit\{([^{}]*)\}': r'LITALS\1LEND',
-        r'\\underline\{([^{}]*)\}': r'LBOLDS\1LEND'
-    }
-    for _ in range(5):
+    # Los comandos anidados se resuelven de adentro hacia afuera (hasta 5 rondas, como antes)
+    commands = [entry for entry in LATEX_RAW_COMMANDS if entry[0] in body]
+    for _ in range(5 if commands else 0):
         any_change = False
-        for cmd_rec, marker_sub in raw_cmds_map.items():
-            new_body, count = re.subn(cmd_rec, marker_sub, body, flags=re.DOTALL)
-            if count > 0:
-                body = new_body
-                any_change = True
+        for trigger, pattern, marker in commands:
+            if trigger not in body:
+                continue
+            # Sin coincidencias subn devuelve el mismo texto: reasignar directamente evita
+            # que una segunda referencia mantenga viva una copia del documento
+            body, count = pattern.subn(marker, body)
+            any_change = any_change or count > 0
         if not any_change: break
 
-    body = re.sub(r'^###### (.*)', r'LSTARTPAGS\1LEND', body, flags=re.MULTILINE)
-    body = re.sub(r'^##### (.*)', r'LSTARTPAGS\1LEND', body, flags=re.MULTILINE)
-    body = re.sub(r'^#### (.*)', r'LPARAGS\1LEND', body, flags=re.MULTILINE)
-    body = re.sub(r'^### (.*)', r'LSUBSUBS\1LEND', body, flags=re.MULTILINE)
-    body = re.sub(r'^## (.*)', r'LSUBS\1LEND', body, flags=re.MULTILINE)
-    body = re.sub(r'^# (.*)', r'LSECS\1LEND', body, flags=re.MULTILINE)
-    
-    body = re.sub(r'\*\*(.*?)\*\*', r'LBOLDS\1LEND', body)
-    body = re.sub(r'\*(.*?)\*', r'LITALS\1LEND', body)
-    body = re.sub(r'_(.*?)_', r'LITALS\1LEND', body)
-
-    special_chars = {
-        '&': r'\&', '%': r'\%', '$': r'\$', '_': r'\_', 
-        '{': r'\{', '}': r'\}', '#': r'\#', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}'
-    }
-    
-    for char, replacement in special_chars.items():
+    if '#' in body:
+        body = LATEX_HEADER_PATTERN.sub(_latex_header, body)
+
+    for trigger, pattern, marker in LATEX_EMPHASIS:
+        if trigger in body:
+            body = pattern.sub(marker, body)
+
+    for char, replacement in LATEX_SPECIAL_CHARS:
         body = body.replace(char, replacement)
 
-    body = body.replace("LSECS", r"\section{")
-    body = body.replace("LSUBSUBS", r"\subsubsection{")
-    body = body.replace("LSUBS", r"\subsection{")
-    body = body.replace("LPARAGS", r"\paragraph{")
-    body = body.replace("LSTARTPAGS", r"\subparagraph{")
-    body = body.replace("LBOLDS", r"\textbf{")
-    body = body.replace("LITALS", r"\textit{")
-    body = body.replace("LEND", "}") 
-
-    lines = body.split('\n')
-    new_lines = []
-    in_list = False
-    for line in lines:
-        if line.strip().startswith('\\* '): 
-            if not in_list:
-                new_lines.append('\\begin{itemize}')
-                in_list = True
-            new_lines.append('  \\item ' + line.strip()[3:])
-        else:
-            if in_list:
-                new_lines.append('\\end{itemize}')
-                in_list = False
-            new_lines.append(line)
-    if in_list: new_lines.append('\\end{itemize}')
-    body = '\n'.join(new_lines)
+    for marker, command in LATEX_MARKERS:
+        body = body.replace(marker, command)
+
+    if '\\* ' in body:
+        body = _latex_itemize(body)
 
     def restore_math(m):
         idx = int(m.group(1))
         return protected_math[idx] if idx < len(protected_math) else m.group(0)
-    
-    body = re.sub(r'MATHPROTECT(\d+)Z', restore_math, body)
-    
-    full_doc = '\n'.join(preamble) + '\n' + body + '\n\\end{document}'
-    return full_doc
 
-def mmd_to_latex(mmd_content, title="Export", language="spanish"):
+    if protected_math:
+        body = LATEX_PLACEHOLDER_PATTERN.sub(restore_math, body)
+
+    # Una sola concatenacion: sumar las partes copiaba el cuerpo dos veces
+    return ''.join(['\n'.join(preamble), '\n', body, '\n\\end{document}'])
+
+PANDOC_LANG_MAP = {
+    "spanish": "es",
+    "english": "en"
+}
+
+PANDOC_MISSING_PAGE_PATTERN = re.compile(r'\[MISSING_PAGE_(EMPTY|FAIL):\d+\]')
+PANDOC_FAIL_PAGE_TEXT = '\n\n**[ERROR: Página no procesada en el original]**\n\n'
+# Delimitadores \( \) y \[ \] convertidos a $ y $$ para que Pandoc reconozca las ecuaciones
+PANDOC_MATH_DELIMITERS = ((r'\(', '$'), (r'\)', '$'), (r'\[', '$$'), (r'\]', '$$'))
+
+def _pandoc_input(mmd_content):
+    # Cada pasada copia el documento completo: los marcadores de ambos tipos se resuelven en una
+    # sola, y las que no tienen nada que reemplazar se omiten
+    body = mmd_content
+    if '[MISSING_PAGE_' in body:
+        body = PANDOC_MISSING_PAGE_PATTERN.sub(lambda m: '' if m.group(1) == 'EMPTY' else PANDOC_FAIL_PAGE_TEXT, body)
+    for delimiter, replacement in PANDOC_MATH_DELIMITERS:
+        if delimiter in body:
+            body = body.replace(delimiter, replacement)
+    return body
+
+def _pandoc_variables(title, language):
+    lang_code = PANDOC_LANG_MAP.get(language.lower(), language)
+    return {"lang": lang_code, "title": title, "author": "Pipeline Nougat OCR", "geometry": "margin=1in"}
+
+def _pandoc_args(variables):
+    args = ['--standalone']
+    for name, value in variables.items():
+        args += ['-V', f'{name}={value}']
+    return args
+
+def find_pandoc(download=False, log=print):
+    import pypandoc
+    try:
+        return pypandoc.get_pandoc_path()
+    except OSError:
+        if not download:
+            return None
+        log("Pandoc no encontrado en el sistema. Descargando versión interna...")
+        pypandoc.download_pandoc()
+        return pypandoc.get_pandoc_path()
+
+class PandocConverter:
+    # Conversor Pandoc compartido por toda la ejecucion. Localiza (o descarga) pandoc una sola
+    # vez y, si la version lo permite (pandoc >= 3), mantiene un `pandoc server` local que
+    # atiende todos los documentos sin lanzar un proceso por cada uno.
+    def __init__(self, use_server=True, timeout=120, pandoc_path=None, log=print):
+        self.use_server = use_server
+        self.timeout = timeout
+        self.log = log
+        # Con una ruta conocida (p. ej. de una ejecucion anterior) no se importa pypandoc
+        self.pandoc_path = pandoc_path
+        self.server_docs = 0
+        self.process_docs = 0
+        self.fallback_docs = 0
+        self._server = None
+        self._url = None
+        self._opener = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.pandoc_path is None:
+            self.pandoc_path = find_pandoc(download=True, log=self.log)
+        if self.use_server:
+            self._start_server()
+        self.log(f"Pandoc: {self.pandoc_path} ({'servidor persistente' if self._url else 'un proceso por documento'}).")
+        return self
+
+    def _start_server(self):
+        import socket
+        import subprocess
+        import urllib.request
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        proc = subprocess.Popen([self.pandoc_path, "server", "--port", str(port), "--timeout", str(self.timeout)],
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # Sin proxies: la peticion va a localhost aunque el entorno defina HTTP_PROXY
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        url = f"http://127.0.0.1:{port}"
+        deadline = time.time() + 10
+        while time.time() < deadline and proc.poll() is None:
+            try:
+                opener.open(f"{url}/version", timeout=1).read()
+            except OSError:
+                time.sleep(0.1)
+                continue
+            self._server, self._url, self._opener = proc, url, opener
+            return
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        self.log("pandoc server no disponible (requiere pandoc 3 o superior). Se usará un proceso pandoc por documento.")
+
+    def convert(self, mmd_content, title="Export", language="spanish"):
+        body = _pandoc_input(mmd_content)
+        variables = _pandoc_variables(title, language)
+        if self._url:
+            import urllib.error
+            try:
+                latex_code = self._convert_server(body, variables)
+                self._count("server_docs")
+                return latex_code
+            except urllib.error.HTTPError as e:
+                # Error de conversion de este documento: el servidor sigue en pie
+                detail = e.read().decode("utf-8", errors="replace").strip()
+                raise RuntimeError(f"pandoc server falló (HTTP {e.code}): {detail}") from None
+            except OSError as e:
+                self.log(f"Se perdió la conexión con pandoc server ({e}). Continuando con un proceso por documento.")
+                self._stop_server()
+        latex_code = self._convert_process(body, variables)
+        self._count("process_docs")
+        return latex_code
+
+    def _convert_server(self, body, variables):
+        import urllib.request
+        payload = {"text": body, "from": "markdown", "to": "latex", "standalone": True, "variables": variables}
+        request = urllib.request.Request(self._url, data=json.dumps(payload).encode("utf-8"),
+                                         headers={"Content-Type": "application/json", "Accept": "application/json"})
+        with self._opener.open(request, timeout=self.timeout + 5) as response:
+            result = json.loads(response.read().decode("utf-8"))
+        return result["output"]
+
+    def _convert_process(self, body, variables):
+        import subprocess
+        cmd = [self.pandoc_path, '--from=markdown', '--to=latex'] + _pandoc_args(variables)
+        result = subprocess.run(cmd, input=body, capture_output=True, text=True, encoding="utf-8",
+                                errors="replace", timeout=self.timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"pandoc falló (Código {result.returncode}): {result.stderr.strip()}")
+        return result.stdout
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _stop_server(self):
+        with self._lock:
+            proc, self._server, self._url = self._server, None, None
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except Exception:
+                proc.kill()
+
+    def report(self):
+        total = self.server_docs + self.process_docs + self.fallback_docs
+        if total:
+            self.log(f"Conversión LaTeX: {total} documentos (pandoc server {self.server_docs}, "
+                     f"proceso pandoc {self.process_docs}, respaldo regex {self.fallback_docs}).")
+
+    def close(self):
+        self._stop_server()
+
+def mmd_to_latex(mmd_content, title="Export", language="spanish", converter=None):
+    # Con `converter` se reutiliza el pandoc ya localizado (y su servidor); un fallo solo
+    # envia al conversor de respaldo a este documento.
+    log = converter.log if converter is not None else print
     try:
+        if converter is not None:
+            return converter.convert(mmd_content, title, language)
+
         import pypandoc
         try:
             pypandoc.get_pandoc_path()
@@ -120,86 +367,266 @@ def mmd_to_latex(mmd_content, title="Export", language="spanish"):
             print("Pandoc no encontrado en el sistema. Descargando versión interna...")
             pypandoc.download_pandoc()
 
-        body = mmd_content
-        body = re.sub(r'\[MISSING_PAGE_EMPTY:\d+\]', '', body)
-        body = re.sub(r'\[MISSING_PAGE_FAIL:\d+\]', '\n\n**[ERROR: Página no procesada en el original]**\n\n', body)
-
-        # Convertir delimitadores \( \) y \[ \] a $ y $$ para que Pandoc reconozca las ecuaciones
-        body = body.replace(r'\(', '$').replace(r'\)', '$')
-        body = body.replace(r'\[', '$$').replace(r'\]', '$$')
-
-        lang_map = {
-            "spanish": "es",
-            "english": "en"
-        }
-        lang_code = lang_map.get(language.lower(), language)
-
         latex_code = pypandoc.convert_text(
-            body,
+            _pandoc_input(mmd_content),
             to='latex',
             format='markdown',
-            extra_args=[
-                '--standalone',
-                '-V', f'lang={lang_code}',
-                '-V', f'title={title}',
-                '-V', 'author=Pipeline Nougat OCR',
-                '-V', 'geometry:margin=1in'
-            ]
+            extra_args=_pandoc_args(_pandoc_variables(title, language))
         )
         return latex_code
     except Exception as e:
-        print(f"Fallo en la conversión con Pandoc ({e}). Usando conversor de respaldo (Regex)...")
+        log(f"Fallo en la conversión con Pandoc ({e}). Usando conversor de respaldo (Regex)...")
+        if converter is not None:
+            converter._count("fallback_docs")
         return mmd_to_latex_fallback(mmd_content, title, language)
 
-def recover_missing_pages(pdf_path, mmd_content, language="spanish"):
-    missing_pages = re.findall(r'\[MISSING_PAGE_(EMPTY|FAIL):(\d+)\]', mmd_content)
+def _fit_scale(width, height, dpi, max_pixels=None):
+    # Escala de pdfium (1 = 72 ppp) para `dpi`, reducida si la pagina pasaria de `max_pixels`:
+    # un plano o una lamina escaneada en gran formato no se convierte en un mapa de bits enorme
+    scale = dpi / 72
+    if max_pixels and width * height * scale * scale > max_pixels:
+        scale = (max_pixels / (width * height)) ** 0.5
+    return scale
+
+def render_scale(page, dpi, max_pixels=None):
+    with PDFIUM_LOCK:
+        width, height = page.get_size()
+    return _fit_scale(width, height, dpi, max_pixels)
+
+def render_page(page, dpi, max_pixels=None, grayscale=False):
+    with PDFIUM_LOCK:
+        return page.render(scale=render_scale(page, dpi, max_pixels), grayscale=grayscale).to_pil()
+
+def _page_sizes(pdf, pg_idx):
+    # (ancho, alto) en puntos; la pagina se cierra aqui y no en un finalizador de otro hilo
+    page = pdf[pg_idx]
+    try:
+        return page.get_size()
+    finally:
+        page.close()
+
+class PageImageCache:
+    # Paginas renderizadas de un PDF, compartidas entre el reporte de auditoria y la
+    # recuperacion OCR. Acotada por memoria con expulsion LRU. Se renderiza con la resolucion
+    # del OCR; las miniaturas de la auditoria se obtienen reduciendo esas mismas imagenes.
+    def __init__(self, pdf_path, max_bytes=256 * 1024 * 1024, dpi=144, max_pixels=None, grayscale=False):
+        self.pdf_path = pdf_path
+        self.max_bytes = max_bytes
+        self.dpi = dpi
+        self.max_pixels = max_pixels
+        self.grayscale = grayscale
+        self.hits = 0
+        self.misses = 0
+        self._pdf = None
+        self._images = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        # Estado de la cache; las llamadas a pdfium toman ademas PDFIUM_LOCK (siempre en este orden)
+        self._lock = threading.Lock()
+
+    def _document(self):
+        if self._pdf is None:
+            import pypdfium2 as pdfium
+            with PDFIUM_LOCK:
+                self._pdf = pdfium.PdfDocument(str(self.pdf_path))
+        return self._pdf
+
+    def _render(self, pg_idx, dpi, max_pixels, grayscale):
+        with PDFIUM_LOCK:
+            page = self._document()[pg_idx]
+            try:
+                return render_page(page, dpi, max_pixels, grayscale)
+            finally:
+                page.close()
+
+    def __len__(self):
+        with self._lock, PDFIUM_LOCK:
+            return len(self._document())
+
+    def get(self, pg_idx):
+        with self._lock:
+            img = self._images.get(pg_idx)
+            if img is not None:
+                self._images.move_to_end(pg_idx)
+                self.hits += 1
+                return img
+            self.misses += 1
+            img = self._render(pg_idx, self.dpi, self.max_pixels, self.grayscale)
+            size = img.width * img.height * len(img.getbands())
+            self._images[pg_idx] = img
+            self._sizes[pg_idx] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._images) > 1:
+                old_idx, _ = self._images.popitem(last=False)
+                self._bytes -= self._sizes.pop(old_idx)
+            return img
+
+    def get_scaled(self, pg_idx, dpi, max_pixels=None, grayscale=False):
+        # Pagina a otra resolucion. Si la de la cache alcanza (y no hace falta el color que
+        # la cache descarto), se reduce la imagen compartida en lugar de renderizar otra vez
+        with self._lock:
+            with PDFIUM_LOCK:
+                width, height = _page_sizes(self._document(), pg_idx)
+            scale = _fit_scale(width, height, dpi, max_pixels)
+            if scale > _fit_scale(width, height, self.dpi, self.max_pixels) or (self.grayscale and not grayscale):
+                self.misses += 1
+                return self._render(pg_idx, dpi, max_pixels, grayscale)
+        img = self.get(pg_idx)
+        if grayscale and img.mode != "L":
+            img = img.convert("L")
+        # El mismo redondeo que pypdfium2 al renderizar
+        size = (math.ceil(width * scale), math.ceil(height * scale))
+        return img if img.size == size else img.resize(size, reducing_gap=3.0)
+
+    def close(self):
+        with self._lock:
+            self._images.clear()
+            self._sizes.clear()
+            self._bytes = 0
+            if self._pdf is not None:
+                with PDFIUM_LOCK:
+                    self._pdf.close()
+                self._pdf = None
+
+def _format_recovered_page(pg_num_str, ocr_text):
+    replacement = f"\n\n> [!NOTE]\n> **[PÁGINA {pg_num_str} RECUPERADA VÍA OCR TESSERACT]**\n>\n"
+    indented_text = "\n".join([f"> {line}" for line in ocr_text.split("\n")])
+    return replacement + indented_text + "\n\n"
+
+_process_pdfs = {}
+
+def _ocr_page_in_process(pdf_path, pg_idx, tess_lang, cache_root=None, tesseract_cmd=None, dpi=144, max_pixels=None,
+                         grayscale=False):
+    # Ejecutado en un proceso hijo: cada proceso abre su propia copia del PDF. Devuelve
+    # (texto, clave de cache, acierto); las escrituras en la cache las hace el proceso padre.
+    import pypdfium2 as pdfium
+    import pytesseract
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    src_pdf = _process_pdfs.get(pdf_path)
+    if src_pdf is None:
+        src_pdf = _process_pdfs[pdf_path] = pdfium.PdfDocument(pdf_path)
+    img = render_page(src_pdf[pg_idx], dpi, max_pixels, grayscale)
+    key = None
+    if cache_root is not None:
+        from result_cache import PageResultCache
+        key = PageResultCache.image_key(img, f"tesseract:{tess_lang}")
+        cached = PageResultCache.read(cache_root, key)
+        if cached is not None:
+            return cached, key, True
+    return pytesseract.image_to_string(img, lang=tess_lang).strip(), key, False
+
+def recover_missing_pages(pdf_path, mmd_content, language="spanish", workers=None, use_processes=False, page_cache=None, result_cache=None,
+                          tesseract_cmd=None, dpi=144, max_pixels=None, grayscale=False):
+    # `dpi`, `max_pixels` y `grayscale` fijan el renderizado para Tesseract; con `page_cache`
+    # manda la configuracion de la cache compartida
+    missing_pages = MISSING_PAGE_PATTERN.findall(mmd_content)
     if not missing_pages:
         return mmd_content
         
     try:
-        import pypdfium2 as pdfium
+        import pypdfium2  # Solo comprueba que este instalado: el PDF lo abre PageImageCache
         import pytesseract
     except ImportError:
         print("Aviso: 'pytesseract' o 'pypdfium2' no están disponibles. Saltando recuperación OCR.")
         return mmd_content
+    # Ruta ya resuelta por el llamador: pytesseract no vuelve a buscar el ejecutable en el PATH
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
 
     # Mapear idioma
     tess_lang = "spa+eng" if language.lower() == "spanish" else "eng"
-    
-    modified_content = mmd_content
+
+    # En modo hilos las paginas salen de la cache compartida (el renderizado pasa por
+    # PDFIUM_LOCK) y solo las llamadas a Tesseract corren en paralelo
+    own_cache = page_cache is None
+    if own_cache:
+        page_cache = PageImageCache(pdf_path, dpi=dpi, max_pixels=max_pixels, grayscale=grayscale)
+
+    def store(pg_idx, key, ocr_text):
+        # Sin espacio o sin permisos en la cache el texto reconocido se usa igual
+        try:
+            result_cache.put(key, ocr_text)
+        except OSError as e:
+            print(f"No se pudo guardar la página {pg_idx + 1} en la caché de resultados: {e}")
+
+    def ocr_page(pg_idx):
+        img = page_cache.get(pg_idx)
+        key = None
+        if result_cache is not None:
+            key = result_cache.image_key(img, f"tesseract:{tess_lang}")
+            cached = result_cache.get(key, "tesseract")
+            if cached is not None:
+                return cached
+        ocr_text = pytesseract.image_to_string(img, lang=tess_lang).strip()
+        if key is not None:
+            store(pg_idx, key, ocr_text)
+        return ocr_text
+
+    ocr_texts = {}
     try:
-        src_pdf = pdfium.PdfDocument(str(pdf_path))
-        for flag_type, pg_num_str in missing_pages:
-            pg_idx = int(pg_num_str) - 1
-            if pg_idx < 0 or pg_idx >= len(src_pdf): continue
-            
-            print(f"Recuperando página {pg_num_str} vía Tesseract OCR...")
-            page = src_pdf[pg_idx]
-            bitmap = page.render(scale=2)
-            img = bitmap.to_pil()
-            
-            try:
-                ocr_text = pytesseract.image_to_string(img, lang=tess_lang).strip()
-            except Exception as ocr_err:
-                print(f"No se pudo ejecutar Tesseract en la página {pg_num_str}: {ocr_err}")
-                ocr_text = None
-                
-            if ocr_text:
-                replacement = f"\n\n> [!NOTE]\n> **[PÁGINA {pg_num_str} RECUPERADA VÍA OCR TESSERACT]**\n>\n"
-                indented_text = "\n".join([f"> {line}" for line in ocr_text.split("\n")])
-                replacement += indented_text + "\n\n"
-                
-                target_tag = f"[MISSING_PAGE_{flag_type}:{pg_num_str}]"
-                modified_content = modified_content.replace(target_tag, replacement)
-                print(f"Página {pg_num_str} recuperada e inyectada con éxito.")
+        n_pages = len(page_cache)
+        pages = sorted({int(pg_num_str) for _, pg_num_str in missing_pages if 0 < int(pg_num_str) <= n_pages})
+        if not pages:
+            return mmd_content
+        workers = min(workers or os.cpu_count() or 1, len(pages))
+
+        if use_processes:
+            # multiprocessing se importa solo si se usa: encarece el arranque de todo el pipeline.
+            # Procesos con "spawn", no "fork": un hijo bifurcado heredaria PDFIUM_LOCK tomado por
+            # el hilo del motor o de la auditoria y se bloquearia para siempre al renderizar.
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            cache_root = str(result_cache.root) if result_cache is not None else None
+            futures = {pg: pool.submit(_ocr_page_in_process, str(pdf_path), pg - 1, tess_lang, cache_root, tesseract_cmd,
+                                       page_cache.dpi, page_cache.max_pixels, page_cache.grayscale)
+                       for pg in pages}
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+            futures = {pg: pool.submit(ocr_page, pg - 1) for pg in pages}
+
+        with pool:
+            for pg in pages:
+                print(f"Recuperando página {pg} vía Tesseract OCR...")
+                try:
+                    ocr_text = futures[pg].result()
+                    if use_processes:
+                        ocr_text, key, hit = ocr_text
+                        if key is not None:
+                            if hit:
+                                result_cache.record_hit(key, "tesseract")
+                            else:
+                                result_cache.record_miss("tesseract")
+                                store(pg - 1, key, ocr_text)
+                except Exception as ocr_err:
+                    print(f"No se pudo ejecutar Tesseract en la página {pg}: {ocr_err}")
+                    ocr_text = None
+                if ocr_text:
+                    ocr_texts[pg] = ocr_text
+                    print(f"Página {pg} recuperada e inyectada con éxito.")
     except Exception as e:
         print(f"Error en recuperación de páginas: {e}")
-        
-    return modified_content
+    finally:
+        if own_cache:
+            page_cache.close()
+
+    if not ocr_texts:
+        return mmd_content
+
+    # Sustitucion en una sola pasada sobre el documento
+    def inject(m):
+        ocr_text = ocr_texts.get(int(m.group(2)))
+        return _format_recovered_page(m.group(2), ocr_text) if ocr_text else m.group(0)
+
+    return MISSING_PAGE_PATTERN.sub(inject, mmd_content)
 
-def generate_blank_page_report(pdf_path, mmd_content, output_pdf_report):
+def generate_blank_page_report(pdf_path, mmd_content, output_pdf_report, page_cache=None, dpi=144, max_pixels=None,
+                               grayscale=False, image_format=None, quality=75):
+    # Las paginas se incrustan a `dpi` (como mucho `max_pixels`). Con image_format="JPEG" se
+    # comprimen con perdida (DCTDecode, se copian tal cual al PDF); con None, sin perdida.
     try:
-        import pypdfium2 as pdfium
+        import pypdfium2  # Solo comprueba que este instalado: el PDF lo abre PageImageCache
         from fpdf import FPDF
     except ImportError:
         print("Error: Se requiere 'fpdf2' para generar el reporte de auditoria.")
@@ -209,33 +636,28 @@ def generate_blank_page_report(pdf_path, mmd_content, output_pdf_report):
     if not missing_pages:
         return False
 
-    temp_dir = Path("temp_audit")
-    temp_dir.mkdir(exist_ok=True)
+    own_cache = page_cache is None
+    if own_cache:
+        page_cache = PageImageCache(pdf_path, dpi=dpi, max_pixels=max_pixels, grayscale=grayscale)
     try:
         pdf = FPDF()
-        src_pdf = pdfium.PdfDocument(str(pdf_path))
+        n_pages = len(page_cache)
         for pg_num_str in missing_pages:
             pg_idx = int(pg_num_str) - 1
-            if pg_idx < 0 or pg_idx >= len(src_pdf): continue
+            if pg_idx < 0 or pg_idx >= n_pages: continue
             pdf.add_page()
             pdf.set_font('Arial', 'B', 12)
             pdf.cell(0, 10, f'Evidencia de Pagina Original: {pg_num_str}', 0, 1)
-            page = src_pdf[pg_idx]
-            bitmap = page.render(scale=2)
-            img = bitmap.to_pil()
-            img_path = temp_dir / f"page_{pg_num_str}.png"
-            img.save(img_path)
-            pdf.image(str(img_path), x=10, y=30, w=190)
+            # La imagen se incrusta directamente desde memoria, sin pasar por disco
+            img = page_cache.get_scaled(pg_idx, dpi, max_pixels, grayscale)
+            if image_format:
+                encoded = io.BytesIO()
+                img.convert("L" if img.mode == "L" else "RGB").save(encoded, format=image_format, quality=quality, optimize=True)
+                img = encoded
+            pdf.image(img, x=10, y=30, w=190)
             
         pdf.output(str(output_pdf_report))
         return True
     finally:
-        for f in temp_dir.glob("*.png"):
-            try:
-                os.remove(f)
-            except Exception:
-                pass
-        try:
-            temp_dir.rmdir()
-        except Exception:
-            pass
+        if own_cache:
+            page_cache.close()
@@ -0,0 +1,114 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+
+class PageResultCache:
+    # Resultados por pagina (prediccion de Nougat, texto de Tesseract) direccionados por el
+    # contenido de la pagina rasterizada y la version del modelo. Una pagina identica en otro
+    # PDF (portadas, licencias, el mismo capitulo en otra compilacion) no se vuelve a inferir.
+    # Un archivo por entrada; al superar `max_bytes` se expulsan las menos usadas (LRU).
+    def __init__(self, root, max_bytes=512 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = {}
+        self._total = 0
+        self.stats = {}
+        self.evicted = 0
+        if self.root.exists():
+            for sub in os.scandir(self.root):
+                if not sub.is_dir():
+                    continue
+                for entry in os.scandir(sub.path):
+                    if entry.name.endswith(".txt"):
+                        st = entry.stat()
+                        self._index[entry.name[:-4]] = [st.st_size, st.st_mtime]
+                        self._total += st.st_size
+
+    @staticmethod
+    def image_key(img, namespace):
+        # `namespace` separa consumidores y versiones: "nougat:0.1.0-small", "tesseract:spa+eng"
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{namespace}|{img.mode}|{img.size[0]}x{img.size[1]}|".encode("utf-8"))
+        digest.update(img.tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def path_for(root, key):
+        return Path(root) / key[:2] / f"{key}.txt"
+
+    @staticmethod
+    def read(root, key):
+        # Solo lectura, sin indice: la usan tambien los procesos hijos del OCR
+        try:
+            return PageResultCache.path_for(root, key).read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def _count(self, namespace, hit):
+        with self._lock:
+            hits, misses = self.stats.get(namespace, (0, 0))
+            self.stats[namespace] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def get(self, key, namespace):
+        text = self.read(self.root, key)
+        self._count(namespace, text is not None)
+        if text is not None:
+            now = time.time()
+            with self._lock:
+                if key in self._index:
+                    self._index[key][1] = now
+            try:
+                os.utime(self.path_for(self.root, key), (now, now))
+            except OSError:
+                pass
+        return text
+
+    def record_hit(self, key, namespace):
+        # Acierto resuelto fuera de este proceso (OCR en procesos hijos)
+        self._count(namespace, True)
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = time.time()
+
+    def record_miss(self, namespace):
+        self._count(namespace, False)
+
+    def put(self, key, text):
+        path = self.path_for(self.root, key)
+        data = text.encode("utf-8")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Nombre temporal unico tambien entre procesos y nodos que comparten la cache
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            old = self._index.get(key)
+            if old:
+                self._total -= old[0]
+            self._index[key] = [len(data), time.time()]
+            self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Se baja hasta el 90% del limite para no expulsar en cada escritura
+        target = self.max_bytes * 0.9
+        for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total <= target:
+                break
+            try:
+                self.path_for(self.root, key).unlink()
+            except OSError:
+                pass
+            del self._index[key]
+            self._total -= size
+            self.evicted += 1
+
+    def summary(self):
+        parts = [f"{ns} {hits} aciertos / {misses} fallos" for ns, (hits, misses) in sorted(self.stats.items())]
+        return (f"Caché de resultados por página: {', '.join(parts) or 'sin consultas'}; "
+                f"{len(self._index)} entradas, {self._total / 1024 / 1024:.1f} MB, {self.evicted} expulsadas.")
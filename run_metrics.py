@@ -0,0 +1,145 @@
+import sys
+import json
+import time
+import threading
+import datetime
+from pathlib import Path
+
+COUNT_FIELDS = ("pages", "missing_pages", "recovered_pages", "equations", "sections") # Contadores que las etapas dejan en doc["counts"]
+
+def peak_rss_mb():
+    # Maximo de memoria residente del proceso hasta ahora (no por etapa: es el pico acumulado)
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa KB; macOS, bytes
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 / 1024
+    except ImportError:
+        return None
+
+def children_cpu_seconds():
+    # CPU de procesos hijos ya terminados (CLI de Nougat, OCR en procesos); no existe en Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class RunMetrics:
+    # Una linea JSON por documento y etapa en `<dir>/run-<fecha>.jsonl`: tiempo de pared, CPU del
+    # hilo de la etapa, pico de RSS del proceso y contadores. Con `profile_stage`, cada llamada a
+    # esa etapa se perfila con cProfile y se vuelca un .prof acumulado al cerrar.
+    def __init__(self, directory, profile_stage=None, worker=None, log=print):
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        # Con varios nodos sobre la misma carpeta, cada uno escribe su propio archivo
+        if worker:
+            self.run_id += f"-{worker}"
+        self.path = Path(directory) / f"run-{self.run_id}.jsonl"
+        self.profile_stage = profile_stage
+        self.log = log
+        self.rows = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._profile_stats = None
+        # cProfile no admite dos perfiladores activos a la vez: las llamadas perfiladas se serializan
+        self._profile_lock = threading.Lock()
+        self._started = time.time()
+        self._cpu_started = time.process_time()
+        self._children_started = children_cpu_seconds()
+
+    def record(self, stage, doc, wall, cpu, ok=True, counts=None):
+        rss = peak_rss_mb()
+        row = {
+            "run": self.run_id,
+            "stage": stage,
+            "doc": doc["pdf_path"].name if isinstance(doc, dict) and "pdf_path" in doc else doc,
+            "ok": ok,
+            "wall_s": round(wall, 4),
+            "cpu_s": round(cpu, 4),
+            "peak_rss_mb": round(rss, 1) if rss is not None else None,
+        }
+        if counts is None and isinstance(doc, dict):
+            counts = doc.pop("counts", None)
+        row.update(counts or {})
+        line = json.dumps(row, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.rows.append(row)
+            try:
+                if self._file is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line)
+                self._file.flush()
+            except OSError as e:
+                self.log(f"No se pudieron escribir las métricas en {self.path}: {e}")
+
+    def profiled(self, stage, func):
+        if stage != self.profile_stage:
+            return func
+        import cProfile
+        import pstats
+
+        def wrapper(*args, **kwargs):
+            with self._profile_lock:
+                profiler = cProfile.Profile()
+                try:
+                    return profiler.runcall(func, *args, **kwargs)
+                finally:
+                    if self._profile_stats is None:
+                        self._profile_stats = pstats.Stats(profiler)
+                    else:
+                        self._profile_stats.add(profiler)
+        return wrapper
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self._profile_stats is not None:
+            prof_path = self.path.with_name(f"run-{self.run_id}-{self.profile_stage}.prof")
+            self._profile_stats.dump_stats(str(prof_path))
+            self.log(f"Perfil de la etapa {self.profile_stage} guardado en {prof_path} (ver con `python -m pstats`).")
+
+    def report(self):
+        if not self.rows:
+            return
+        stages = []
+        totals = {}
+        for row in self.rows:
+            if row["stage"] not in totals:
+                stages.append(row["stage"])
+                totals[row["stage"]] = {"docs": 0, "fallos": 0, "wall": 0.0, "cpu": 0.0, "rss": 0.0, "slowest": None,
+                                        **{field: 0 for field in COUNT_FIELDS}}
+            total = totals[row["stage"]]
+            total["docs"] += 1
+            total["fallos"] += 0 if row["ok"] else 1
+            total["wall"] += row["wall_s"]
+            total["cpu"] += row["cpu_s"]
+            total["rss"] = max(total["rss"], row["peak_rss_mb"] or 0.0)
+            for field in COUNT_FIELDS:
+                total[field] += row.get(field) or 0
+            if row["doc"] and (total["slowest"] is None or row["wall_s"] > total["slowest"][1]):
+                total["slowest"] = (row["doc"], row["wall_s"])
+
+        self.log(f"Métricas por etapa (detalle por documento en {self.path}):")
+        self.log(f"  {'etapa':<10} {'docs':>5} {'fallos':>6} {'pared':>9} {'CPU':>9} {'RSS pico':>9} {'págs':>6} "
+                 f"{'vacías':>6} {'recup.':>6} {'ecuac.':>7} {'secc.':>6}  más lento")
+        for stage in stages:
+            t = totals[stage]
+            slowest = f"{t['slowest'][0]} ({t['slowest'][1]:.1f}s)" if t["slowest"] else "-"
+            self.log(f"  {stage:<10} {t['docs']:>5} {t['fallos']:>6} {t['wall']:>8.1f}s {t['cpu']:>8.1f}s {t['rss']:>6.0f} MB "
+                     f"{t['pages']:>6} {t['missing_pages']:>6} {t['recovered_pages']:>6} {t['equations']:>7} {t['sections']:>6}  {slowest}")
+        cpu = time.process_time() - self._cpu_started
+        line = f"  Proceso: {time.time() - self._started:.1f}s de pared, {cpu:.1f}s de CPU en todos los hilos"
+        children = children_cpu_seconds()
+        if children is not None and self._children_started is not None:
+            line += f", {children - self._children_started:.1f}s de CPU en procesos hijos"
+        self.log(line + ".")
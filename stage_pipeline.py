@@ -0,0 +1,137 @@
+import time
+import queue
+import threading
+
+_STOP = object()
+
+class Stage:
+    def __init__(self, name, func, workers=1, queue_size=2):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        # Cola acotada de entrada: si la etapa se atrasa, la anterior se bloquea (contrapresion)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        self.queue.put(item)
+        depth = self.queue.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._depth_samples += 1
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.busy_seconds += seconds
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+
+    def mean_depth(self):
+        return self._depth_total / self._depth_samples if self._depth_samples else 0.0
+
+class StagePipeline:
+    def __init__(self, stages, on_done=None, on_error=None, report_interval=None, metrics=None, log=print):
+        self.stages = stages
+        # Objeto con record(etapa, item, pared, cpu, ok): recibe una medicion por item y etapa
+        self.metrics = metrics
+        self.on_done = on_done
+        self.on_error = on_error
+        self.report_interval = report_interval
+        self.log = log
+        self._threads = []
+        self._started = None
+        self._finished = threading.Event()
+
+    def start(self):
+        self._started = time.time()
+        for idx, stage in enumerate(self.stages):
+            workers = []
+            for n in range(stage.workers):
+                t = threading.Thread(target=self._run_stage, args=(idx,), name=f"etapa-{stage.name}-{n}", daemon=True)
+                t.start()
+                workers.append(t)
+            self._threads.append(workers)
+        if self.report_interval:
+            threading.Thread(target=self._monitor, name="etapas-monitor", daemon=True).start()
+        return self
+
+    def submit(self, item):
+        self.stages[0].put(item)
+
+    def wait_for_room(self, interval=0.2):
+        # Espera a que la primera etapa vacie su cola: el proximo documento entraria sin esperar
+        while self.stages[0].queue.qsize() > 0:
+            time.sleep(interval)
+
+    def close(self):
+        # Se detiene cada etapa solo cuando la anterior termino, para no perder documentos en transito
+        for stage, workers in zip(self.stages, self._threads):
+            for _ in workers:
+                stage.queue.put(_STOP)
+            for t in workers:
+                t.join()
+        self._finished.set()
+
+    def _run_stage(self, idx):
+        stage = self.stages[idx]
+        next_stage = self.stages[idx + 1] if idx + 1 < len(self.stages) else None
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+            t0 = time.time()
+            c0 = time.thread_time()
+            try:
+                stage.func(item)
+            except Exception as e:
+                stage.record(time.time() - t0, ok=False)
+                self._measure(stage, item, t0, c0, ok=False)
+                self._callback(self.on_error, item, stage.name, e)
+                continue
+            stage.record(time.time() - t0, ok=True)
+            self._measure(stage, item, t0, c0, ok=True)
+            if next_stage is not None:
+                next_stage.put(item)
+            else:
+                self._callback(self.on_done, item)
+
+    def _measure(self, stage, item, t0, c0, ok):
+        if self.metrics is None:
+            return
+        try:
+            self.metrics.record(stage.name, item, time.time() - t0, time.thread_time() - c0, ok=ok)
+        except Exception as e:
+            self.log(f"Error al registrar métricas de la etapa {stage.name}: {e}")
+
+    def _callback(self, func, *args):
+        if func is None:
+            return
+        try:
+            func(*args)
+        except Exception as e:
+            self.log(f"Error en callback del pipeline: {e}")
+
+    def _monitor(self):
+        while not self._finished.wait(self.report_interval):
+            depths = ", ".join(f"{s.name}={s.queue.qsize()}" for s in self.stages)
+            self.log(f"Colas del pipeline: {depths}")
+
+    def report(self):
+        elapsed = time.time() - self._started if self._started else 0.0
+        self.log(f"Resumen del pipeline por etapas ({elapsed:.1f}s):")
+        for stage in self.stages:
+            util = stage.busy_seconds / (elapsed * stage.workers) if elapsed > 0 else 0.0
+            self.log(f"  {stage.name:<10} docs={stage.processed} fallos={stage.failed} "
+                     f"ocupada={stage.busy_seconds:.1f}s ({util:.0%} de {stage.workers} hilo(s)) "
+                     f"cola máx={stage.max_depth} media={stage.mean_depth():.1f}")
+        bottleneck = max(self.stages, key=lambda s: s.busy_seconds / s.workers)
+        self.log(f"  Cuello de botella probable: {bottleneck.name}")
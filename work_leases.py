@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import uuid
+import socket
+import threading
+import datetime
+from pathlib import Path
+
+def default_worker_id():
+    # Unico por proceso: varios procesos en la misma maquina son nodos distintos
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def _lock_fd(fd):
+    os.lseek(fd, 0, os.SEEK_SET)
+    if sys.platform == "win32":
+        import msvcrt
+        while True:
+            try:
+                # LK_LOCK reintenta durante ~10 s antes de fallar: se sigue esperando
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    else:
+        import fcntl
+        # Candados POSIX (lockf): a diferencia de flock, tambien funcionan sobre NFS
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+
+def _unlock_fd(fd):
+    os.lseek(fd, 0, os.SEEK_SET)
+    if sys.platform == "win32":
+        import msvcrt
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+
+class FileLock:
+    # Candado exclusivo entre procesos (y maquinas, en una carpeta compartida) sobre un archivo
+    # auxiliar. Lo libera el sistema operativo si el proceso muere, asi que no quedan candados
+    # huerfanos. Los candados del sistema son por proceso: los hilos se serializan aparte.
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._local.acquire()
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                _lock_fd(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+        except BaseException:
+            self._local.release()
+            raise
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc):
+        fd, self._fd = self._fd, None
+        try:
+            _unlock_fd(fd)
+        finally:
+            os.close(fd)
+            self._local.release()
+
+class LeaseManager:
+    # Reparto de documentos entre varios nodos que comparten input/ y checkpoint/. Un documento
+    # se reclama creando `<dir>/<clave>.lease` en forma exclusiva (O_EXCL, atomico tambien en
+    # NFS y SMB); el dueño renueva su mtime cada `heartbeat` segundos y lo borra al terminar.
+    # Un lease sin renovar durante `lease_seconds` es de un nodo caido y otro nodo puede tomarlo.
+    # La antiguedad se mide contra el reloj del servidor de archivos (el mtime de un archivo
+    # propio recien tocado), no contra el reloj local, para tolerar relojes desfasados.
+    def __init__(self, directory, worker_id=None, lease_seconds=600, heartbeat=30, log=print):
+        self.directory = Path(directory)
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat = heartbeat
+        self.log = log
+        self.claimed = 0
+        self.taken_over = 0
+        self.contended = 0
+        self.lost = 0
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._clock_path = self.directory / f".clock-{self.worker_id}"
+        # Serializa la toma de leases vencidos entre todos los nodos (ocurre muy pocas veces)
+        self._takeover_lock = FileLock(self.directory / ".takeover.lock")
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._renew, name="leases-heartbeat", daemon=True)
+        self._thread.start()
+        self.log(f"Modo coordinado: nodo {self.worker_id}, leases en {self.directory} "
+                 f"(vencen a los {self.lease_seconds:g}s sin renovación, renovación cada {self.heartbeat:g}s).")
+        return self
+
+    def _path(self, key):
+        return self.directory / f"{key}.lease"
+
+    @staticmethod
+    def _read(path):
+        try:
+            return json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _shared_now(self):
+        with open(self._clock_path, "a"):
+            pass
+        os.utime(self._clock_path)
+        return os.stat(self._clock_path).st_mtime
+
+    def _age(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        return self._shared_now() - mtime
+
+    def _create(self, key, name):
+        token = uuid.uuid4().hex
+        fd = os.open(self._path(key), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"worker": self.worker_id, "token": token, "name": name,
+                       "claimed_at": str(datetime.datetime.now())}, f, ensure_ascii=False)
+        with self._lock:
+            self._held[key] = token
+            self.claimed += 1
+
+    def claim(self, key, name=""):
+        # True si este nodo queda a cargo del documento
+        path = self._path(key)
+        try:
+            self._create(key, name)
+            return True
+        except FileExistsError:
+            pass
+        age = self._age(path)
+        if age is not None and age < self.lease_seconds:
+            with self._lock:
+                self.contended += 1
+            return False
+        with self._takeover_lock:
+            # Otro nodo pudo tomarlo o renovarlo mientras se esperaba el candado
+            age = self._age(path)
+            if age is not None and age < self.lease_seconds:
+                with self._lock:
+                    self.contended += 1
+                return False
+            previous = self._read(path) or {}
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            try:
+                self._create(key, name)
+            except FileExistsError:
+                return False
+        if age is not None:
+            with self._lock:
+                self.taken_over += 1
+            self.log(f"Lease vencido de {name or key} (nodo {previous.get('worker', '?')}, sin renovar hace {age:.0f}s): "
+                     f"lo retoma este nodo.")
+        return True
+
+    def holds(self, key):
+        with self._lock:
+            return key in self._held
+
+    def release(self, key):
+        with self._lock:
+            token = self._held.pop(key, None)
+        if token is None:
+            return
+        path = self._path(key)
+        # Solo se borra si sigue siendo propio: tras vencer pudo tomarlo otro nodo
+        if (self._read(path) or {}).get("token") == token:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _renew(self):
+        while not self._stop.wait(self.heartbeat):
+            with self._lock:
+                held = dict(self._held)
+            for key, token in held.items():
+                path = self._path(key)
+                lease = self._read(path)
+                if lease is None or lease.get("token") != token:
+                    with self._lock:
+                        if self._held.get(key) != token:
+                            continue
+                        del self._held[key]
+                        self.lost += 1
+                    self.log(f"ADVERTENCIA: se perdió el lease de {lease.get('name', key) if lease else key} "
+                             f"(venció y lo tomó {lease.get('worker', 'otro nodo') if lease else 'otro nodo'}). "
+                             f"El documento puede procesarse dos veces.")
+                    continue
+                try:
+                    os.utime(path)
+                except OSError as e:
+                    self.log(f"No se pudo renovar el lease {path.name}: {e}")
+
+    def summary(self):
+        line = f"Leases del nodo {self.worker_id}: {self.claimed} documentos reclamados"
+        if self.taken_over:
+            line += f" ({self.taken_over} retomados de nodos caídos)"
+        line += f", {self.contended} intentos sobre documentos en curso en otros nodos"
+        if self.lost:
+            line += f", {self.lost} leases perdidos"
+        return line + "."
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            keys = list(self._held)
+        for key in keys:
+            self.release(key)
+        try:
+            os.remove(self._clock_path)
+        except OSError:
+            pass